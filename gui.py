@@ -20,21 +20,7 @@ try:
     from tabs.video_tab import SynthesizeVideoTab
     from tabs.linly_talker_tab import LinlyTalkerTab
 
-    # 尝试导入实际的功能模块
-    try:
-        from tools.step000_video_downloader import download_from_url
-        from tools.step010_demucs_vr import separate_all_audio_under_folder
-        from tools.step020_asr import transcribe_all_audio_under_folder
-        from tools.step030_translation import translate_all_transcript_under_folder
-        from tools.step040_tts import generate_all_wavs_under_folder
-        from tools.step050_synthesize_video import synthesize_all_video_under_folder
-        from tools.do_everything import do_everything
-        from tools.utils import SUPPORT_VOICE
-    except ImportError as e:
-        print(f"警告: 无法导入一些工具模块: {e}")
-        # 定义临时的支持语音列表
-        SUPPORT_VOICE = ['zh-CN-XiaoxiaoNeural', 'zh-CN-YunxiNeural',
-                         'en-US-JennyNeural', 'ja-JP-NanamiNeural']
+    # 各步骤的功能模块由标签页在第一次调用时导入（见 tools/lazy.py），启动时不加载 torch 等重依赖
 
 except ImportError as e:
     print(f"错误: 初始化应用程序失败: {e}")
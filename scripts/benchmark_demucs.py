@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+人声分离质量档位基准测试
+
+对 submodules/demucs/test.mp3 依次运行各个档位，统计：
+- 模型加载耗时（只在切换模型时发生）
+- RTF（分离耗时 / 音频时长，越小越快）
+- 人声 SDR：默认以 max 档位的人声作为参考（相对 SDR），
+  也可以用 --reference 指定真实的人声音轨
+- 推理后端对比（--backends fp32 int8）：每个后端的 RTF，以及与 fp32 相比的精度；
+  精度不达标时以非零状态码退出，可作为 CPU 节点启用 int8 前的检查
+
+用法: python scripts/benchmark_demucs.py [--device auto] [--profiles max balanced fast]
+      python scripts/benchmark_demucs.py --device cpu --profiles balanced --backends fp32 int8
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch  # noqa: E402
+
+from demucs.api import BACKENDS  # noqa: E402
+
+from tools.step010_demucs_vr import SEPARATION_PROFILES, get_service, release_model, resolve_profile  # noqa: E402
+
+DEFAULT_AUDIO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'submodules', 'demucs', 'test.mp3')
+
+
+def sdr(reference, estimate):
+    length = min(reference.shape[-1], estimate.shape[-1])
+    reference, estimate = reference[..., :length], estimate[..., :length]
+    noise = ((reference - estimate) ** 2).sum()
+    return float(10 * torch.log10((reference ** 2).sum() / (noise + 1e-8) + 1e-8))
+
+
+def load_reference(path, samplerate):
+    import torchaudio
+    from demucs.audio import convert_audio
+    wav, sr = torchaudio.load(path)
+    return convert_audio(wav, sr, samplerate, wav.shape[0])
+
+
+def run(audio_path, profiles, device, backends, reference_path=None, max_sdr_drop=0.2, min_fidelity=25.):
+    reference = None
+    fp32_results = {}
+    failures = []
+    print(f'{"backend":>7} {"profile":>9} {"model":>12} {"shifts":>6} {"load(s)":>8} {"sep(s)":>8} {"RTF":>6} '
+          f'{"SDR(dB)":>8} {"vs fp32":>8} {"ΔSDR":>6}')
+    for backend in backends:
+        for profile in profiles:
+            model_name, options = resolve_profile(profile)
+            t_start = time.time()
+            service = get_service(model_name, device, backend=backend)
+            t_load = time.time() - t_start
+
+            t_start = time.time()
+            wav, stems = service.separate(audio_path, **options)
+            t_separate = time.time() - t_start
+            duration = wav.shape[-1] / service.samplerate
+            vocals = stems['vocals'].cpu()
+
+            if reference is None:
+                reference = load_reference(reference_path, service.samplerate) if reference_path else vocals
+            score = sdr(reference, vocals)
+            fidelity, delta = '', ''
+            if backend == 'fp32':
+                fp32_results[profile] = (vocals, score)
+            elif profile in fp32_results:
+                fp32_vocals, fp32_score = fp32_results[profile]
+                fidelity = sdr(fp32_vocals, vocals)
+                # 有真实人声时比较绝对 SDR 的变化，否则以与 fp32 输出的一致程度作为门槛
+                if reference_path:
+                    delta = score - fp32_score
+                    if delta < -max_sdr_drop:
+                        failures.append(f'{backend}/{profile}: SDR 下降 {-delta:.2f} dB > {max_sdr_drop} dB')
+                elif fidelity < min_fidelity:
+                    failures.append(f'{backend}/{profile}: 与 fp32 的 SDR 仅 {fidelity:.2f} dB < {min_fidelity} dB')
+                fidelity = f'{fidelity:.2f}'
+                delta = f'{delta:+.2f}' if delta != '' else ''
+            print(f'{backend:>7} {profile:>9} {model_name:>12} {options["shifts"]:>6} {t_load:>8.2f} '
+                  f'{t_separate:>8.2f} {t_separate / duration:>6.3f} {score:>8.2f} {fidelity:>8} {delta:>6}')
+    release_model()
+    if not reference_path:
+        print(f'SDR 以 {backends[0]} 后端 {profiles[0]} 档位的人声为参考')
+    for failure in failures:
+        print(f'精度检查未通过: {failure}')
+    return not failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--audio', default=DEFAULT_AUDIO)
+    parser.add_argument('--device', default='auto', help='fp32 后端使用的设备，int8 后端固定使用 CPU')
+    parser.add_argument('--profiles', nargs='+', default=['max', 'balanced', 'fast'],
+                        choices=list(SEPARATION_PROFILES))
+    parser.add_argument('--backends', nargs='+', default=['fp32'], choices=BACKENDS,
+                        help='要对比的推理后端，fp32 需放在最前面作为基准')
+    parser.add_argument('--reference', default=None, help='真实人声音轨，用于计算绝对 SDR')
+    parser.add_argument('--max-sdr-drop', type=float, default=0.2,
+                        help='有 --reference 时，相对 fp32 允许的最大 SDR 下降（dB）')
+    parser.add_argument('--min-fidelity', type=float, default=25.,
+                        help='没有 --reference 时，与 fp32 输出之间要求的最小 SDR（dB）')
+    args = parser.parse_args()
+    ok = run(args.audio, args.profiles, args.device, args.backends, args.reference,
+             args.max_sdr_drop, args.min_fidelity)
+    sys.exit(0 if ok else 1)
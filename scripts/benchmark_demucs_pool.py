@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+多进程人声分离吞吐量基准测试
+
+把 submodules/demucs/test.mp3 复制为 --tracks 个任务，分别用 K 个工作进程（每个进程 核数/K 个线程）
+并行分离，统计总吞吐量（音频小时 / 小时，即总音频时长 / 墙钟时间）。理想情况下吞吐量随 K 线性增长，
+直到内存带宽或核数成为瓶颈。
+
+用法: python scripts/benchmark_demucs_pool.py [--workers 1 2 4 8] [--tracks 16] [--profile fast]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.step010_demucs_vr import DemucsProcessPool, SEPARATION_PROFILES, audio_duration, resolve_profile  # noqa: E402
+
+DEFAULT_AUDIO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'submodules', 'demucs', 'test.mp3')
+
+
+def run(audio_path, workers_list, tracks, profile):
+    model_name, options = resolve_profile(profile)
+    duration = audio_duration(audio_path)
+    print(f'{os.cpu_count()} 核, {tracks} 个任务 x {duration:.1f}s, 档位 {profile} ({model_name})')
+    print(f'{"workers":>7} {"threads":>7} {"wall(s)":>8} {"audio-h/h":>10} {"speedup":>8}')
+    baseline = None
+    for workers in workers_list:
+        pool = DemucsProcessPool(model_name, workers, options['shifts'])
+        with tempfile.TemporaryDirectory() as folder:
+            inputs = []
+            for i in range(tracks):
+                path = os.path.join(folder, f'{i}.mp3')
+                shutil.copy(audio_path, path)
+                inputs.append(path)
+            t_start = time.time()
+            futures = [pool.submit(path, path + '.vocals.wav', path + '.instruments.wav', **options)
+                       for path in inputs]
+            for future in futures:
+                future.result()
+            wall = time.time() - t_start
+        pool.close()
+        throughput = tracks * duration / wall
+        baseline = baseline or throughput
+        print(f'{workers:>7} {pool.threads:>7} {wall:>8.2f} {throughput:>10.2f} {throughput / baseline:>8.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--audio', default=DEFAULT_AUDIO)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--tracks', type=int, default=16)
+    parser.add_argument('--profile', default='fast', choices=list(SEPARATION_PROFILES))
+    args = parser.parse_args()
+    run(args.audio, args.workers, args.tracks, args.profile)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+语音活动扫描（DEMUCS_SKIP_NON_SPEECH）检查
+
+合成一段典型的配音素材：纯音乐片头（钢琴和弦 + 贝斯 / 和弦 / 鼓组的伴奏）、
+人声叠加背景音乐、无人声的空镜配乐、再一段人声和片尾音乐，统计：
+- 跳过比例：find_speech_spans 没有覆盖的音频占比，以及理想值（纯音乐部分的占比）
+- 人声召回：人声所在的采样被区间覆盖的比例，必须为 100%，否则以非零状态码退出
+人声默认使用 tools/ 下的 Cinecast 测试音频，也可以用 --speech 指定其他文件。
+
+用法: python scripts/benchmark_speech_scan.py [--snr 0] [--speech a.wav b.mp3]
+"""
+import argparse
+import glob
+import math
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import librosa  # noqa: E402
+import torch  # noqa: E402
+
+from tools.speech_scan import find_speech_spans, skipped_fraction  # noqa: E402
+
+SAMPLE_RATE = 44100
+DEFAULT_SPEECH = sorted(glob.glob(os.path.join(ROOT, 'tools', 'test_*.mp3')))
+# 和弦进行 C - Am - F - G，每个和弦 2 秒
+CHORDS = [[261.6, 329.6, 392.0], [220.0, 261.6, 329.6], [174.6, 220.0, 261.6], [196.0, 246.9, 293.7]]
+BASS = [65.4, 55.0, 43.6, 49.0]
+
+
+def seconds(duration):
+    return torch.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+
+
+def tone(frequency, duration, decay, harmonics=8):
+    t = seconds(duration)
+    wav = sum(0.6 ** k * torch.sin(2 * math.pi * frequency * (k + 1) * t) for k in range(harmonics))
+    return wav * torch.exp(-t * decay)
+
+
+def place(out, wav, start):
+    begin = int(start * SAMPLE_RATE)
+    end = min(out.shape[-1], begin + wav.shape[-1])
+    out[begin:end] += wav[:end - begin]
+
+
+def normalize(wav, peak):
+    return wav / wav.abs().max() * peak
+
+
+def piano(duration, decay=0.8):
+    out = torch.zeros(int(duration * SAMPLE_RATE))
+    for i in range(math.ceil(duration / 2)):
+        place(out, sum(tone(f, 2.0, decay) for f in CHORDS[i % 4]), 2.0 * i)
+    return normalize(out, 0.5)
+
+
+def band(duration, bpm=120):
+    """贝斯 + 和弦 + 踩镲 + 底鼓 + 军鼓"""
+    generator = torch.Generator().manual_seed(0)
+    beat = 60 / bpm
+    n = int(duration * SAMPLE_RATE)
+    bass, hats, kick, snare = (torch.zeros(n) for _ in range(4))
+    t = seconds(0.15)
+    for i in range(math.ceil(duration / beat)):
+        place(bass, tone(BASS[int(i * beat // 2) % 4], beat, 3, 4), i * beat)
+        place(kick, torch.sin(2 * math.pi * (50 + 80 * torch.exp(-t * 30)) * t) * torch.exp(-t * 20), i * beat)
+        if i % 2:
+            noise = torch.randn(t.shape[-1], generator=generator)
+            place(snare, 0.5 * noise * torch.exp(-t * 25) + torch.sin(2 * math.pi * 200 * t) * torch.exp(-t * 30),
+                  i * beat)
+        for half in (0, beat / 2):
+            noise = torch.randn(int(0.05 * SAMPLE_RATE), generator=generator)
+            place(hats, torch.diff(noise, prepend=noise[:1]) * torch.exp(-seconds(0.05) * 80), i * beat + half)
+    mix = (0.5 * piano(duration, decay=0.3) + normalize(bass, 0.4) + normalize(hats, 0.15)
+           + normalize(kick, 0.5) + normalize(snare, 0.4))
+    return normalize(mix, 0.6)
+
+
+def speech(paths, gap=0.4):
+    parts = []
+    for path in paths:
+        wav, _ = librosa.load(path, sr=SAMPLE_RATE, mono=True)
+        parts += [torch.from_numpy(wav), torch.zeros(int(gap * SAMPLE_RATE))]
+    return torch.cat(parts)
+
+
+def with_music(voice, snr):
+    """人声叠加背景音乐，snr 为人声与音乐的能量比（dB）"""
+    music = band(voice.shape[-1] / SAMPLE_RATE)
+    music = music / music.pow(2).mean().sqrt() * voice.pow(2).mean().sqrt() / 10 ** (snr / 20)
+    return voice + music
+
+
+def build_sample(paths, snr):
+    """返回 (混音, 人声掩码, 纯音乐时长占比)"""
+    voice = speech(paths)
+    pieces = [
+        (piano(15), False),  # 钢琴片头
+        (band(15), False),  # 伴奏片头
+        (with_music(voice, snr), True),
+        (band(20), False),  # 无人声的空镜
+        (with_music(voice, snr), True),
+        (piano(10), False),  # 片尾
+    ]
+    mix = torch.cat([wav for wav, _ in pieces])
+    # 人声掩码：人声片段中能量高于 -40 dBFS 的 10 ms 帧
+    hop = SAMPLE_RATE // 100
+    masks = []
+    for wav, has_voice in pieces:
+        mask = torch.zeros(wav.shape[-1], dtype=torch.bool)
+        if has_voice:
+            frames = voice[:wav.shape[-1] // hop * hop].view(-1, hop)
+            mask[:frames.shape[0] * hop] = (10 * torch.log10(frames.pow(2).mean(-1) + 1e-10) > -40).repeat_interleave(hop)
+        masks.append(mask)
+    music_only = sum(wav.shape[-1] for wav, has_voice in pieces if not has_voice) / mix.shape[-1]
+    return torch.stack([mix, mix]), torch.cat(masks), music_only
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--speech', nargs='+', default=DEFAULT_SPEECH)
+    parser.add_argument('--snr', type=float, nargs='+', default=[6, 0, -6])
+    args = parser.parse_args()
+
+    failed = False
+    for snr in args.snr:
+        wav, voiced, music_only = build_sample(args.speech, snr)
+        t_start = time.time()
+        spans = find_speech_spans(wav, SAMPLE_RATE)
+        elapsed = time.time() - t_start
+        covered = torch.zeros(wav.shape[-1], dtype=torch.bool)
+        for start, end in spans:
+            covered[start:end] = True
+        recall = float(covered[voiced].float().mean())
+        failed |= recall < 1
+        print(f'SNR {snr:+.0f} dB: 时长 {wav.shape[-1] / SAMPLE_RATE:.0f}s, 扫描耗时 {elapsed:.2f}s, '
+              f'{len(spans)} 个区间, 跳过 {skipped_fraction(spans, wav.shape[-1]):.1%}（纯音乐 {music_only:.1%}）, '
+              f'人声召回 {recall:.1%}')
+    sys.exit(1 if failed else 0)
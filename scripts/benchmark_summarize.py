@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+分层总结（map-reduce）基准测试
+
+使用带固定延迟的桩 LLM 替换真实接口，统计不同转写长度下的调用次数和耗时，
+并验证第二次运行会命中片段总结缓存。
+
+用法: python scripts/benchmark_summarize.py [--latency 0.2] [--minutes 10 30 60 120]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tools.step030_translation as translation  # noqa: E402
+
+# 语速约 150 词/分钟，每行约 12 词
+WORDS_PER_MINUTE = 150
+WORDS_PER_LINE = 12
+
+
+class StubLLM:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, method, messages, usage=None, stage='translate'):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        if 'JSON' in messages[0]['content']:
+            response = json.dumps({'title': 'Benchmark', 'summary': 'A summary of the whole video.'})
+        else:
+            response = 'This part of the video talks about several topics in detail.'
+        if usage is not None:
+            usage.record(stage, messages, response)
+        return response
+
+
+def make_transcript(minutes):
+    words = minutes * WORDS_PER_MINUTE
+    lines = []
+    for i in range(words // WORDS_PER_LINE):
+        lines.append({'text': ' '.join(f'word{(i * WORDS_PER_LINE + j) % 997}' for j in range(WORDS_PER_LINE))})
+    return lines
+
+
+def run(minutes_list, latency):
+    info = {'title': 'Benchmark video', 'uploader': 'bench', 'tags': []}
+    stub = StubLLM(latency)
+    translation.chat_response = stub
+    print(f'{"minutes":>8} {"lines":>7} {"run":>6} {"calls":>6} {"seconds":>8}')
+    for minutes in minutes_list:
+        transcript = make_transcript(minutes)
+        with tempfile.TemporaryDirectory() as folder:
+            cache_path = os.path.join(folder, 'summary_chunks.json')
+            for run_name in ['cold', 'cached']:
+                stub.calls = 0
+                t_start = time.time()
+                translation.summarize(info, transcript, 'English', method='OpenAI', cache_path=cache_path)
+                elapsed = time.time() - t_start
+                print(f'{minutes:>8} {len(transcript):>7} {run_name:>6} {stub.calls:>6} {elapsed:>8.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=0.2, help='桩 LLM 每次调用的延迟（秒）')
+    parser.add_argument('--minutes', type=int, nargs='+', default=[10, 30, 60, 120])
+    args = parser.parse_args()
+    run(args.minutes, args.latency)
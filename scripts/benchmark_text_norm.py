@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+中文文本规范化基准测试与等价性检查
+
+在随机生成的中英混合语料上对比 cn_tx.TextNorm 与 cn_tx.CompiledTextNorm：
+- 等价性：逐行比较输出，不一致时打印差异，并以非零状态码退出
+- 性能：分别统计首次处理和命中缓存时的耗时
+
+TextNorm 用 str.replace 替换整串中第一次出现的相同子串，而不是匹配到的位置；
+当一个数字串在同一行的其他位置（包括其他数字内部）也出现时，两者输出可能不同，
+这类行属于已知差异，只统计不计入失败。
+
+用法: python scripts/benchmark_text_norm.py [--lines 5000] [--seed 0]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.cn_tx import TextNorm, CompiledTextNorm  # noqa: E402
+
+PLAIN = ['今天我们来聊一聊人工智能', '这个模型的效果非常好', '大家好，欢迎来到我的频道', '他女儿在那边儿玩',
+         '我们下次再见', '这是一个非常重要的问题', 'P2P和B2C的商业模式', '小孩儿在院子里', '你觉得呢？']
+
+
+def random_piece(rng):
+    kind = rng.randrange(12)
+    if kind == 0:
+        return f'{rng.choice([1998, 2008, 2020, 2024])}年{rng.randint(1, 12)}月{rng.randint(1, 28)}日'
+    if kind == 1:
+        return f'{rng.randint(1, 12)}月{rng.randint(1, 28)}号'
+    if kind == 2:
+        return f'{rng.randint(1, 999)}.{rng.randint(1, 99)}{rng.choice(["元", "万", "块", "亿元"])}'
+    if kind == 3:
+        return f'1{rng.choice(["38", "39", "58", "86", "77"])}{rng.randint(10000000, 99999999)}'
+    if kind == 4:
+        return f'010-{rng.randint(10000000, 99999999)}'
+    if kind == 5:
+        return f'{rng.randint(1, 9)}/{rng.randint(10, 99)}'
+    if kind == 6:
+        return f'{rng.randint(1, 100)}{rng.choice(["%", "％", ".5%"])}'
+    if kind == 7:
+        return f'{rng.randint(1, 500)}{rng.choice(["个", "张", "只", "年", "天", "千米"])}'
+    if kind == 8:
+        return f'编号{rng.randint(1000, 99999999)}'
+    if kind == 9:
+        return f'{rng.randint(0, 999)}.{rng.randint(0, 999999)}'
+    if kind == 10:
+        return f'GPT{rng.randint(2, 5)}和{rng.randint(1, 99)}B参数'
+    return rng.choice(PLAIN)
+
+
+def make_corpus(lines, seed):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(lines):
+        pieces = [rng.choice(PLAIN)] + [random_piece(rng) for _ in range(rng.randint(0, 4))]
+        rng.shuffle(pieces)
+        corpus.append(rng.choice(['，', '、', '，然后']).join(pieces) + rng.choice(['。', '！', '']))
+    # 字幕中经常出现重复的行
+    corpus += rng.sample(corpus, lines // 5)
+    return corpus
+
+
+def has_ambiguous_number(text):
+    numbers = re.findall(r'\d+', text)
+    return any(i != j and a in b for i, a in enumerate(numbers) for j, b in enumerate(numbers))
+
+
+def check_equivalence(corpus, **options):
+    reference, compiled = TextNorm(**options), CompiledTextNorm(**options)
+    failures, known = 0, 0
+    for text in corpus:
+        expected, actual = reference(text), compiled(text)
+        if expected == actual:
+            continue
+        if has_ambiguous_number(text):
+            known += 1
+            continue
+        failures += 1
+        print(f'MISMATCH\n  input:    {text}\n  TextNorm: {expected}\n  compiled: {actual}')
+    print(f'equivalence {options}: {len(corpus)} lines, {failures} mismatches, '
+          f'{known} known differences (ambiguous numbers)')
+    return failures == 0
+
+
+def benchmark(corpus):
+    reference = TextNorm()
+    t_start = time.perf_counter()
+    for text in corpus:
+        reference(text)
+    t_reference = time.perf_counter() - t_start
+
+    compiled = CompiledTextNorm()
+    t_start = time.perf_counter()
+    compiled.normalize_batch(corpus)
+    t_compiled = time.perf_counter() - t_start
+
+    t_start = time.perf_counter()
+    compiled.normalize_batch(corpus)
+    t_cached = time.perf_counter() - t_start
+
+    print(f'TextNorm:          {t_reference * 1000:8.1f} ms')
+    print(f'CompiledTextNorm:  {t_compiled * 1000:8.1f} ms  ({t_reference / t_compiled:.1f}x)')
+    print(f'  cached re-run:   {t_cached * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    corpus = make_corpus(args.lines, args.seed)
+    ok = check_equivalence(corpus)
+    ok = check_equivalence(corpus, remove_erhua=True) and ok
+    benchmark(corpus)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+启动导入耗时报告
+
+在子进程中用 python -X importtime 导入 webui / gui（只导入，不启动界面），扣除解释器启动本身的导入后汇总总耗时、
+耗时最多的顶层包（按 self 时间合计）和耗时最多的直接导入（按 cumulative），
+并把结果追加到历史文件中，与上一次记录对比，用来跟踪启动开销的变化。
+
+用法: python scripts/import_time_report.py [--module webui gui] [--top 15] [--history logs/import_time.jsonl]
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# import time: self [us] | cumulative | imported package
+_LINE_PATTERN = re.compile(r'^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|( *)(\S+)')
+
+
+def measure(code):
+    """返回 (运行是否成功, [(self_us, cumulative_us, 层级, 模块名)], 错误信息)"""
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                             cwd=ROOT, capture_output=True, text=True)
+    records, errors = [], []
+    for line in process.stderr.splitlines():
+        match = _LINE_PATTERN.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            records.append((int(self_us), int(cumulative_us), len(indent) // 2, name))
+        elif not line.startswith('import time:'):
+            errors.append(line)
+    return process.returncode == 0, records, '\n'.join(errors[-5:])
+
+
+def summarize(records, top):
+    # 每个模块只出现一次；最外层（层级 0）的 cumulative 已包含其子模块，它们的和就是总耗时
+    total_us = sum(cumulative for _, cumulative, level, _ in records if level == 0)
+    packages = {}
+    for self_us, _, _, name in records:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+    top_packages = sorted(packages.items(), key=lambda item: -item[1])[:top]
+    top_imports = sorted(((name, cumulative) for _, cumulative, level, name in records if level == 0),
+                         key=lambda item: -item[1])[:top]
+    return {'total_ms': total_us / 1000, 'modules': len(records),
+            'packages': {name: us / 1000 for name, us in top_packages},
+            'imports': {name: us / 1000 for name, us in top_imports}}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def load_last(history_path, module):
+    if not history_path or not os.path.exists(history_path):
+        return None
+    last = None
+    with open(history_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('module') == module:
+                last = record
+    return last
+
+
+def report(module, top, history_path):
+    ok, records, error = measure(f'import {module}')
+    # 去掉解释器启动本身（site、encodings 等）导入的模块
+    _, startup, _ = measure('pass')
+    startup = {name for _, _, _, name in startup}
+    records = [record for record in records if record[3] not in startup]
+    summary = summarize(records, top)
+    last = load_last(history_path, module)
+
+    status = '成功' if ok else '失败'
+    delta = ''
+    if last:
+        delta = f'（上次 {last["total_ms"]:.0f} ms @ {last.get("commit") or "?"}, 变化 {summary["total_ms"] - last["total_ms"]:+.0f} ms）'
+    print(f'== import {module}: {status}, {summary["modules"]} 个模块, 共 {summary["total_ms"]:.0f} ms{delta}')
+    if not ok:
+        print(f'   导入失败（只统计了失败前的模块）:\n{error}')
+    print('   耗时最多的包（self 合计）:')
+    for name, ms in summary['packages'].items():
+        print(f'   {ms:10.1f} ms  {name}')
+    print('   耗时最多的直接导入（cumulative）:')
+    for name, ms in summary['imports'].items():
+        print(f'   {ms:10.1f} ms  {name}')
+
+    if history_path:
+        os.makedirs(os.path.dirname(history_path) or '.', exist_ok=True)
+        record = {'time': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+                  'module': module, 'ok': ok, 'python': sys.version.split()[0], **summary}
+        with open(history_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', nargs='+', default=['webui', 'gui'])
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--history', default='logs/import_time.jsonl', help='历史记录文件，为空时不记录')
+    args = parser.parse_args()
+    for module in args.module:
+        report(module, args.top, args.history)
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+本地 Cinecast 批量接口替身，用于离线测试 CinecastBatchClient
+
+实现 POST /v1/audio/speech/batch：读取 multipart 中的 job（JSON）和参考音频窗口，按句子倒序
+（模拟服务端按完成顺序返回）流式写回帧头 + 16 位 PCM；文本中含有 [fail] 的句子返回错误帧，
+引用了不存在的参考窗口或句柄也返回错误帧。合成的"语音"是时长与文本长度成正比的正弦波。
+同时实现参考音频缓存（GET /v1/audio/references/<sha256>、POST /v1/audio/references），
+--no-cache 时不注册这两个接口，用于检查客户端退回内联上传；最后清空缓存再跑一遍，检查客户端处理失效句柄。
+
+用法: python scripts/mock_cinecast_server.py [--lines 200] [--batch-size 32] [--no-cache]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+import numpy as np
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.step045_tts_cinecast import FRAME_HEADER, STATUS_UNKNOWN_REFERENCE, CinecastBatchClient, \
+    padded_window_ms  # noqa: E402
+
+SAMPLE_RATE = 24000
+
+
+def fake_speech(text, sample_rate=SAMPLE_RATE):
+    duration = min(0.1 * len(text), 10.)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    return (0.3 * np.sin(2 * np.pi * 220 * t) * 32767).astype('<i2')
+
+
+def make_app(reference_cache=True):
+    # references: 服务端提取特征的参考音频个数；upload_bytes: 收到的参考音频字节数
+    stats = {'jobs': 0, 'lines': 0, 'references': 0, 'upload_bytes': 0}
+    cache = {}
+
+    async def lookup(request):
+        digest = request.match_info['digest']
+        if digest not in cache:
+            return web.Response(status=404, text='unknown reference')
+        return web.json_response({'id': digest})
+
+    async def register(request):
+        data = await request.post()
+        audio = data['audio'].file.read()
+        digest = hashlib.sha256(audio).hexdigest()
+        if digest != data.get('sha256'):
+            return web.Response(status=400, text='sha256 mismatch')
+        stats['upload_bytes'] += len(audio)
+        if digest not in cache:
+            cache[digest] = audio
+            stats['references'] += 1
+        return web.json_response({'id': digest})
+
+    async def batch(request):
+        job, references = None, {}
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name == 'job':
+                job = json.loads(await part.text())
+            elif part.name == 'dummy':
+                # 没有参考音频时客户端为了保持 multipart 格式附带的空字段
+                await part.read()
+            else:
+                references[part.name] = await part.read()
+        if job is None:
+            return web.Response(status=400, text='missing job')
+        stats['jobs'] += 1
+        stats['lines'] += len(job['lines'])
+        stats['references'] += len(references)
+        stats['upload_bytes'] += sum(len(reference) for reference in references.values())
+
+        response = web.StreamResponse()
+        response.content_type = 'application/octet-stream'
+        await response.prepare(request)
+        for entry in reversed(job['lines']):
+            await asyncio.sleep(0.001)
+            if '[fail]' in entry['input']:
+                payload, status = f'合成失败: {entry["input"]}'.encode('utf-8'), 1
+            elif entry.get('reference') and entry['reference'] not in references:
+                payload, status = f'缺少参考音频 {entry["reference"]}'.encode('utf-8'), 2
+            elif entry.get('reference_id') and entry['reference_id'] not in cache:
+                payload, status = f'未知的参考句柄 {entry["reference_id"]}'.encode('utf-8'), STATUS_UNKNOWN_REFERENCE
+            else:
+                payload, status = fake_speech(entry['input']).tobytes(), 0
+            await response.write(FRAME_HEADER.pack(entry['id'], SAMPLE_RATE, status, len(payload)) + payload)
+        await response.write_eof()
+        return response
+
+    app = web.Application(client_max_size=1 << 30)
+    app.router.add_post('/v1/audio/speech/batch', batch)
+    if reference_cache:
+        app.router.add_get('/v1/audio/references/{digest}', lookup)
+        app.router.add_post('/v1/audio/references', register)
+    return app, stats, cache
+
+
+def start_server(app, port):
+    """在后台线程中运行服务，返回服务地址"""
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', port)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return f'http://127.0.0.1:{port}'
+
+
+def write_vocals(path, seconds):
+    samples = (np.random.default_rng(0).normal(scale=0.1, size=int(seconds * SAMPLE_RATE)) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(samples.tobytes())
+
+
+def run(lines, batch_size, port, reference_cache=True):
+    app, stats, cache = make_app(reference_cache)
+    client = CinecastBatchClient(start_server(app, port), batch_size=batch_size)
+    with tempfile.TemporaryDirectory() as folder:
+        vocals = os.path.join(folder, 'audio_vocals.wav')
+        write_vocals(vocals, lines * 2 + 5)
+        # 两个说话人轮流说一串短句，补齐后的参考窗口大量重叠；第二遍模拟同一视频重跑
+        entries = [{'text': f'第 {i} 句{" [fail]" if i % 50 == 49 else ""}', 'start': 2. * i, 'end': 2. * i + 1.5,
+                    'speaker': i // 5 % 2} for i in range(lines)]
+        # 每句单独上传补齐窗口时的字节数（16 位单声道）
+        baseline = sum(end - start for start, end in (padded_window_ms(entry['start'], entry['end'], (lines * 2 + 5) * 1000)
+                                                      for entry in entries)) * SAMPLE_RATE * 2 // 1000
+        t_start = time.time()
+        results = client.synthesize(entries, vocal_audio_path=vocals)
+        wall = time.time() - t_start
+        first_upload, first_references = stats['upload_bytes'], stats['references']
+        client.synthesize(entries, vocal_audio_path=vocals)
+        rerun_upload = stats['upload_bytes'] - first_upload
+        # 模拟服务端重启清空缓存：客户端手里的句柄全部失效，应重新注册后重试
+        cache.clear()
+        evicted = client.synthesize(entries, vocal_audio_path=vocals)
+    ok = [result for result in results if not isinstance(result, Exception)]
+    mismatched = sum(not isinstance(result, Exception) and len(result[0]) != len(fake_speech(entry['text']))
+                     for entry, result in zip(entries, results))
+    print(f'{lines} 句, 每批 {batch_size}: 耗时 {wall:.2f}s, 成功 {len(ok)}, 失败 {lines - len(ok)}, '
+          f'长度不符 {mismatched}, 服务端任务 {stats["jobs"]}, 提取特征 {first_references} 次, '
+          f'参考音频上传 {first_upload / 1024:.0f} KB（逐句上传 {baseline / 1024:.0f} KB，'
+          f'重跑 {rerun_upload / 1024:.0f} KB）, 缓存清空后重跑失败 {sum(isinstance(r, Exception) for r in evicted)}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--no-cache', action='store_true')
+    args = parser.parse_args()
+    run(args.lines, args.batch_size, args.port, not args.no_cache)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+本地模拟 Edge-TTS websocket 服务，用于离线测试 EdgeTTSClient
+
+服务端按 Edge 的协议应答：收到 Path:ssml 后依次返回 turn.start、若干个二进制音频帧
+（2 字节头长度 + 头部 + 音频）、turn.end。--fail-rate 按概率直接断开连接，用来检查重试和逐句报错。
+
+用法: python scripts/mock_edge_tts_server.py [--lines 500] [--concurrency 8] [--fail-rate 0.05]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import asyncio
+
+from aiohttp import web, WSMsgType
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.step044_tts_edge_tts import EdgeTTSClient  # noqa: E402
+
+
+def parse_message(data):
+    """拆出文本消息的头部和正文"""
+    head, _, body = data.partition('\r\n\r\n')
+    headers = dict(line.split(':', 1) for line in head.split('\r\n') if ':' in line)
+    return headers, body
+
+
+def text_frame(request_id, path, body='{}'):
+    return (f'X-RequestId:{request_id}\r\nContent-Type:application/json; charset=utf-8\r\n'
+            f'Path:{path}\r\n\r\n{body}')
+
+
+def audio_frame(request_id, audio):
+    header = f'X-RequestId:{request_id}\r\nContent-Type:audio/mpeg\r\nPath:audio\r\n'.encode('utf-8')
+    return len(header).to_bytes(2, 'big') + header + audio
+
+
+def make_app(fail_rate=0., frames=4, delay=0.02):
+    stats = {'connections': 0, 'dropped': 0}
+
+    async def handler(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        stats['connections'] += 1
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                continue
+            headers, body = parse_message(message.data)
+            if headers.get('Path') != 'ssml':
+                continue
+            if random.random() < fail_rate:
+                stats['dropped'] += 1
+                await ws.close()
+                break
+            request_id = headers.get('X-RequestId', '0')
+            await ws.send_str(text_frame(request_id, 'turn.start'))
+            # 假的 MP3 数据：长度与 SSML 长度相关，便于核对
+            audio = b'ID3' + body.encode('utf-8')
+            step = max(1, len(audio) // frames)
+            for i in range(0, len(audio), step):
+                await asyncio.sleep(delay)
+                await ws.send_bytes(audio_frame(request_id, audio[i:i + step]))
+            await ws.send_str(text_frame(request_id, 'turn.end'))
+        return ws
+
+    app = web.Application()
+    app.router.add_get('/edge', handler)
+    return app, stats
+
+
+def start_server(app, port):
+    """在后台线程中运行服务，返回 websocket 地址"""
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', port)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return f'ws://127.0.0.1:{port}/edge?TrustedClientToken=mock'
+
+
+def run(lines, concurrency, fail_rate, port):
+    app, stats = make_app(fail_rate)
+    url = start_server(app, port)
+    client = EdgeTTSClient(concurrency=concurrency, retry_delay=0.05, wss_url=url)
+    with tempfile.TemporaryDirectory() as folder:
+        jobs = [(f'第 {i} 句测试文本', os.path.join(folder, f'{i:04d}.mp3'), 'zh-CN-XiaoxiaoNeural')
+                for i in range(lines)]
+        t_start = time.time()
+        errors = client.run(jobs)
+        wall = time.time() - t_start
+        written = sum(os.path.exists(path) and os.path.getsize(path) > 0 for _, path, _ in jobs)
+    failed = [error for error in errors if error is not None]
+    print(f'{lines} 句, 并发 {concurrency}: 耗时 {wall:.2f}s, 写入 {written}, 失败 {len(failed)}, '
+          f'连接 {stats["connections"]}, 模拟断线 {stats["dropped"]}')
+    for error in failed[:5]:
+        print(f'  {error!r}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--fail-rate', type=float, default=0.)
+    parser.add_argument('--port', type=int, default=0)
+    args = parser.parse_args()
+    run(args.lines, args.concurrency, args.fail_rate, args.port)
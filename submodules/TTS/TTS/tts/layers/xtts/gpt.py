@@ -599,6 +599,115 @@ class GPT(nn.Module):
             return gen.sequences[:, gpt_inputs.shape[1] :], gen
         return gen[:, gpt_inputs.shape[1] :]
 
+    def _left_pad(self, embs):
+        """Left-pad a list of (1, T_i, dim) embeddings into (b, T, dim) and return it with its attention mask."""
+        length = max(emb.shape[1] for emb in embs)
+        padded = embs[0].new_zeros(len(embs), length, embs[0].shape[-1])
+        mask = torch.zeros(len(embs), length, dtype=torch.long, device=embs[0].device)
+        for i, emb in enumerate(embs):
+            padded[i, length - emb.shape[1] :] = emb[0]
+            mask[i, length - emb.shape[1] :] = 1
+        return padded, mask
+
+    def _row_cond_latents(self, cond_latents, batch_size):
+        if cond_latents.shape[0] == 1:
+            return [cond_latents] * batch_size
+        assert cond_latents.shape[0] == batch_size, " ❗ cond_latents must have 1 or one row per text input."
+        return list(cond_latents.split(1, dim=0))
+
+    def compute_embeddings_batch(self, cond_latents, text_inputs):
+        """
+        Batched `compute_embeddings` for independent text sequences of different lengths.
+
+        Each row is embedded exactly as in `compute_embeddings` and the rows are left-padded, so that the
+        `start_audio_token` of every row is at the same position. Padded positions are masked out.
+
+        Args:
+            cond_latents: (1, P, dim) shared by all rows, or (b, P, dim).
+            text_inputs: list of b (1, t_i) text token tensors.
+
+        Returns:
+            (gpt_inputs, attention_mask), both (b, T + 1).
+        """
+        embs = []
+        for cond, text in zip(self._row_cond_latents(cond_latents, len(text_inputs)), text_inputs):
+            text = F.pad(text, (0, 1), value=self.stop_text_token)
+            text = F.pad(text, (1, 0), value=self.start_text_token)
+            emb = self.text_embedding(text) + self.text_pos_embedding(text)
+            embs.append(torch.cat([cond, emb], dim=1))
+        prefix_emb, attention_mask = self._left_pad(embs)
+        self.gpt_inference.store_prefix_emb(prefix_emb)
+        gpt_inputs = torch.full(
+            (prefix_emb.shape[0], prefix_emb.shape[1] + 1),
+            fill_value=1,
+            dtype=torch.long,
+            device=prefix_emb.device,
+        )
+        gpt_inputs[:, -1] = self.start_audio_token
+        attention_mask = F.pad(attention_mask, (0, 1), value=1)
+        return gpt_inputs, attention_mask
+
+    def generate_batch(self, cond_latents, text_inputs, **hf_generate_kwargs):
+        """
+        Generate audio codes for several independent text sequences in one call.
+
+        Rows finish independently: once a row emits `stop_audio_token` it is only padded until the others
+        are done, and every row is cut right after its first stop token. Every row may generate up to
+        `max_gen_mel_tokens` tokens, as in `generate`.
+
+        Returns:
+            list of b (t_i,) code tensors, including the final stop token when one was generated.
+        """
+        gpt_inputs, attention_mask = self.compute_embeddings_batch(cond_latents, text_inputs)
+        gen = self.gpt_inference.generate(
+            gpt_inputs,
+            attention_mask=attention_mask,
+            bos_token_id=self.start_audio_token,
+            pad_token_id=self.stop_audio_token,
+            eos_token_id=self.stop_audio_token,
+            max_length=self.max_gen_mel_tokens + gpt_inputs.shape[-1],
+            **hf_generate_kwargs,
+        )
+        codes = []
+        for row in gen[:, gpt_inputs.shape[1] :]:
+            stops = (row == self.stop_audio_token).nonzero()
+            end = stops[0].item() + 1 if len(stops) else row.shape[0]
+            codes.append(row[:end])
+        return codes
+
+    def get_latents_batch(self, cond_latents, text_inputs, audio_codes):
+        """
+        Batched equivalent of `forward(..., return_latent=True)` for one row at a time.
+
+        Every row is built exactly like `forward` builds a single row (start/stop text tokens, audio codes
+        followed by stop tokens), the rows are left-padded with an attention mask and run through the GPT
+        together.
+
+        Args:
+            cond_latents: (1, P, dim) shared by all rows, or (b, P, dim).
+            text_inputs: list of b (1, t_i) text token tensors.
+            audio_codes: list of b (m_i,) code tensors, as returned by `generate_batch`.
+
+        Returns:
+            list of b (1, m_i, dim) latents.
+        """
+        embs, mel_lengths = [], []
+        for cond, text, codes in zip(self._row_cond_latents(cond_latents, len(text_inputs)), text_inputs, audio_codes):
+            text = F.pad(text, (0, 1), value=self.stop_text_token)
+            text = F.pad(text, (1, 0), value=self.start_text_token)
+            text_emb = self.text_embedding(text) + self.text_pos_embedding(text)
+            # `forward` pads the codes with 3 extra stop tokens, appends one more and prepends the start token
+            codes = F.pad(codes.view(1, -1), (0, 4), value=self.stop_audio_token)
+            codes = F.pad(codes, (1, 0), value=self.start_audio_token)
+            mel_emb = self.mel_embedding(codes) + self.mel_pos_embedding(codes)
+            embs.append(torch.cat([cond, text_emb, mel_emb], dim=1))
+            mel_lengths.append(codes.shape[-1])
+        emb, attention_mask = self._left_pad(embs)
+        gpt_out = self.gpt(inputs_embeds=emb, return_dict=True, attention_mask=attention_mask)
+        enc = self.final_norm(gpt_out.last_hidden_state)
+        # same trimming as `forward` in eval mode (sub = -5)
+        return [enc[i : i + 1, enc.shape[1] - length : enc.shape[1] - 5] for i, length in enumerate(mel_lengths)]
+
     def get_generator(self, fake_inputs, **hf_generate_kwargs):
         return self.gpt_inference.generate_stream(
             fake_inputs,
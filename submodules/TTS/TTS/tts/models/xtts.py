@@ -1,3 +1,4 @@
+import math
 import os
 from dataclasses import dataclass
 
@@ -582,6 +583,122 @@ class Xtts(BaseTTS):
             "speaker_embedding": speaker_embedding,
         }
 
+    def _decoded_length(self, frames):
+        """Number of `hifigan_decoder` interpolation frames for `frames` GPT latents."""
+        decoder = self.hifigan_decoder
+        length = math.floor(frames * decoder.ar_mel_length_compression / decoder.output_hop_length)
+        if decoder.output_sample_rate != decoder.input_sample_rate:
+            length = math.floor(length * decoder.output_sample_rate / decoder.input_sample_rate)
+        return length
+
+    def decode_batch(self, gpt_latents, speaker_embedding):
+        """
+        Run the HiFiGAN decoder once over several (1, T_i, dim) latents.
+
+        Latents are right-padded by repeating their last frame, so the linear interpolation at the end of
+        each row matches decoding it alone; only the last few milliseconds, inside the receptive field of
+        the padding, can differ slightly. Each waveform is trimmed back to its own length.
+        """
+        lengths = [latents.shape[1] for latents in gpt_latents]
+        max_length = max(lengths)
+        padded = torch.cat(
+            [
+                F.pad(latents.transpose(1, 2), (0, max_length - latents.shape[1]), mode="replicate").transpose(1, 2)
+                for latents in gpt_latents
+            ],
+            dim=0,
+        )
+        g = speaker_embedding.expand(len(gpt_latents), *speaker_embedding.shape[1:])
+        wavs = self.hifigan_decoder(padded, g=g).cpu()
+        wavs = wavs.view(len(gpt_latents), -1)
+        hop = wavs.shape[-1] // self._decoded_length(max_length)
+        return [wav[: self._decoded_length(length) * hop] for wav, length in zip(wavs, lengths)]
+
+    @torch.inference_mode()
+    def inference_batch(
+        self,
+        texts,
+        language,
+        gpt_cond_latent,
+        speaker_embedding,
+        # GPT inference
+        temperature=0.75,
+        length_penalty=1.0,
+        repetition_penalty=10.0,
+        top_k=50,
+        top_p=0.85,
+        do_sample=True,
+        num_beams=1,
+        speed=1.0,
+        batch_size=8,
+        **hf_generate_kwargs,
+    ):
+        """
+        Synthesize many independent lines spoken by the same speaker.
+
+        Lines are sorted by token length and processed `batch_size` at a time: their text tokens are
+        left-padded, GPT codes are generated together with an attention mask and per-row stop handling
+        (`GPT.generate_batch`), the GPT latents are computed in one pass and the HiFiGAN decoder runs over
+        the padded latents. Lines of different speakers must be passed in separate calls.
+
+        Unlike `inference`, each line is synthesized as a single sentence (no text splitting) and
+        `gpt_batch_size` (several candidates per line) is not supported. `speed` is either one value for
+        all lines or a list with one value per line, so every line can be fitted to its own duration.
+
+        Returns:
+            A list with one dictionary per line, in the order of `texts`, with the same keys as `inference`.
+        """
+        language = language.split("-")[0]  # remove the country code
+        speeds = list(speed) if isinstance(speed, (list, tuple)) else [speed] * len(texts)
+        assert len(speeds) == len(texts), " ❗ `speed` needs one value per text."
+        length_scales = [1.0 / max(s, 0.05) for s in speeds]
+        gpt_cond_latent = gpt_cond_latent.to(self.device)
+        speaker_embedding = speaker_embedding.to(self.device)
+
+        text_tokens = []
+        for text in texts:
+            tokens = torch.IntTensor(self.tokenizer.encode(text.strip().lower(), lang=language)).unsqueeze(0)
+            assert (
+                tokens.shape[-1] < self.args.gpt_max_text_tokens
+            ), " ❗ XTTS can only generate text with a maximum of 400 tokens."
+            text_tokens.append(tokens.to(self.device))
+
+        # similar lengths in the same batch keep the padding small
+        order = sorted(range(len(texts)), key=lambda i: text_tokens[i].shape[-1])
+        results = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            indices = order[start : start + batch_size]
+            tokens = [text_tokens[i] for i in indices]
+            with torch.no_grad():
+                gpt_codes = self.gpt.generate_batch(
+                    gpt_cond_latent,
+                    tokens,
+                    do_sample=do_sample,
+                    top_p=top_p,
+                    top_k=top_k,
+                    temperature=temperature,
+                    num_beams=num_beams,
+                    length_penalty=length_penalty,
+                    repetition_penalty=repetition_penalty,
+                    output_attentions=False,
+                    **hf_generate_kwargs,
+                )
+                gpt_latents = self.gpt.get_latents_batch(gpt_cond_latent, tokens, gpt_codes)
+                gpt_latents = [
+                    F.interpolate(latents.transpose(1, 2), scale_factor=length_scales[i], mode="linear").transpose(1, 2)
+                    if length_scales[i] != 1.0
+                    else latents
+                    for i, latents in zip(indices, gpt_latents)
+                ]
+                wavs = self.decode_batch(gpt_latents, speaker_embedding)
+            for i, latents, wav in zip(indices, gpt_latents, wavs):
+                results[i] = {
+                    "wav": wav.numpy(),
+                    "gpt_latents": latents.cpu().numpy(),
+                    "speaker_embedding": speaker_embedding,
+                }
+        return results
+
     def handle_chunks(self, wav_gen, wav_gen_prev, wav_overlap, overlap_len):
         """Handle chunk formatting in streaming mode"""
         wav_chunk = wav_gen[:-overlap_len]
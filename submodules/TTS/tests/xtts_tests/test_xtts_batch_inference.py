@@ -0,0 +1,111 @@
+import os
+import unittest
+
+import torch
+
+from tests import get_tests_input_path
+from TTS.tts.configs.xtts_config import XttsConfig
+from TTS.tts.layers.xtts.tokenizer import VoiceBpeTokenizer
+from TTS.tts.models.xtts import Xtts, XttsArgs
+
+torch.manual_seed(1)
+
+VOCAB_FILE = os.path.join(get_tests_input_path(), "xtts_vocab.json")
+TEXTS = ["Hello there.", "This line is a little bit longer than the first one.", "Short one!"]
+
+
+def make_model():
+    """Tiny randomly initialized XTTS v2, small enough to run on CPU."""
+    torch.manual_seed(1)
+    config = XttsConfig()
+    config.model_args = XttsArgs(
+        gpt_layers=2,
+        gpt_n_model_channels=64,
+        gpt_n_heads=2,
+        gpt_max_audio_tokens=24,
+        gpt_max_text_tokens=64,
+        gpt_max_prompt_tokens=40,
+        gpt_use_perceiver_resampler=True,
+        decoder_input_dim=64,
+    )
+    model = Xtts(config)
+    model.tokenizer = VoiceBpeTokenizer(vocab_file=VOCAB_FILE)
+    model.init_models()
+    model.gpt.init_gpt_for_inference(kv_cache=True)
+    model.eval()
+    return model
+
+
+class TestXttsBatchInference(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model = make_model()
+        cls.cond_latent = torch.randn(1, 32, 64)
+        cls.speaker_embedding = torch.randn(1, 512, 1)
+        cls.tokens = [
+            torch.IntTensor(cls.model.tokenizer.encode(text.lower(), lang="en")).unsqueeze(0) for text in TEXTS
+        ]
+
+    @torch.inference_mode()
+    def test_generate_batch_matches_single(self):
+        gpt = self.model.gpt
+        batch_codes = gpt.generate_batch(self.cond_latent, self.tokens, do_sample=False, num_beams=1)
+        self.assertEqual(len(batch_codes), len(TEXTS))
+        for tokens, codes in zip(self.tokens, batch_codes):
+            single = gpt.generate(self.cond_latent, tokens, do_sample=False, num_beams=1)[0]
+            self.assertTrue(torch.equal(single, codes))
+            # every row is cut right after its first stop token
+            stops = (codes == gpt.stop_audio_token).nonzero()
+            self.assertLessEqual(len(stops), 1)
+            if len(stops):
+                self.assertEqual(stops[0].item(), codes.shape[0] - 1)
+
+    @torch.inference_mode()
+    def test_latents_batch_matches_forward(self):
+        gpt = self.model.gpt
+        codes = [torch.randint(0, 1024, (n,)) for n in (5, 11, 8)]
+        batch_latents = gpt.get_latents_batch(self.cond_latent, self.tokens, codes)
+        for tokens, row_codes, latents in zip(self.tokens, codes, batch_latents):
+            single = gpt(
+                tokens,
+                torch.tensor([tokens.shape[-1]]),
+                row_codes.view(1, -1),
+                torch.tensor([row_codes.shape[0] * gpt.code_stride_len]),
+                cond_latents=self.cond_latent,
+                return_attentions=False,
+                return_latent=True,
+            )
+            self.assertEqual(single.shape, latents.shape)
+            self.assertTrue(torch.allclose(single, latents, atol=1e-5))
+
+    @torch.inference_mode()
+    def test_inference_batch_matches_inference(self):
+        results = self.model.inference_batch(
+            TEXTS, "en", self.cond_latent, self.speaker_embedding, do_sample=False, batch_size=2
+        )
+        self.assertEqual(len(results), len(TEXTS))
+        for text, result in zip(TEXTS, results):
+            single = self.model.inference(text, "en", self.cond_latent, self.speaker_embedding, do_sample=False)
+            self.assertEqual(single["wav"].shape, result["wav"].shape)
+            # padding only affects the receptive field at the end of each row
+            half = single["wav"].shape[0] // 2
+            self.assertTrue(
+                torch.allclose(torch.from_numpy(single["wav"][:half]), torch.from_numpy(result["wav"][:half]), atol=1e-4)
+            )
+
+    @torch.inference_mode()
+    def test_inference_batch_per_line_speed(self):
+        speeds = [1.0, 1.5, 0.8]
+        results = self.model.inference_batch(
+            TEXTS, "en", self.cond_latent, self.speaker_embedding, do_sample=False, speed=speeds, batch_size=3
+        )
+        for text, speed, result in zip(TEXTS, speeds, results):
+            single = self.model.inference(
+                text, "en", self.cond_latent, self.speaker_embedding, do_sample=False, speed=speed
+            )
+            self.assertEqual(single["gpt_latents"].shape, result["gpt_latents"].shape)
+            self.assertEqual(single["wav"].shape, result["wav"].shape)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,12 +14,14 @@ Functions
 ---------
 `demucs.api.save_audio`: Save an audio
 `demucs.api.list_models`: Get models list
+`demucs.api.quantize_model`: Dynamic int8 quantization of a model for CPU inference
 
 Examples
 --------
 See the end of this module (if __name__ == "__main__")
 """
 
+import math
 import subprocess
 
 import torch as th
@@ -27,9 +29,9 @@ import torchaudio as ta
 
 from dora.log import fatal
 from pathlib import Path
-from typing import Optional, Callable, Dict, Tuple, Union
+from typing import Optional, Callable, Dict, Iterator, List, Tuple, Union
 
-from .apply import apply_model, _replace_dict
+from .apply import apply_model, apply_model_batched, apply_model_streaming, _replace_dict
 from .audio import AudioFile, convert_audio, save_audio
 from .pretrained import get_model, _parse_remote_files, REMOTE_ROOT
 from .repo import RemoteRepo, LocalRepo, ModelOnlyRepo, BagOnlyRepo
@@ -49,6 +51,18 @@ class _NotProvided:
 
 NotProvided = _NotProvided()
 
+BACKENDS = ["fp32", "int8"]
+
+
+def quantize_model(model: th.nn.Module) -> th.nn.Module:
+    """
+    Return a copy of `model` (a single model or a `BagOfModels`) with the linear layers of the
+    transformer and the LSTMs replaced by dynamically quantized int8 versions. Convolutions and
+    the attention projections stay in fp32. The quantized model only runs on CPU.
+    """
+    return th.ao.quantization.quantize_dynamic(
+        model.cpu(), {th.nn.Linear, th.nn.LSTM}, dtype=th.qint8, inplace=False)
+
 
 class Separator:
     def __init__(
@@ -64,6 +78,11 @@ class Separator:
         progress: bool = False,
         callback: Optional[Callable[[dict], None]] = None,
         callback_arg: Optional[dict] = None,
+        batch_size: int = 1,
+        deterministic_shifts: bool = False,
+        shift_tolerance: float = 0.,
+        two_stems: Optional[str] = None,
+        backend: str = "fp32",
     ):
         """
         `class Separator`
@@ -97,6 +116,18 @@ class Separator:
         callback_arg: A dict containing private parameters to be passed to callback function. For \
             more information, please see the Callback section.
         progress: If true, show a progress bar.
+        batch_size: Number of segments stacked into one forward pass (only available if `split` \
+            is `True`). 1 runs one segment per call, 0 picks the batch size from free memory.
+        deterministic_shifts: If True, use evenly spaced shift offsets instead of random ones, \
+            so the same input always gives the same output.
+        shift_tolerance: Stop shifting early once an extra shift changes the averaged estimate \
+            by less than this relative amount. 0 always runs all `shifts`.
+        two_stems: If set to a stem name (e.g. "vocals"), only that source is estimated and the \
+            result has two stems: the source and `no_{source}` (the mixture minus the source). \
+            Sub-models of a bag that do not contribute to the source are skipped.
+        backend: Inference backend, `"fp32"` (default) or `"int8"` for dynamic int8 quantization \
+            of the linear and LSTM layers (see `quantize_model`). `"int8"` requires `device="cpu"` \
+            and cannot be changed after the model is loaded.
 
         Callback
         --------
@@ -114,12 +145,17 @@ class Separator:
         - `audio_length`: Length of the audio (in "frame" of the tensor).
         - `models`: Count of submodels in the model.
         """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend}, expected one of {BACKENDS}")
         self._name = model
         self._repo = repo
+        self._backend = backend
         self._load_model()
         self.update_parameter(device=device, shifts=shifts, overlap=overlap, split=split,
                               segment=segment, jobs=jobs, progress=progress, callback=callback,
-                              callback_arg=callback_arg)
+                              callback_arg=callback_arg, batch_size=batch_size,
+                              deterministic_shifts=deterministic_shifts,
+                              shift_tolerance=shift_tolerance, two_stems=two_stems)
 
     def update_parameter(
         self,
@@ -134,6 +170,10 @@ class Separator:
             Union[Callable[[dict], None], _NotProvided]
         ] = NotProvided,
         callback_arg: Optional[Union[dict, _NotProvided]] = NotProvided,
+        batch_size: Union[int, _NotProvided] = NotProvided,
+        deterministic_shifts: Union[bool, _NotProvided] = NotProvided,
+        shift_tolerance: Union[float, _NotProvided] = NotProvided,
+        two_stems: Optional[Union[str, _NotProvided]] = NotProvided,
     ):
         """
         Update the parameters of separation.
@@ -164,6 +204,15 @@ class Separator:
         callback_arg: A dict containing private parameters to be passed to callback function. For \
             more information, please see the Callback section.
         progress: If true, show a progress bar.
+        batch_size: Number of segments stacked into one forward pass (only available if `split` \
+            is `True`). 1 runs one segment per call, 0 picks the batch size from free memory.
+        deterministic_shifts: If True, use evenly spaced shift offsets instead of random ones, \
+            so the same input always gives the same output.
+        shift_tolerance: Stop shifting early once an extra shift changes the averaged estimate \
+            by less than this relative amount. 0 always runs all `shifts`.
+        two_stems: If set to a stem name (e.g. "vocals"), only that source is estimated and the \
+            result has two stems: the source and `no_{source}` (the mixture minus the source). \
+            Sub-models of a bag that do not contribute to the source are skipped.
 
         Callback
         --------
@@ -182,6 +231,8 @@ class Separator:
         - `models`: Count of submodels in the model.
         """
         if not isinstance(device, _NotProvided):
+            if self._backend == "int8" and th.device(device).type != "cpu":
+                raise ValueError("The int8 backend only runs on CPU")
             self._device = device
         if not isinstance(shifts, _NotProvided):
             self._shifts = shifts
@@ -199,11 +250,23 @@ class Separator:
             self._callback = callback
         if not isinstance(callback_arg, _NotProvided):
             self._callback_arg = callback_arg
+        if not isinstance(batch_size, _NotProvided):
+            self._batch_size = batch_size
+        if not isinstance(deterministic_shifts, _NotProvided):
+            self._deterministic_shifts = deterministic_shifts
+        if not isinstance(shift_tolerance, _NotProvided):
+            self._shift_tolerance = shift_tolerance
+        if not isinstance(two_stems, _NotProvided):
+            if two_stems is not None and two_stems not in self._model.sources:
+                raise ValueError(f"Stem {two_stems} is not in {self._model.sources}")
+            self._two_stems = two_stems
 
     def _load_model(self):
         self._model = get_model(name=self._name, repo=self._repo)
         if self._model is None:
             raise LoadModelError("Failed to load model")
+        if self._backend == "int8":
+            self._model = quantize_model(self._model)
         self._audio_channels = self._model.audio_channels
         self._samplerate = self._model.samplerate
 
@@ -281,6 +344,10 @@ class Separator:
                     self._callback_arg, ("audio_length", wav.shape[1])
                 ),
                 progress=self._progress,
+                batch_size=self._batch_size,
+                deterministic_shifts=self._deterministic_shifts,
+                shift_tolerance=self._shift_tolerance,
+                source_indices=self._source_indices(),
             )
         if out is None:
             raise KeyboardInterrupt
@@ -288,7 +355,75 @@ class Separator:
         out += ref.mean()
         wav *= ref.std() + 1e-8
         wav += ref.mean()
-        return (wav, dict(zip(self._model.sources, out[0])))
+        return (wav, self._stems(wav, out[0]))
+
+    def _source_indices(self):
+        if self._two_stems is None:
+            return None
+        return [self._model.sources.index(self._two_stems)]
+
+    def _stems(self, wav: th.Tensor, out: th.Tensor) -> Dict[str, th.Tensor]:
+        if self._two_stems is None:
+            return dict(zip(self._model.sources, out))
+        source = out[0]
+        return {self._two_stems: source, f"no_{self._two_stems}": wav.to(source.device) - source}
+
+    def separate_tensors(
+        self, wavs: List[th.Tensor], sr: Optional[int] = None
+    ) -> List[Tuple[th.Tensor, Dict[str, th.Tensor]]]:
+        """
+        Separate several loaded tensors together. Segments from all of them are stacked into
+        shared forward passes (see `demucs.apply.apply_model_batched`), which is faster than
+        separating them one by one. Callbacks get an extra `track_idx` key.
+
+        Parameters
+        ----------
+        wavs: Waveforms of the audios, each with the same layout as in `separate_tensor`.
+        sr: Sample rate of the original audios.
+
+        Returns
+        -------
+        A list with one `(wav, stems)` tuple per input, as returned by `separate_tensor`.
+        """
+        refs = []
+        mixes = []
+        for wav in wavs:
+            if sr is not None and sr != self.samplerate:
+                wav = convert_audio(wav, sr, self._samplerate, self._audio_channels)
+            ref = wav.mean(0)
+            wav -= ref.mean()
+            wav /= ref.std() + 1e-8
+            refs.append(ref)
+            mixes.append(wav)
+        outs = apply_model_batched(
+                self._model,
+                [wav[None] for wav in mixes],
+                segment=self._segment,
+                shifts=self._shifts,
+                overlap=self._overlap,
+                device=self._device,
+                callback=self._callback,
+                callback_arg=self._callback_arg,
+                progress=self._progress,
+                batch_size=self._batch_size,
+                deterministic_shifts=self._deterministic_shifts,
+                shift_tolerance=self._shift_tolerance,
+                source_indices=self._source_indices(),
+            )
+        results = []
+        for wav, ref, out in zip(mixes, refs, outs):
+            out *= ref.std() + 1e-8
+            out += ref.mean()
+            wav *= ref.std() + 1e-8
+            wav += ref.mean()
+            results.append((wav, self._stems(wav, out[0])))
+        return results
+
+    def separate_audio_files(self, files: List[Path]):
+        """
+        Separate several audio files together. See `separate_tensors`.
+        """
+        return self.separate_tensors([self._load_audio(file) for file in files], self.samplerate)
 
     def separate_audio_file(self, file: Path):
         """
@@ -306,6 +441,75 @@ class Separator:
         """
         return self.separate_tensor(self._load_audio(file), self.samplerate)
 
+    def separate_audio_file_streaming(
+        self, file: Path, block_seconds: float = 30.
+    ) -> Iterator[Tuple[th.Tensor, Dict[str, th.Tensor]]]:
+        """
+        Separate an audio file of any length with bounded memory.
+
+        The file is decoded twice through an ffmpeg pipe: once to compute the normalization
+        statistics, once to separate it window by window (see
+        `demucs.apply.apply_model_streaming`). `shift_tolerance` and `batch_size` are ignored.
+
+        Parameters
+        ----------
+        file: Path of the file to be separated.
+        block_seconds: Duration of the blocks read from ffmpeg.
+
+        Returns
+        -------
+        An iterator of `(wav, stems)` tuples, one per output block, in order. Concatenated
+        together they match the output of `separate_audio_file` in split mode (up to the
+        rounding of the normalization statistics, which are accumulated in float64).
+        """
+        audio = AudioFile(file)
+        block_size = int(block_seconds * self._samplerate)
+
+        def blocks():
+            return audio.stream(0, samplerate=self._samplerate, channels=self._audio_channels,
+                                block_size=block_size)
+
+        # Running mean / variance of the mono reference (Chan et al. parallel update)
+        count, mean, m2 = 0, 0., 0.
+        for wav in blocks():
+            ref = wav.mean(0).double()
+            n = ref.shape[-1]
+            block_mean = ref.mean().item()
+            block_m2 = ((ref - block_mean) ** 2).sum().item()
+            delta = block_mean - mean
+            total = count + n
+            mean += delta * n / total
+            m2 += block_m2 + delta ** 2 * count * n / total
+            count = total
+        if count == 0:
+            raise LoadAudioError(f"Could not decode any audio from {file}")
+        ref_mean = th.tensor(mean, dtype=th.float32)
+        ref_std = th.tensor(math.sqrt(m2 / max(1, count - 1)), dtype=th.float32)
+
+        def normalized():
+            for wav in blocks():
+                wav -= ref_mean
+                wav /= ref_std + 1e-8
+                yield wav[None]
+
+        for mix, out in apply_model_streaming(
+                self._model,
+                normalized(),
+                segment=self._segment,
+                shifts=self._shifts,
+                overlap=self._overlap,
+                device=self._device,
+                deterministic_shifts=self._deterministic_shifts,
+                source_indices=self._source_indices(),
+                callback=self._callback,
+                callback_arg=_replace_dict(self._callback_arg, ("audio_length", count)),
+        ):
+            out *= ref_std + 1e-8
+            out += ref_mean
+            wav = mix[0] * (ref_std + 1e-8)
+            wav += ref_mean
+            yield wav, self._stems(wav, out[0])
+
     @property
     def samplerate(self):
         return self._samplerate
@@ -314,6 +518,10 @@ class Separator:
     def audio_channels(self):
         return self._audio_channels
 
+    @property
+    def backend(self):
+        return self._backend
+
     @property
     def model(self):
         return self._model
@@ -7,8 +7,10 @@
 Code to apply a model to a mix. It will handle chunking with overlaps and
 inteprolation between chunks, as well as the "shift trick".
 """
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
 import copy
+import os
 import random
 from threading import Lock
 import typing as tp
@@ -25,6 +27,12 @@ from .utils import center_trim, DummyPoolExecutor
 
 Model = tp.Union[Demucs, HDemucs, HTDemucs]
 
+# Rough peak memory of one forward pass, as a multiple of the size of its output
+# (sources x channels x samples x float32). Used to pick a batch size automatically.
+SEGMENT_MEMORY_FACTOR = 64
+MAX_BATCH_SIZE = 16
+DEFAULT_BATCH_SIZE = 4
+
 
 class BagOfModels(nn.Module):
     def __init__(self, models: tp.List[Model],
@@ -132,6 +140,19 @@ def tensor_chunk(tensor_or_chunk):
         return TensorChunk(tensor_or_chunk)
 
 
+def _shift_offset(shift_idx: int, shifts: int, max_shift: int, deterministic: bool) -> int:
+    if deterministic:
+        # Evenly spaced offsets, so the same input always gives the same output.
+        return int(max_shift * (shift_idx + 0.5) / shifts)
+    return random.randint(0, max_shift)
+
+
+def _shift_change(total: th.Tensor, shifted_out: th.Tensor, count: int) -> float:
+    """Relative change of the running average of `count` shifts when adding `shifted_out`."""
+    mean = total / count
+    return float((shifted_out - mean).norm() / ((total + shifted_out).norm() + 1e-8))
+
+
 def _replace_dict(_dict: tp.Optional[dict], *subs: tp.Tuple[tp.Hashable, tp.Any]) -> dict:
     if _dict is None:
         _dict = {}
@@ -150,7 +171,10 @@ def apply_model(model: tp.Union[BagOfModels, Model],
                 num_workers: int = 0, segment: tp.Optional[float] = None,
                 pool=None, lock=None,
                 callback: tp.Optional[tp.Callable[[dict], None]] = None,
-                callback_arg: tp.Optional[dict] = None) -> th.Tensor:
+                callback_arg: tp.Optional[dict] = None,
+                batch_size: int = 1, deterministic_shifts: bool = False,
+                shift_tolerance: float = 0.,
+                source_indices: tp.Optional[tp.Sequence[int]] = None) -> th.Tensor:
     """
     Apply model to a given mixture.
 
@@ -170,6 +194,15 @@ def apply_model(model: tp.Union[BagOfModels, Model],
         num_workers (int): if non zero, device is 'cpu', how many threads to
             use in parallel.
         segment (float or None): override the model segment parameter.
+        batch_size (int): number of segments stacked into a single forward pass when
+            `split` is True. 1 keeps the one-segment-per-call behavior, 0 picks the
+            batch size from the available memory.
+        deterministic_shifts (bool): use evenly spaced shift offsets instead of random ones.
+        shift_tolerance (float): stop shifting early once adding a shift changes the
+            running average by less than this relative amount. 0 always runs all shifts.
+        source_indices (list of int or None): only keep these sources (indices into
+            `model.sources`) in the output, so the overlap-add buffers only hold the
+            sources that are needed. None keeps all of them.
     """
     if device is None:
         device = mix.device
@@ -195,6 +228,10 @@ def apply_model(model: tp.Union[BagOfModels, Model],
         'pool': pool,
         'segment': segment,
         'lock': lock,
+        'batch_size': batch_size,
+        'deterministic_shifts': deterministic_shifts,
+        'shift_tolerance': shift_tolerance,
+        'source_indices': source_indices,
     }
     out: tp.Union[float, th.Tensor]
     res: tp.Union[float, th.Tensor]
@@ -203,9 +240,11 @@ def apply_model(model: tp.Union[BagOfModels, Model],
         # We explicitely apply multiple times `apply_model` so that the random shifts
         # are different for each model.
         estimates: tp.Union[float, th.Tensor] = 0.
-        totals = [0.] * len(model.sources)
-        callback_arg["models"] = len(model.models)
-        for sub_model, model_weights in zip(model.models, model.weights):
+        kept = _kept_sources(model, source_indices)
+        totals = [0.] * len(kept)
+        sub_models = _active_sub_models(model, kept)
+        callback_arg["models"] = len(sub_models)
+        for sub_model, model_weights in sub_models:
             kwargs["callback"] = ((
                     lambda d, i=callback_arg["model_idx_in_bag"]: callback(
                         _replace_dict(d, ("model_idx_in_bag", i))) if callback else None)
@@ -216,9 +255,9 @@ def apply_model(model: tp.Union[BagOfModels, Model],
             res = apply_model(sub_model, mix, **kwargs, callback_arg=callback_arg)
             out = res
             sub_model.to(original_model_device)
-            for k, inst_weight in enumerate(model_weights):
-                out[:, k, :, :] *= inst_weight
-                totals[k] += inst_weight
+            for k, source in enumerate(kept):
+                out[:, k, :, :] *= model_weights[source]
+                totals[k] += model_weights[source]
             estimates += out
             del out
             callback_arg["model_idx_in_bag"] += 1
@@ -241,22 +280,35 @@ def apply_model(model: tp.Union[BagOfModels, Model],
         assert isinstance(mix, TensorChunk)
         padded_mix = mix.padded(length + 2 * max_shift)
         out = 0.
+        count = 0
         for shift_idx in range(shifts):
-            offset = random.randint(0, max_shift)
+            offset = _shift_offset(shift_idx, shifts, max_shift, deterministic_shifts)
             shifted = TensorChunk(padded_mix, offset, length + max_shift - offset)
             kwargs["callback"] = (
                     (lambda d, i=shift_idx: callback(_replace_dict(d, ("shift_idx", i)))
                      if callback else None)
                 )
             res = apply_model(model, shifted, **kwargs, callback_arg=callback_arg)
-            shifted_out = res
-            out += shifted_out[..., max_shift - offset:]
-        out /= shifts
+            shifted_out = res[..., max_shift - offset:]
+            converged = (shift_tolerance > 0 and count > 0
+                         and _shift_change(out, shifted_out, count) < shift_tolerance)
+            out += shifted_out
+            count += 1
+            if converged:
+                break
+        out /= count
         assert isinstance(out, th.Tensor)
         return out
+    elif split and batch_size != 1:
+        return _apply_split_batched(model, [mix], overlap=overlap,
+                                    transition_power=transition_power,
+                                    progress=progress, device=device, segment=segment,
+                                    batch_size=batch_size, lock=lock, callback=callback,
+                                    callback_arg=callback_arg, source_indices=source_indices)[0]
     elif split:
         kwargs['split'] = False
-        out = th.zeros(batch, len(model.sources), channels, length, device=mix.device)
+        out = th.zeros(batch, len(_kept_sources(model, source_indices)), channels, length,
+                       device=mix.device)
         sum_weight = th.zeros(length, device=mix.device)
         if segment is None:
             segment = model.segment
@@ -315,8 +367,442 @@ def apply_model(model: tp.Union[BagOfModels, Model],
                 callback(_replace_dict(callback_arg, ("state", "start")))  # type: ignore
         with th.no_grad():
             out = model(padded_mix)
+            if source_indices is not None:
+                out = out[:, list(source_indices)]
         with lock:
             if callback is not None:
                 callback(_replace_dict(callback_arg, ("state", "end")))  # type: ignore
         assert isinstance(out, th.Tensor)
         return center_trim(out, length)
+
+
+def _kept_sources(model, source_indices: tp.Optional[tp.Sequence[int]]) -> tp.List[int]:
+    return list(range(len(model.sources))) if source_indices is None else list(source_indices)
+
+
+def _active_sub_models(model: BagOfModels, kept: tp.List[int]):
+    """
+    Sub-models of the bag that contribute to at least one kept source. With per-source
+    specialised bags (e.g. htdemucs_ft) and a single kept source, only one model runs.
+    """
+    return [(sub_model, weights) for sub_model, weights in zip(model.models, model.weights)
+            if any(weights[source] for source in kept)]
+
+
+def _valid_length(model, length: int, segment: tp.Optional[float]) -> int:
+    if isinstance(model, HTDemucs) and segment is not None:
+        return int(segment * model.samplerate)
+    elif hasattr(model, 'valid_length'):
+        return model.valid_length(length)  # type: ignore
+    return length
+
+
+def auto_batch_size(model: Model, valid_length: int, rows: int, device: th.device) -> int:
+    """
+    Pick how many segments to stack in one forward pass from the free memory of `device`.
+    `rows` is the batch dimension of a single segment (the batch size of the mix).
+    """
+    try:
+        if device.type == 'cuda':
+            free, _ = th.cuda.mem_get_info(device)
+        else:
+            free = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError, RuntimeError):
+        return DEFAULT_BATCH_SIZE
+    per_segment = (rows * len(model.sources) * model.audio_channels * valid_length * 4
+                   * SEGMENT_MEMORY_FACTOR)
+    return max(1, min(MAX_BATCH_SIZE, int(free // 2 // per_segment)))
+
+
+def _apply_split_batched(model: Model,
+                         mixes: tp.Sequence[tp.Union[th.Tensor, TensorChunk]],
+                         overlap: float = 0.25, transition_power: float = 1.,
+                         progress: bool = False, device=None,
+                         segment: tp.Optional[float] = None, batch_size: int = 0,
+                         lock=None,
+                         callback: tp.Optional[tp.Callable[[dict], None]] = None,
+                         callback_arg: tp.Optional[dict] = None,
+                         source_indices: tp.Optional[tp.Sequence[int]] = None
+                         ) -> tp.List[th.Tensor]:
+    """
+    Split every mix into overlapping segments, run the segments of all mixes through
+    the model in stacked batches, and overlap-add the outputs with the same triangular
+    weight as the one-segment-per-call path. Segments are only stacked with others of
+    the same padded length, so the result matches the unbatched path.
+    """
+    if lock is None:
+        lock = Lock()
+    callback_arg = _replace_dict(callback_arg)
+    segment_length = int(model.samplerate * (model.segment if segment is None else segment))
+    stride = int((1 - overlap) * segment_length)
+    weight = th.cat([th.arange(1, segment_length // 2 + 1, device=device),
+                     th.arange(segment_length - segment_length // 2, 0, -1, device=device)])
+    weight = (weight / weight.max())**transition_power
+
+    outs = []
+    groups: tp.Dict[int, tp.List[tp.Tuple[int, int, TensorChunk]]] = OrderedDict()
+    for track_idx, mix in enumerate(mixes):
+        batch, channels, length = mix.shape
+        outs.append((th.zeros(batch, len(_kept_sources(model, source_indices)), channels, length,
+                              device=mix.device),
+                     th.zeros(length, device=mix.device)))
+        for offset in range(0, length, stride):
+            chunk = TensorChunk(mix, offset, segment_length)
+            valid_length = _valid_length(model, chunk.length, segment)
+            groups.setdefault(valid_length, []).append((track_idx, offset, chunk))
+
+    batches = []
+    for valid_length, items in groups.items():
+        size = batch_size or auto_batch_size(model, valid_length, items[0][2].shape[0], device)
+        batches += [(valid_length, items[i:i + size]) for i in range(0, len(items), size)]
+    if progress:
+        batches = tqdm.tqdm(batches, ncols=120, unit='batch')
+
+    def notify(items, state):
+        if callback is None:
+            return
+        with lock:
+            for track_idx, offset, _ in items:
+                callback(_replace_dict(callback_arg, ("segment_offset", offset), ("state", state),
+                                       ("track_idx", track_idx),
+                                       ("audio_length", mixes[track_idx].shape[-1])))
+
+    for valid_length, items in batches:
+        padded = th.cat([chunk.padded(valid_length) for _, _, chunk in items]).to(device)
+        notify(items, "start")
+        with th.no_grad():
+            batch_out = model(padded)
+            if source_indices is not None:
+                batch_out = batch_out[:, list(source_indices)]
+        notify(items, "end")
+        rows = items[0][2].shape[0]
+        for i, (track_idx, offset, chunk) in enumerate(items):
+            chunk_out = center_trim(batch_out[i * rows:(i + 1) * rows], chunk.length)
+            out, sum_weight = outs[track_idx]
+            out[..., offset:offset + segment_length] += (
+                weight[:chunk.length] * chunk_out).to(out.device)
+            sum_weight[offset:offset + segment_length] += weight[:chunk.length].to(out.device)
+
+    results = []
+    for out, sum_weight in outs:
+        assert sum_weight.min() > 0
+        results.append(out / sum_weight)
+    return results
+
+
+def apply_model_batched(model: tp.Union[BagOfModels, Model],
+                        mixes: tp.Sequence[th.Tensor],
+                        shifts: int = 1, overlap: float = 0.25,
+                        transition_power: float = 1., progress: bool = False,
+                        device=None, segment: tp.Optional[float] = None,
+                        batch_size: int = 0, deterministic_shifts: bool = False,
+                        shift_tolerance: float = 0.,
+                        callback: tp.Optional[tp.Callable[[dict], None]] = None,
+                        callback_arg: tp.Optional[dict] = None,
+                        source_indices: tp.Optional[tp.Sequence[int]] = None) -> tp.List[th.Tensor]:
+    """
+    Apply model to several mixtures at once. Same as calling `apply_model` with
+    `split=True` on each mix, except that segments from all mixes are stacked
+    into shared forward passes. Callbacks get an extra `track_idx` key.
+    """
+    if device is None:
+        device = mixes[0].device
+    else:
+        device = th.device(device)
+    callback_arg = _replace_dict(
+        callback_arg, *{"model_idx_in_bag": 0, "shift_idx": 0, "segment_offset": 0}.items()
+    )
+    kwargs: tp.Dict[str, tp.Any] = {
+        'overlap': overlap,
+        'transition_power': transition_power,
+        'progress': progress,
+        'device': device,
+        'segment': segment,
+        'batch_size': batch_size,
+        'source_indices': source_indices,
+    }
+    if isinstance(model, BagOfModels):
+        estimates: tp.List[tp.Any] = [0.] * len(mixes)
+        kept = _kept_sources(model, source_indices)
+        totals = [0.] * len(kept)
+        sub_models = _active_sub_models(model, kept)
+        callback_arg["models"] = len(sub_models)
+        for sub_model, model_weights in sub_models:
+            original_model_device = next(iter(sub_model.parameters())).device
+            sub_model.to(device)
+            bag_outs = apply_model_batched(sub_model, mixes, shifts=shifts, **kwargs,
+                                           deterministic_shifts=deterministic_shifts,
+                                           shift_tolerance=shift_tolerance,
+                                           callback=callback, callback_arg=callback_arg)
+            sub_model.to(original_model_device)
+            for k, source in enumerate(kept):
+                for out in bag_outs:
+                    out[:, k, :, :] *= model_weights[source]
+                totals[k] += model_weights[source]
+            for i, out in enumerate(bag_outs):
+                estimates[i] += out
+            del bag_outs
+            callback_arg["model_idx_in_bag"] += 1
+        for estimate in estimates:
+            for k in range(estimate.shape[1]):
+                estimate[:, k, :, :] /= totals[k]
+        return estimates
+
+    if "models" not in callback_arg:
+        callback_arg["models"] = 1
+    model.to(device)
+    model.eval()
+    if not shifts:
+        return _apply_split_batched(model, mixes, callback=callback, callback_arg=callback_arg,
+                                    **kwargs)
+    max_shift = int(0.5 * model.samplerate)
+    outs: tp.List[tp.Any] = [0.] * len(mixes)
+    count = 0
+    for shift_idx in range(shifts):
+        shifted, offsets = [], []
+        for mix in mixes:
+            length = mix.shape[-1]
+            offset = _shift_offset(shift_idx, shifts, max_shift, deterministic_shifts)
+            padded_mix = tensor_chunk(mix).padded(length + 2 * max_shift)
+            shifted.append(TensorChunk(padded_mix, offset, length + max_shift - offset))
+            offsets.append(offset)
+        res = _apply_split_batched(model, shifted, callback=callback,
+                                   callback_arg=_replace_dict(callback_arg,
+                                                              ("shift_idx", shift_idx)),
+                                   **kwargs)
+        res = [shifted_out[..., max_shift - offset:] for shifted_out, offset in zip(res, offsets)]
+        # Stop once every track has converged
+        converged = (shift_tolerance > 0 and count > 0
+                     and all(_shift_change(out, shifted_out, count) < shift_tolerance
+                             for out, shifted_out in zip(outs, res)))
+        for i, shifted_out in enumerate(res):
+            outs[i] += shifted_out
+        count += 1
+        if converged:
+            break
+    return [out / count for out in outs]
+
+
+class _StreamPass:
+    """
+    One (sub-model, shift) pass of the split mode, run incrementally over a stream.
+    `delta` maps pass coordinates to track coordinates (track = pass + delta).
+    """
+    def __init__(self, model: Model, model_idx: int, shift_idx: int, delta: int):
+        self.model = model
+        self.model_idx = model_idx
+        self.shift_idx = shift_idx
+        self.delta = delta
+        self.next_offset = 0
+        self.done = False
+        self.start = 0
+        self.out: tp.Optional[th.Tensor] = None
+        self.sum_weight: tp.Optional[th.Tensor] = None
+
+    def add(self, offset: int, chunk_out: th.Tensor, weight: th.Tensor):
+        end = offset + chunk_out.shape[-1]
+        if self.out is None:
+            *shape, _ = chunk_out.shape
+            self.out = th.zeros(*shape, 0, device=chunk_out.device)
+            self.sum_weight = th.zeros(0, device=chunk_out.device)
+        assert self.sum_weight is not None
+        missing = end - (self.start + self.out.shape[-1])
+        if missing > 0:
+            self.out = th.cat([self.out, self.out.new_zeros(*self.out.shape[:-1], missing)], -1)
+            self.sum_weight = th.cat([self.sum_weight, self.sum_weight.new_zeros(missing)])
+        self.out[..., offset - self.start:end - self.start] += chunk_out
+        self.sum_weight[offset - self.start:end - self.start] += weight
+
+    def read(self, begin: int, end: int) -> th.Tensor:
+        """Final split output for track coordinates [begin, end)."""
+        assert self.out is not None and self.sum_weight is not None
+        lo, hi = begin - self.delta - self.start, end - self.delta - self.start
+        out = self.out[..., lo:hi].clone()
+        out /= self.sum_weight[lo:hi]
+        return out
+
+    def drop(self, begin: int):
+        """Forget everything before track coordinate `begin`."""
+        if self.out is None:
+            return
+        cut = begin - self.delta - self.start
+        if cut > 0:
+            self.out = self.out[..., cut:]
+            self.sum_weight = self.sum_weight[cut:]  # type: ignore
+            self.start += cut
+
+
+def apply_model_streaming(model: tp.Union[BagOfModels, Model],
+                          blocks: tp.Iterable[th.Tensor],
+                          shifts: int = 1, overlap: float = 0.25,
+                          transition_power: float = 1., device=None,
+                          segment: tp.Optional[float] = None,
+                          deterministic_shifts: bool = False,
+                          source_indices: tp.Optional[tp.Sequence[int]] = None,
+                          callback: tp.Optional[tp.Callable[[dict], None]] = None,
+                          callback_arg: tp.Optional[dict] = None
+                          ) -> tp.Iterator[tp.Tuple[th.Tensor, th.Tensor]]:
+    """
+    Streaming version of `apply_model` with `split=True`, for inputs too long to hold in memory.
+
+    `blocks` yields consecutive pieces of the mix, each of shape [B, C, T] with any T.
+    Yields `(mix_block, out_block)` pairs covering the whole mix in order, where `out_block`
+    has shape [B, S, C, T']. Only a few segments worth of input and output are kept in
+    memory, whatever the length of the mix.
+
+    The concatenated output is identical to `apply_model(..., split=True, batch_size=1)`
+    with the same shift offsets: every segment is padded, weighted and accumulated the same
+    way and in the same order. Random shift offsets are drawn in the same order as
+    `apply_model`, so seeding `random` identically gives the same result. Early exit on
+    shifts (`shift_tolerance`) needs the whole track and is not available here.
+    """
+    if callback_arg is None:
+        callback_arg = {}
+    if isinstance(model, BagOfModels):
+        kept = _kept_sources(model, source_indices)
+        sub_models = _active_sub_models(model, kept)
+        bag_weights: tp.Optional[tp.List[tp.List[float]]] = [weights for _, weights in sub_models]
+        models = [sub_model for sub_model, _ in sub_models]
+    else:
+        kept = _kept_sources(model, source_indices)
+        bag_weights = None
+        models = [model]
+    first = models[0]
+    if device is None:
+        device = next(iter(first.parameters())).device
+    device = th.device(device)
+    original_devices = [next(iter(sub_model.parameters())).device for sub_model in models]
+    for sub_model in models:
+        sub_model.to(device)
+        sub_model.eval()
+
+    max_shift = int(0.5 * first.samplerate)
+    passes = []
+    for model_idx, sub_model in enumerate(models):
+        if shifts:
+            for shift_idx in range(shifts):
+                offset = _shift_offset(shift_idx, shifts, max_shift, deterministic_shifts)
+                passes.append(_StreamPass(sub_model, model_idx, shift_idx, offset - max_shift))
+        else:
+            passes.append(_StreamPass(sub_model, model_idx, 0, 0))
+
+    segment_length = int(first.samplerate * (first.segment if segment is None else segment))
+    stride = int((1 - overlap) * segment_length)
+    weight = th.cat([th.arange(1, segment_length // 2 + 1, device=device),
+                     th.arange(segment_length - segment_length // 2, 0, -1, device=device)])
+    weight = (weight / weight.max())**transition_power
+    full_valid = max(_valid_length(sub_model, segment_length, segment) for sub_model in models)
+    margin = full_valid + segment_length
+
+    buffer: tp.Optional[th.Tensor] = None
+    buffer_start = 0
+    length: tp.Optional[int] = None  # known once the input is exhausted
+    emitted = 0
+
+    def input_slice(begin: int, size: int) -> th.Tensor:
+        """Mix over [begin, begin + size), zero outside of the track."""
+        assert buffer is not None
+        end = buffer_start + buffer.shape[-1]
+        lo, hi = max(begin, 0), min(begin + size, end)
+        if hi <= lo:
+            return buffer.new_zeros(*buffer.shape[:-1], size)
+        assert lo >= buffer_start
+        piece = buffer[..., lo - buffer_start:hi - buffer_start]
+        return F.pad(piece, (lo - begin, size - (hi - begin)))
+
+    def run_ready():
+        read_end = buffer_start + (buffer.shape[-1] if buffer is not None else 0)
+        for stream_pass in passes:
+            while not stream_pass.done:
+                offset = stream_pass.next_offset
+                begin = offset + stream_pass.delta
+                if length is None:
+                    chunk_length = segment_length
+                    valid_length = _valid_length(stream_pass.model, chunk_length, segment)
+                    needed = max(begin + segment_length,
+                                 begin - (valid_length - chunk_length) // 2 + valid_length)
+                    if read_end < needed:
+                        break
+                else:
+                    pass_length = length - stream_pass.delta
+                    if offset >= pass_length:
+                        stream_pass.done = True
+                        break
+                    chunk_length = min(segment_length, pass_length - offset)
+                    valid_length = _valid_length(stream_pass.model, chunk_length, segment)
+                padded = input_slice(begin - (valid_length - chunk_length) // 2, valid_length)
+                info = _replace_dict(callback_arg, ("model_idx_in_bag", stream_pass.model_idx),
+                                     ("shift_idx", stream_pass.shift_idx),
+                                     ("segment_offset", offset), ("models", len(models)))
+                if callback is not None:
+                    callback(_replace_dict(info, ("state", "start")))
+                with th.no_grad():
+                    chunk_out = stream_pass.model(padded.to(device))
+                    if source_indices is not None:
+                        chunk_out = chunk_out[:, list(source_indices)]
+                if callback is not None:
+                    callback(_replace_dict(info, ("state", "end")))
+                chunk_out = center_trim(chunk_out, chunk_length)
+                assert buffer is not None
+                stream_pass.add(offset, (weight[:chunk_length] * chunk_out).to(buffer.device),
+                                weight[:chunk_length].to(buffer.device))
+                stream_pass.next_offset += stride
+
+    def combine(begin: int, end: int) -> th.Tensor:
+        """Same sequence of operations as `apply_model`, on track coordinates [begin, end)."""
+        estimates: tp.Any = 0.
+        totals = [0.] * len(kept)
+        for model_idx in range(len(models)):
+            model_passes = [p for p in passes if p.model_idx == model_idx]
+            if shifts:
+                out: tp.Any = 0.
+                for stream_pass in model_passes:
+                    out += stream_pass.read(begin, end)
+                out /= len(model_passes)
+            else:
+                out = model_passes[0].read(begin, end)
+            if bag_weights is None:
+                return out
+            for k, source in enumerate(kept):
+                out[:, k, :, :] *= bag_weights[model_idx][source]
+                totals[k] += bag_weights[model_idx][source]
+            estimates += out
+        for k in range(estimates.shape[1]):
+            estimates[:, k, :, :] /= totals[k]
+        return estimates
+
+    def flush():
+        nonlocal emitted, buffer, buffer_start
+        assert buffer is not None
+        if length is None:
+            # Passes only finish once the length of the input is known
+            final = min(p.next_offset + p.delta for p in passes)
+        else:
+            final = min([length] + [p.next_offset + p.delta for p in passes if not p.done])
+        if final <= emitted:
+            return
+        mix_block = buffer[..., emitted - buffer_start:final - buffer_start]
+        out_block = combine(emitted, final)
+        emitted = final
+        # Keep enough input for the padding context of the next segments
+        keep_from = max(0, min(emitted, min(p.next_offset + p.delta for p in passes) - margin))
+        if keep_from > buffer_start:
+            buffer = buffer[..., keep_from - buffer_start:]
+            buffer_start = keep_from
+        for stream_pass in passes:
+            stream_pass.drop(emitted)
+        yield mix_block, out_block
+
+    try:
+        for block in blocks:
+            buffer = block if buffer is None else th.cat([buffer, block], -1)
+            run_ready()
+            yield from flush()
+        if buffer is None:
+            return
+        length = buffer_start + buffer.shape[-1]
+        run_ready()
+        yield from flush()
+    finally:
+        for sub_model, original_device in zip(models, original_devices):
+            sub_model.to(original_device)
@@ -139,6 +139,46 @@ class AudioFile:
             wav = wav[0]
         return wav
 
+    def stream(self, stream=0, samplerate=None, channels=None, block_size=441000):
+        """
+        Decode one stream through an ffmpeg pipe and yield it as consecutive [C, T] blocks
+        of at most `block_size` samples, so that long files never have to fit in memory.
+        Decoding options are the same as :method:`read`, so the concatenated blocks are
+        equal to `read(streams=stream, samplerate=samplerate, channels=channels)`.
+        """
+        command = ['ffmpeg', '-loglevel', 'panic', '-i', str(self.path)]
+        command += ['-map', f'0:{self._audio_streams[stream]}']
+        command += ['-threads', '1', '-f', 'f32le']
+        if samplerate is not None:
+            command += ['-ar', str(samplerate)]
+        command += ['-']
+        src_channels = self.channels(stream)
+        frame_bytes = 4 * src_channels
+        process = sp.Popen(command, stdout=sp.PIPE)
+        try:
+            pending = b''
+            while True:
+                data = process.stdout.read(block_size * frame_bytes)
+                if not data:
+                    break
+                data = pending + data
+                usable = len(data) - len(data) % frame_bytes
+                pending = data[usable:]
+                if not usable:
+                    continue
+                wav = torch.from_numpy(np.frombuffer(data[:usable], dtype=np.float32).copy())
+                wav = wav.view(-1, src_channels).t()
+                if channels is not None:
+                    wav = convert_audio_channels(wav, channels)
+                yield wav
+            if process.wait() != 0:
+                raise sp.CalledProcessError(process.returncode, command)
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            process.wait()
+
 
 def convert_audio_channels(wav, channels=2):
     """Convert audio to the given number of channels."""
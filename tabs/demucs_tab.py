@@ -4,11 +4,10 @@ from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineE
 
 from ui_components import CustomSlider, RadioButtonGroup
 
-# 尝试导入实际的功能模块
-try:
-    from tools.step010_demucs_vr import separate_all_audio_under_folder
-except ImportError:
-    pass
+from tools.lazy import lazy_function
+
+# 功能模块在第一次调用时才导入，避免拖慢界面启动
+separate_all_audio_under_folder = lazy_function('tools.step010_demucs_vr', 'separate_all_audio_under_folder')
 
 
 class DemucsTab(QWidget):
@@ -4,11 +4,10 @@ from PySide6.QtWidgets import (QWidget, QVBoxLayout, QLabel, QLineEdit,
 
 from ui_components import CustomSlider, RadioButtonGroup, VideoPlayer
 
-# 尝试导入实际的功能模块
-try:
-    from tools.step000_video_downloader import download_from_url
-except ImportError:
-    pass
+from tools.lazy import lazy_function
+
+# 功能模块在第一次调用时才导入，避免拖慢界面启动
+download_from_url = lazy_function('tools.step000_video_downloader', 'download_from_url')
 
 
 class DownloadTab(QWidget):
@@ -10,8 +10,10 @@ import subprocess
 
 from ui_components import VideoPlayer
 
-# 直接导入实际的功能模块
-from tools.do_everything import do_everything
+from tools.lazy import lazy_function
+
+# 功能模块在第一次调用时才导入，避免拖慢界面启动
+do_everything = lazy_function('tools.do_everything', 'do_everything')
 try:
     from tools.utils import SUPPORT_VOICE
 except ImportError:
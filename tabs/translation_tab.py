@@ -2,11 +2,10 @@ import os
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QLabel, QLineEdit,
                                QComboBox, QPushButton, QMessageBox, QScrollArea)
 
-# 尝试导入实际的功能模块
-try:
-    from tools.step030_translation import translate_all_transcript_under_folder
-except ImportError:
-    pass
+from tools.lazy import lazy_function
+
+# 功能模块在第一次调用时才导入，避免拖慢界面启动
+translate_all_transcript_under_folder = lazy_function('tools.step030_translation', 'translate_all_transcript_under_folder')
 
 
 class TranslationTab(QWidget):
@@ -2,9 +2,12 @@ import os
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit,
                                QComboBox, QPushButton, QMessageBox, QGroupBox)
 
-# 尝试导入实际的功能模块
+from tools.lazy import lazy_function
+
+# 功能模块在第一次调用时才导入，避免拖慢界面启动
+generate_all_wavs_under_folder = lazy_function('tools.step040_tts', 'generate_all_wavs_under_folder')
+
 try:
-    from tools.step040_tts import generate_all_wavs_under_folder
     from tools.utils import SUPPORT_VOICE
 except ImportError:
     # 定义临时的支持语音列表
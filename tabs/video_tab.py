@@ -5,11 +5,10 @@ from PySide6.QtWidgets import (QWidget, QVBoxLayout, QLabel, QLineEdit,
 from ui_components import (FloatSlider, CustomSlider, RadioButtonGroup,
                            AudioSelector, VideoPlayer)
 
-# 尝试导入实际的功能模块
-try:
-    from tools.step050_synthesize_video import synthesize_all_video_under_folder
-except ImportError:
-    pass
+from tools.lazy import lazy_function
+
+# 功能模块在第一次调用时才导入，避免拖慢界面启动
+synthesize_all_video_under_folder = lazy_function('tools.step050_synthesize_video', 'synthesize_all_video_under_folder')
 
 
 class SynthesizeVideoTab(QWidget):
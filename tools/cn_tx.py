@@ -15,6 +15,7 @@ import argparse
 import string
 import re
 import csv
+import functools
 
 # ================================================================================ #
 #                                    basic constant
@@ -1084,6 +1085,10 @@ def remove_space(text):
 
 
 class TextNorm:
+    # 可被子类替换的规范化步骤
+    erhua_fn = staticmethod(remove_erhua)
+    nsw_fn = staticmethod(normalize_nsw)
+
     def __init__(self,
                  to_banjiao: bool = False,
                  to_upper: bool = False,
@@ -1125,9 +1130,9 @@ class TextNorm:
                 text = text.replace(c, '')
 
         if self.remove_erhua:
-            text = remove_erhua(text)
+            text = self.erhua_fn(text)
 
-        text = normalize_nsw(text)
+        text = self.nsw_fn(text)
 
         # text = text.translate(PUNCS_TRANSFORM)
 
@@ -1144,6 +1149,132 @@ class TextNorm:
         return text
 
 
+# ================================================================================ #
+#                      compiled single-pass normalizer
+# ================================================================================ #
+# normalize_nsw 每次调用都会重新编译约十个正则，逐类依次扫描，并对整串做 str.replace。
+# 这里把各类规则合并为一个预编译的分词正则，一次扫描，按命中的类别分派到对应的转换器。
+# 类别在同一位置的优先级与 normalize_nsw 的处理顺序一致。
+_NSW_DATE = r"(?:(?:[089]\d|(?:19|20)\d{2})年(?:\d{1,2}月(?:\d{1,2}[日号])?)?|\d{1,2}月(?:\d{1,2}[日号])?)"
+_NSW_RULES = (
+    ('date', r"(?<=\D)(?P<date>" + _NSW_DATE + r")"),
+    ('money', r"(?<=\D)(?P<money>\d+(?:\.\d+)?[多余几]?" + CURRENCY_UNITS + r"(?:\d" + CURRENCY_UNITS + r"?)?)"),
+    ('mobile', r"(?<=\D)(?P<mobile>(?:\+?86 ?)?1(?:[38]\d|5[0-35-9]|7[678]|9[89])\d{8})(?=\D)"),
+    ('fixed', r"(?<=\D)(?P<fixed>(?:0(?:10|2[1-3]|[3-9]\d{2})-?)?[1-9]\d{6,7})(?=\D)"),
+    ('fraction', r"(?P<fraction>\d+/\d+)"),
+    ('percentage', r"(?P<percentage>\d+(?:\.\d+)?%)"),
+    ('quantifier', r"(?P<quantifier>\d+(?:\.\d+)?)(?=[多余几]?" + COM_QUANTIFIERS + r")"),
+    ('digit', r"(?P<digit>\d{4,32})"),
+    # 小数部分不少于 4 位时，normalize_nsw 会先按数字编号读小数部分，这里保持一致
+    ('cardinal', r"(?P<cardinal>\d+(?:\.\d{1,3}(?!\d))?)"),
+)
+_NSW_KINDS = tuple(kind for kind, _ in _NSW_RULES)
+# normalize_nsw 中这些规则会吃掉匹配前（date/money）或前后（mobile/fixed）的非数字字符，
+# 因此同类匹配之间至少要隔开 1 个（或 2 个）字符
+_NSW_GAPS = {'date': 0, 'money': 0, 'mobile': 1, 'fixed': 1}
+_DIGIT_PATTERN = re.compile(r"\d")
+_PARTICULAR_PATTERN = re.compile(r"([a-zA-Z]+)二([a-zA-Z]+)")
+_ERHUA_PATTERN = re.compile(ER_WHITELIST + '|儿')
+
+
+@functools.lru_cache(maxsize=None)
+def _nsw_pattern(excluded=frozenset()):
+    return re.compile(r"(?=[\d+])(?:" + '|'.join(rule for kind, rule in _NSW_RULES if kind not in excluded) + r")")
+
+
+@functools.lru_cache(maxsize=65536)
+def _rewrite_nsw(kind, token):
+    if kind == 'date':
+        return Date(date=token).date2chntext()
+    if kind == 'money':
+        return Money(money=token).money2chntext()
+    if kind == 'mobile':
+        return TelePhone(telephone=token).telephone2chntext()
+    if kind == 'fixed':
+        return TelePhone(telephone=token).telephone2chntext(fixed=True)
+    if kind == 'fraction':
+        return Fraction(fraction=token).fraction2chntext()
+    if kind == 'percentage':
+        return Percentage(percentage=token).percentage2chntext()
+    if kind == 'digit':
+        return Digit(digit=token).digit2chntext()
+    return Cardinal(cardinal=token).cardinal2chntext()
+
+
+def _match_kind(match):
+    groups = match.groupdict()
+    for kind in _NSW_KINDS:
+        if groups.get(kind) is not None:
+            return kind
+
+
+def _scan_nsw(text):
+    pieces, pos = [], 0
+    last_end = {}
+    pattern = _nsw_pattern()
+    while True:
+        match = pattern.search(text, pos)
+        if match is None:
+            break
+        start = match.start()
+        kind = _match_kind(match)
+        excluded = set()
+        while kind in _NSW_GAPS and start <= last_end.get(kind, -2) + _NSW_GAPS[kind]:
+            # 与上一个同类匹配贴得太近，换用下一优先级的规则
+            excluded.add(kind)
+            match = _nsw_pattern(frozenset(excluded)).match(text, start)
+            kind = _match_kind(match) if match else None
+        if match is None:
+            pieces.append(text[pos:start + 1])
+            pos = start + 1
+            continue
+        pieces.append(text[pos:start])
+        pieces.append(_rewrite_nsw(kind, match.group(kind)))
+        pos = last_end[kind] = match.end()
+    pieces.append(text[pos:])
+    return ''.join(pieces)
+
+
+def normalize_nsw_compiled(raw_text):
+    """
+    normalize_nsw 的单次扫描版本
+
+    与 normalize_nsw 的区别：每个匹配在原位置替换，而不是替换整串中第一次出现的相同子串
+    """
+    text = raw_text.replace('％', '%')
+    if _DIGIT_PATTERN.search(text):
+        text = _scan_nsw('^' + text + '$')
+    if '二' in text:
+        text = _PARTICULAR_PATTERN.sub(lambda m: m.group(1) + '2' + m.group(2), text)
+    return text.lstrip('^').rstrip('$')
+
+
+def remove_erhua_compiled(text):
+    """remove_erhua 的单次扫描版本：白名单词原样保留，其余的“儿”删除"""
+    if '儿' not in text:
+        return text
+    return _ERHUA_PATTERN.sub(lambda m: m.group(0) if m.group(1) else '', text)
+
+
+class CompiledTextNorm(TextNorm):
+    """
+    预编译、单次扫描的 TextNorm，带整行 LRU 缓存和批量接口
+    """
+    erhua_fn = staticmethod(remove_erhua_compiled)
+    nsw_fn = staticmethod(normalize_nsw_compiled)
+
+    def __init__(self, *args, cache_size=16384, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cached_call = functools.lru_cache(maxsize=cache_size)(super().__call__)
+
+    def __call__(self, text):
+        return self._cached_call(text)
+
+    def normalize_batch(self, texts):
+        """批量规范化整篇文本，重复的行只计算一次"""
+        return [self(text) for text in texts]
+
+
 if __name__ == '__main__':
     p = argparse.ArgumentParser()
 
@@ -6,8 +6,10 @@ import shutil  # <--- 新增这一行
 
 import torch
 from loguru import logger
-from .step000_video_downloader import get_info_list_from_url, download_single_video, get_target_folder
-from .step010_demucs_vr import separate_all_audio_under_folder, init_demucs, load_model, release_model
+from .step000_video_downloader import get_info_list_from_url, download_single_video, get_target_folder, \
+    DownloadManager
+from .step010_demucs_vr import separate_all_audio_under_folder, init_demucs, load_model, release_model, \
+    prefetch_separation, use_process_pool
 from .step020_asr import transcribe_all_audio_under_folder
 from .step021_asr_whisperx import init_whisperx, init_diarize
 from .step022_asr_funasr import init_funasr
@@ -42,10 +44,11 @@ def get_available_gpu_memory():
         return 0  # 出错时返回0
 
 
-def initialize_models(tts_method, asr_method, diarization):
+def initialize_models(tts_method, asr_method, diarization, demucs_model='htdemucs_ft', device='auto'):
     """
     初始化所需的模型。
     只在第一次调用时初始化模型，避免重复加载。
+    Demucs 以常驻服务的形式加载，之后每个视频的分离任务都复用同一份模型。
     """
     # 使用全局状态跟踪已初始化的模型
     global models_initialized
@@ -54,7 +57,7 @@ def initialize_models(tts_method, asr_method, diarization):
         try:
             # Demucs模型初始化
             if not models_initialized['demucs']:
-                executor.submit(init_demucs)
+                executor.submit(init_demucs, demucs_model, device)
                 models_initialized['demucs'] = True
                 logger.info("Demucs模型初始化完成")
             else:
@@ -160,29 +163,17 @@ def process_video(info, root_folder, resolution,
                 progress_callback(progress_base, stage_name)
 
             try:
-                # 在调用 Demucs 前，加上这个判断：
-                vocals_path = os.path.join(folder, "audio_vocals.wav")
-                if os.path.exists(vocals_path):
-                    logger.info(f"⏭️ 已检测到纯人声文件 {vocals_path}，跳过 Demucs 音频分离。")
-                    vocals_path = vocals_path  # 保持变量一致
-                else:
-                    # 这里放原本的 Demucs 分离代码
-                    logger.info(f"▶️ 准备分离音频: 文件夹={folder}")
-                    status, vocals_path, _ = separate_all_audio_under_folder(
-                        folder, model_name=demucs_model, device=device, progress=True, shifts=shifts)
-                    logger.info(f'人声分离完成: {vocals_path}')
-                
-                # ==========================================
-                # 桥接修复：确保ASR能找到分离出的人声文件
-                # ==========================================
-                if vocals_path and os.path.exists(vocals_path):
-                    # 创建安全的人声文件路径（在根目录下）
-                    safe_vocals_path = os.path.join(folder, "audio_vocals.wav")
-                    if os.path.abspath(vocals_path) != os.path.abspath(safe_vocals_path):
-                        import shutil
-                        shutil.copy(vocals_path, safe_vocals_path)
-                        print(f"🔗 [桥接修复] 已将纯人声复制到根目录供 ASR 识别: {safe_vocals_path}")
-                else:
+                # 已有分离结果时由 separate_all_audio_under_folder 跳过；提前提交到进程池的任务也在其中等待完成
+                separation_callback = None
+                if progress_callback:
+                    separation_callback = (lambda fraction, base=progress_base, weight=stage_weight, name=stage_name:
+                                           progress_callback(base + weight * fraction, name))
+                status, vocals_path, _ = separate_all_audio_under_folder(
+                    folder, model_name=demucs_model, device=device, progress=True, shifts=shifts,
+                    callback=separation_callback)
+                logger.info(f'人声分离完成: {vocals_path}')
+
+                if not vocals_path or not os.path.exists(vocals_path):
                     logger.error(f"❌ 找不到分离出的人声，无法进行识别！路径: {vocals_path}")
                     return False, None, "人声分离文件不存在"
             except Exception as e:
@@ -323,7 +314,7 @@ def do_everything(root_folder, url, num_videos=5, resolution='1080p',
         try:
             if progress_callback:
                 progress_callback(5, "初始化模型中...")
-            initialize_models(tts_method, asr_method, diarization)
+            initialize_models(tts_method, asr_method, diarization, demucs_model, device)
         except Exception as e:
             stack_trace = traceback.format_exc()
             logger.error(f"初始化模型失败: {str(e)}\n{stack_trace}")
@@ -386,18 +377,23 @@ def do_everything(root_folder, url, num_videos=5, resolution='1080p',
                 return f'处理失败: {error_msg}', None
         else:
             try:
-                videos_info = []
                 if progress_callback:
                     progress_callback(10, "获取视频信息中...")
 
-                for video_info in get_info_list_from_url(urls, num_videos):
-                    videos_info.append(video_info)
+                on_downloaded = None
+                if use_process_pool(device):
+                    # 多进程分离开启时，每下载完一个视频就把分离任务提交给进程池，多个视频的分离并行进行
+                    on_downloaded = lambda folder: prefetch_separation(folder, demucs_model, device, shifts)
+                downloader = DownloadManager(root_folder, resolution, on_downloaded=on_downloaded)
 
-                if not videos_info:
-                    return "获取视频信息失败，请检查URL是否正确", None
-
-                for info in videos_info:
+                # 视频信息边解析边下载，按下载完成的顺序处理：第一个视频下载完就开始处理，其余的继续在后台下载
+                num_processed = 0
+                for info, _, download_error in downloader.run(get_info_list_from_url(urls, num_videos)):
+                    num_processed += 1
                     try:
+                        if download_error is not None:
+                            # 后台下载失败时由 process_video 重试
+                            logger.warning(f"后台下载失败，将重试: {download_error}")
                         success, output_video, error_msg = process_video(
                             info, root_folder, resolution,
                             demucs_model, device, shifts,
@@ -424,6 +420,9 @@ def do_everything(root_folder, url, num_videos=5, resolution='1080p',
                         error_details.append(f"{info['title'] if isinstance(info, dict) else info}: {str(e)}")
                         logger.error(
                             f"处理视频出错: {info['title'] if isinstance(info, dict) else info}, 错误: {str(e)}\n{stack_trace}")
+
+                if not num_processed:
+                    return "获取视频信息失败，请检查URL是否正确", None
             except Exception as e:
                 stack_trace = traceback.format_exc()
                 logger.error(f"获取视频列表失败: {str(e)}\n{stack_trace}")
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+配音时长规划
+
+合成之前估计每句译文的自然时长（按音色学习的 秒/音节 模型），再按时间线上的空位算出语速，
+直接交给支持变速的引擎（XTTS 的 speed、Edge-TTS 的 rate），让合成结果本身就接近目标时长，
+事后的 audiostretchy 变速只作为偏差较大时的兜底。
+
+模型以 {方法: {音色: {seconds, units}}} 的形式保存在 SPEECH_RATE_PATH，每次合成后用实际时长更新，
+后续视频直接沿用；没有数据的音色退回同一方法的整体统计，再退回默认语速。
+"""
+import json
+import os
+import re
+import threading
+
+from loguru import logger
+
+SPEECH_RATE_PATH = os.getenv('SPEECH_RATE_PATH', 'models/speech_rate.json')
+
+# 中日韩字符按一个音节计，其余字母数字约 3 个算一个音节
+_CJK_PATTERN = re.compile(r'[⺀-鿿가-힯豈-﫿]')
+_WORD_CHAR_PATTERN = re.compile(r'\w')
+LATIN_UNIT_WEIGHT = 0.3
+# 没有任何统计时的默认语速（秒 / 音节），约为每秒 4.5 个汉字
+DEFAULT_SECONDS_PER_UNIT = 0.22
+# 先验相当于多少个音节的观测，观测越多越相信学到的语速
+PRIOR_UNITS = 50
+# 每个音色最多保留的观测量，超出后按比例衰减，使模型跟随最近的输出
+MAX_UNITS = 5000
+
+# 与 adjust_audio_length 一致：时长系数（目标 / 自然）限制在 [0.6, 1.1]，即语速在 [1/1.1, 1/0.6]
+MIN_SPEED_FACTOR = 0.6
+MAX_SPEED_FACTOR = 1.1
+
+
+def speech_units(text):
+    """文本的音节数估计"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    other = len(_WORD_CHAR_PATTERN.findall(text)) - cjk
+    return max(cjk + LATIN_UNIT_WEIGHT * other, 1.)
+
+
+class SpeechRateModel:
+    """按 (方法, 音色) 学习的 秒/音节 模型"""
+
+    def __init__(self, path=SPEECH_RATE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stats = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.stats = json.load(f)
+            except Exception as e:
+                logger.warning(f'语速模型读取失败，重新学习: {path} {e}')
+
+    def seconds_per_unit(self, method, voice):
+        with self.lock:
+            method_stats = self.stats.get(method, {})
+            overall = method_stats.get('_all', {'seconds': 0., 'units': 0.})
+            fallback = (overall['seconds'] + PRIOR_UNITS * DEFAULT_SECONDS_PER_UNIT) / (overall['units'] + PRIOR_UNITS)
+            stats = method_stats.get(voice, {'seconds': 0., 'units': 0.})
+            return (stats['seconds'] + PRIOR_UNITS * fallback) / (stats['units'] + PRIOR_UNITS)
+
+    def estimate(self, method, voice, text):
+        """不变速时的自然时长（秒）"""
+        return speech_units(text) * self.seconds_per_unit(method, voice)
+
+    def observe(self, method, voice, text, natural_seconds):
+        """记录一句的实际自然时长（输出时长 x 语速）"""
+        units = speech_units(text)
+        with self.lock:
+            method_stats = self.stats.setdefault(method, {})
+            for key in ('_all', voice):
+                stats = method_stats.setdefault(key, {'seconds': 0., 'units': 0.})
+                stats['seconds'] += natural_seconds
+                stats['units'] += units
+                if stats['units'] > MAX_UNITS:
+                    scale = MAX_UNITS / stats['units']
+                    stats['seconds'] *= scale
+                    stats['units'] *= scale
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self.lock:
+            with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(self.stats, f, indent=2, ensure_ascii=False)
+        os.replace(self.path + '.tmp', self.path)
+
+
+def plan_speed(natural_seconds, desired_seconds, min_speed_factor=MIN_SPEED_FACTOR, max_speed_factor=MAX_SPEED_FACTOR):
+    """让自然时长落进目标时长所需的语速（> 1 加快），范围与事后变速相同"""
+    if desired_seconds <= 0 or natural_seconds <= 0:
+        return 1.
+    factor = max(min(desired_seconds / natural_seconds, max_speed_factor), min_speed_factor)
+    return 1 / factor
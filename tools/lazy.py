@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+延迟导入
+
+webui.py / gui.py 启动时只需要各步骤入口函数的名字，用不到 torch、whisperx、librosa、各家翻译 SDK 等重依赖。
+lazy_function 返回一个同名的包装函数，第一次调用时才导入所在模块（并记录导入耗时），之后直接转发，
+这样界面可以立刻出现，每个步骤的依赖在第一次用到时才加载。
+
+启动耗时可以用 scripts/import_time_report.py 检查。
+"""
+import functools
+import importlib
+import sys
+import time
+
+from loguru import logger
+
+
+def import_module(module_name):
+    """导入模块，第一次导入时记录耗时"""
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    t_start = time.time()
+    module = importlib.import_module(module_name)
+    logger.info(f'导入 {module_name} 耗时 {time.time() - t_start:.2f}s')
+    return module
+
+
+def lazy_function(module_name, function_name):
+    """
+    返回 module_name.function_name 的延迟版本
+
+    包装函数与原函数同名，调用时才导入模块；导入失败（依赖未安装）的异常在调用时抛出，不影响界面启动。
+    """
+    target = None
+
+    def wrapper(*args, **kwargs):
+        nonlocal target
+        if target is None:
+            target = getattr(import_module(module_name), function_name)
+            functools.update_wrapper(wrapper, target)
+        return target(*args, **kwargs)
+
+    wrapper.__name__ = wrapper.__qualname__ = function_name
+    wrapper.__module__ = module_name
+    return wrapper
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+翻译 / 总结提示词的 token 预算管理
+
+- count_tokens: 使用本地分词器（tiktoken，可选依赖）统计 token 数，不可用时退化为字符估算
+- PromptBuilder: 按模型上下文预算打包 总结 / 术语表 / 历史对话 / 当前句子
+- TokenUsage: 统计单个视频的 token 消耗（及重试等运行指标），并写入 token_usage.json
+"""
+import json
+import math
+import os
+import re
+import threading
+
+from loguru import logger
+
+# 各模型的上下文窗口（token），按名称子串匹配，靠前的条目优先
+MODEL_CONTEXT_WINDOWS = {
+    # Ollama 默认 num_ctx 为 2048，超出部分会被静默截断
+    'ollama': 2048,
+    'gpt-4o': 128000,
+    'gpt-4-turbo': 128000,
+    'gpt-4': 8192,
+    'gpt-3.5-turbo': 16385,
+    'deepseek': 64000,
+    'qwen1.5-4b': 32768,
+    'qwen': 131072,
+    'ernie-speed-128k': 128000,
+    'ernie': 8192,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# 不同用途的提示词上限，避免仅仅因为模型窗口大就塞满整段历史
+PURPOSE_TOKEN_BUDGETS = {
+    'summarize': int(os.getenv('SUMMARY_TOKEN_BUDGET', 12000)),
+    'translate': int(os.getenv('TRANSLATE_TOKEN_BUDGET', 3000)),
+}
+
+# 为模型回复预留的 token 数
+COMPLETION_RESERVE = {
+    'summarize': 1024,
+    'translate': 256,
+}
+
+# OpenAI 聊天格式中每条消息的固定开销
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+
+_CJK_PATTERN = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+
+_encoder = None
+_encoder_loaded = False
+
+
+def _get_encoder():
+    global _encoder, _encoder_loaded
+    if _encoder_loaded:
+        return _encoder
+    _encoder_loaded = True
+    try:
+        import tiktoken
+        _encoder = tiktoken.get_encoding(os.getenv('TOKENIZER_ENCODING', 'cl100k_base'))
+    except Exception as e:
+        logger.info(f'tiktoken 不可用，使用字符估算 token 数: {e}')
+        _encoder = None
+    return _encoder
+
+
+def count_tokens(text):
+    """统计文本的 token 数"""
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    # 估算：中日韩字符约 1 token/字，其余约 4 字符/token
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def count_message_tokens(messages):
+    """统计聊天消息列表的 token 数"""
+    return sum(count_tokens(m['content']) + MESSAGE_OVERHEAD for m in messages) + REPLY_OVERHEAD
+
+
+def resolve_model_name(method):
+    """根据翻译方法推断实际使用的模型名称"""
+    if method == 'OpenAI':
+        return os.getenv('MODEL_NAME', 'gpt-3.5-turbo')
+    if method == 'Ernie':
+        return 'ernie-speed-128k'
+    if method == 'Ollama':
+        return f"ollama/{os.getenv('OLLAMA_MODEL', 'qwen2.5:14b')}"
+    if method in ['LLM', '阿里云-通义千问']:
+        try:
+            from tools.step035_translation_qwen import get_llm_api_config
+            return get_llm_api_config()[2]
+        except Exception:
+            return 'qwen'
+    return method
+
+
+def get_context_window(model_name):
+    model_name = model_name.lower()
+    for key, window in MODEL_CONTEXT_WINDOWS.items():
+        if key in model_name:
+            return window
+    return DEFAULT_CONTEXT_WINDOW
+
+
+def get_token_budget(model_name, purpose='translate'):
+    """
+    计算某个模型在某种用途下可用于提示词的 token 数
+
+    优先级：环境变量 PROMPT_TOKEN_BUDGET > min(模型窗口 - 回复预留, 用途上限)
+    """
+    if os.getenv('PROMPT_TOKEN_BUDGET'):
+        return int(os.getenv('PROMPT_TOKEN_BUDGET'))
+    window = get_context_window(model_name) - COMPLETION_RESERVE.get(purpose, 512)
+    return max(256, min(window, PURPOSE_TOKEN_BUDGETS.get(purpose, window)))
+
+
+def truncate_to_tokens(text, max_tokens, keep='both'):
+    """
+    将文本截断到 max_tokens 以内
+
+    keep='both' 时保留首尾两部分（与原 ensure_transcript_length 行为一致），keep='head' 时只保留开头
+    """
+    total = count_tokens(text)
+    if total <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ''
+    # 先按比例估算字符数，再逐步收缩直到满足预算
+    chars = int(len(text) * max_tokens / total)
+    while chars > 0:
+        if keep == 'head':
+            candidate = text[:chars]
+        else:
+            half = chars // 2
+            candidate = text[:half] + ' ... ' + text[len(text) - (chars - half):]
+        if count_tokens(candidate) <= max_tokens:
+            return candidate
+        chars = int(chars * 0.9)
+    return ''
+
+
+class TokenUsage:
+    """单个视频的 token 消耗统计"""
+
+    def __init__(self):
+        self.stages = {}
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage, messages, response):
+        prompt_tokens = count_message_tokens(messages)
+        completion_tokens = count_tokens(response or '')
+        with self.lock:
+            stats = self.stages.setdefault(stage, {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0})
+            stats['calls'] += 1
+            stats['prompt_tokens'] += prompt_tokens
+            stats['completion_tokens'] += completion_tokens
+
+    def set_metric(self, name, value):
+        """记录与 token 无关的运行指标，例如翻译重试统计"""
+        with self.lock:
+            self.metrics[name] = value
+
+    def as_dict(self):
+        total = {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+        for stats in self.stages.values():
+            for key in total:
+                total[key] += stats[key]
+        report = {'stages': self.stages, 'total': total}
+        if self.metrics:
+            report['metrics'] = self.metrics
+        return report
+
+    def save(self, folder):
+        report = self.as_dict()
+        total = report['total']
+        logger.info(f'Token 消耗: 调用 {total["calls"]} 次, '
+                    f'提示 {total["prompt_tokens"]} tokens, 回复 {total["completion_tokens"]} tokens')
+        with open(os.path.join(folder, 'token_usage.json'), 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        return report
+
+
+class PromptBuilder:
+    """
+    在 token 预算内打包翻译 / 总结提示词
+
+    打包优先级：当前句子 > 系统提示（含视频总结）> 术语表 > 最近的历史对话
+    """
+
+    def __init__(self, method, purpose='translate', budget=None, max_history=30):
+        self.model_name = resolve_model_name(method)
+        self.budget = budget or get_token_budget(self.model_name, purpose)
+        self.max_history = max_history
+        logger.info(f'提示词预算: 模型={self.model_name}, 用途={purpose}, {self.budget} tokens')
+
+    def fit_summary(self, summary_text, share=0.25):
+        """视频总结最多占用预算的 share 比例"""
+        return truncate_to_tokens(summary_text, int(self.budget * share), keep='head')
+
+    def format_glossary(self, glossary, share=0.15):
+        """将术语表格式化为提示文本，超出预算的条目会被丢弃"""
+        if not glossary:
+            return ''
+        budget = int(self.budget * share)
+        lines = ['术语表（Glossary）：']
+        used = count_tokens(lines[0])
+        for source, target in glossary.items():
+            line = f'- {source} -> {target}'
+            cost = count_tokens(line) + 1
+            if used + cost > budget:
+                logger.warning(f'术语表超出预算，仅保留 {len(lines) - 1}/{len(glossary)} 条')
+                break
+            lines.append(line)
+            used += cost
+        return '\n'.join(lines) if len(lines) > 1 else ''
+
+    def pack_history(self, history, available):
+        """从最近的对话开始，按 (user, assistant) 成对装入剩余预算"""
+        packed = []
+        history = history[-self.max_history:] if self.max_history else history
+        for i in range(len(history) - 2, -1, -2):
+            pair = history[i:i + 2]
+            cost = sum(count_tokens(m['content']) + MESSAGE_OVERHEAD for m in pair)
+            if cost > available:
+                break
+            packed = pair + packed
+            available -= cost
+        return packed
+
+    def build(self, fixed_message, history, current):
+        """
+        组装最终消息列表
+
+        fixed_message: 系统提示 + few-shot 示例（必须保留）
+        history: 历史对话，成对出现
+        current: 当前需要翻译的用户消息
+        """
+        messages = list(fixed_message)
+        required = count_message_tokens(messages + [current])
+        if required > self.budget:
+            # 单句过长时也要发出请求，由调用方处理可能的报错
+            logger.warning(f'当前句子超出提示词预算: {required} > {self.budget} tokens')
+            return messages + [current]
+        return messages + self.pack_history(history, self.budget - required) + [current]
@@ -1,8 +1,19 @@
 import os
+import queue
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from loguru import logger
 import yt_dlp
 import json
+
+# 同时下载的视频数
+DOWNLOAD_CONCURRENCY = int(os.getenv('DOWNLOAD_CONCURRENCY', 3))
+# 播放列表中同时解析详细信息的视频数
+DOWNLOAD_INFO_CONCURRENCY = int(os.getenv('DOWNLOAD_INFO_CONCURRENCY', 4))
+# 所有下载合计的带宽上限（MB/s），平均分给同时进行的下载，0 表示不限
+DOWNLOAD_RATE_LIMIT = float(os.getenv('DOWNLOAD_RATE_LIMIT', 0))
+
 def sanitize_title(title):
     # Only keep numbers, letters, Chinese characters, and spaces
     title = re.sub(r'[^\w\u4e00-\u9fff \d_-]', '', title)
@@ -23,7 +34,7 @@ def get_target_folder(info, folder_path):
 
     return output_folder
 
-def download_single_video(info, folder_path, resolution='1080p'):
+def download_single_video(info, folder_path, resolution='1080p', ratelimit=None):
     sanitized_title = sanitize_title(info['title'])
     sanitized_uploader = sanitize_title(info.get('uploader', 'Unknown'))
     upload_date = info.get('upload_date', 'Unknown')
@@ -46,6 +57,7 @@ def download_single_video(info, folder_path, resolution='1080p'):
         'cookiefile' : 'cookies.txt' if os.path.exists("cookies.txt") else None, # 得到cookies yt-dlp --cookies-from-browser chrome --cookies cookies.txt
         # 'cookiesfrombrowser': ('chrome', ), # 从chrome浏览器中获取cookie 
         # 'cookiesfrombrowser': ('firefox', 'default', None, 'Meta') # 从firefox浏览器中获取cookie
+        'ratelimit': ratelimit,  # 字节/秒，None 表示不限
     }
 
     with yt_dlp.YoutubeDL(ydl_opts) as ydl:
@@ -58,66 +70,147 @@ def download_videos(info_list, folder_path, resolution='1080p'):
         output_folder = download_single_video(info, folder_path, resolution)
     return output_folder
 
-def get_info_list_from_url(url, num_videos):
+def _extract_info(url, ydl_opts, ie_key=None):
+    # YoutubeDL 不是线程安全的，每个任务单独创建
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        return ydl.extract_info(url, download=False, ie_key=ie_key)
+
+
+def get_info_list_from_url(url, num_videos, max_workers=DOWNLOAD_INFO_CONCURRENCY):
+    """
+    解析 URL（视频、播放列表或频道）中的视频信息
+
+    播放列表先用 extract_flat 只列出条目，再在线程池中并发解析每个视频的详细信息，
+    按解析完成的顺序逐个返回，调用方不必等整个列表解析完就能开始下载。
+    """
     if isinstance(url, str):
         url = [url]
 
-    # Download JSON information first
-    ydl_opts = {
-        # 'format': 'b',
-        'None': "b",
-        'dumpjson': True,
+    flat_opts = {
+        'extract_flat': 'in_playlist',
+        'playlistend': num_videos,
+        'ignoreerrors': True
+    }
+    entry_opts = {
         'playlistend': num_videos,
         'ignoreerrors': True
     }
 
-    # video_info_list = []
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = []
         for u in url:
-            result = ydl.extract_info(u, download=False)
-            if 'entries' in result:
-                # Playlist
-                # video_info_list.extend(result['entries'])
-                for video_info in result['entries']:
-                    yield video_info
-            else:
+            result = _extract_info(u, flat_opts)
+            if not result:
+                logger.warning(f'无法获取视频信息: {u}')
+                continue
+            if 'entries' not in result:
                 # Single video
-                # video_info_list.append(result)
                 yield result
+                continue
+            # Playlist
+            for entry in result['entries']:
+                if entry:
+                    futures.append(executor.submit(_extract_info, entry.get('url') or entry.get('webpage_url'),
+                                                   entry_opts, entry.get('ie_key')))
+
+        for future in as_completed(futures):
+            try:
+                video_info = future.result()
+            except Exception as e:
+                logger.warning(f'解析视频信息失败: {e}')
+                continue
+            if not video_info:
+                continue
+            if 'entries' in video_info:
+                # 嵌套的播放列表（例如频道的分栏、多P视频）
+                for entry in video_info['entries']:
+                    if entry:
+                        yield entry
+            else:
+                yield video_info
+
+
+class DownloadManager:
+    """
+    并发下载管理器
+
+    最多 concurrency 个视频同时下载，rate_limit（MB/s）为所有下载合计的带宽上限。
+    run 边接收视频信息边提交下载，按下载完成的顺序返回，第一个视频下载完就可以开始处理，其余的继续在后台下载。
+    on_downloaded(folder) 在下载线程中调用，例如把人声分离提前提交给进程池。
+    """
+
+    def __init__(self, folder_path, resolution='1080p', concurrency=DOWNLOAD_CONCURRENCY,
+                 rate_limit=DOWNLOAD_RATE_LIMIT, on_downloaded=None):
+        self.folder_path = folder_path
+        self.resolution = resolution
+        self.concurrency = max(1, concurrency)
+        self.ratelimit = int(rate_limit * 1024 * 1024 / self.concurrency) if rate_limit > 0 else None
+        self.on_downloaded = on_downloaded
+
+    def download(self, info):
+        folder = download_single_video(info, self.folder_path, self.resolution, ratelimit=self.ratelimit)
+        if folder is not None and self.on_downloaded is not None:
+            self.on_downloaded(folder)
+        return folder
+
+    def run(self, info_list):
+        """
+        下载 info_list（可以是生成器）中的所有视频
+
+        返回:
+            生成器，按完成顺序给出 (视频信息, 输出文件夹, 异常)；下载失败时文件夹为 None、异常为失败原因
+        """
+        results = queue.Queue()
+        stopped = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+
+        def feed():
+            submitted, error = 0, None
+            try:
+                for info in info_list:
+                    if stopped.is_set():
+                        break
+                    future = executor.submit(self.download, info)
+                    future.add_done_callback(lambda f, info=info: results.put((info, f)))
+                    submitted += 1
+            except Exception as e:
+                error = e
+            results.put((None, (submitted, error)))
+
+        threading.Thread(target=feed, daemon=True).start()
+        submitted, feed_error, received = None, None, 0
+        try:
+            while submitted is None or received < submitted:
+                info, item = results.get()
+                if info is None:
+                    submitted, feed_error = item
+                    continue
+                received += 1
+                try:
+                    yield info, item.result(), None
+                except Exception as e:
+                    logger.warning(f'下载视频失败: {info.get("title")}: {e}')
+                    yield info, None, e
+            if feed_error is not None:
+                raise feed_error
+        finally:
+            stopped.set()
+            executor.shutdown(wait=False, cancel_futures=True)
 
-    # return video_info_list
 
 def download_from_url(url, folder_path, resolution='1080p', num_videos=5):
     resolution = resolution.replace('p', '')
     if isinstance(url, str):
         url = [url]
 
-    # Download JSON information first
-    ydl_opts = {
-        # 'format': 'b',
-        "None":"b",
-        'dumpjson': True,
-        'playlistend': num_videos,
-        'ignoreerrors': True,
-        'cookies-from-browser': 'chrome'
-    }
-
-    video_info_list = []
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        for u in url:
-            result = ydl.extract_info(u, download=False)
-            # print(result)
-       
-
-            if 'entries' in result:
-                # Playlist
-                video_info_list.extend(result['entries'])
-            else:
-                # Single video
-                video_info_list.append(result)
-        
-    # Now download videos with sanitized titles
-    example_output_folder = download_videos(video_info_list, folder_path, resolution)
+    # 边解析视频信息边并发下载，返回最后一个下载完成的视频
+    example_output_folder = None
+    for _, output_folder, _ in DownloadManager(folder_path, resolution).run(get_info_list_from_url(url, num_videos)):
+        if output_folder is not None:
+            example_output_folder = output_folder
+    if example_output_folder is None:
+        return "No video was downloaded, please check the URL", None, None
+    download_info_json = None
     if os.path.exists(os.path.join(example_output_folder, 'download.info.json')):
         download_info_json = json.load(open(os.path.join(example_output_folder, 'download.info.json'), 'r', encoding='utf-8'))
     return f"All videos have been downloaded under the {folder_path} folder", os.path.join(example_output_folder, 'download.mp4'), download_info_json
@@ -1,88 +1,820 @@
+import collections
+import json
+import multiprocessing
+import multiprocessing.connection
 import os
-import subprocess
-import shutil
+import queue
+import threading
+import time
+import wave
+from concurrent.futures import Future
+
 import torch
+import torch.multiprocessing
+from loguru import logger
+
+from .memory_utils import clear_memory
+from .speech_scan import find_speech_spans, skipped_fraction
+
+# 每次前向计算堆叠的片段数，0 表示按可用内存自动选择
+DEMUCS_BATCH_SIZE = int(os.getenv('DEMUCS_BATCH_SIZE', 0))
+# 队列中同时等待的多个视频可以合并分离，片段跨视频堆叠
+DEMUCS_MAX_TRACKS = int(os.getenv('DEMUCS_MAX_TRACKS', 4))
+
+# 分离质量档位：配音只需要人声 / 伴奏两轨，多数场景不需要 5 次移位的完整集成
+SEPARATION_PROFILES = {
+    # 单个 htdemucs 模型，不做移位平均
+    'fast': {'model_name': 'htdemucs', 'shifts': 0, 'overlap': 0.1},
+    # htdemucs_ft 集成，固定的移位偏移，估计收敛后提前结束
+    'balanced': {'model_name': 'htdemucs_ft', 'shifts': 3, 'overlap': 0.25,
+                 'deterministic_shifts': True, 'shift_tolerance': 0.01},
+    # 与原默认配置相同的 5 次移位，仅在几乎没有变化时提前结束
+    'max': {'model_name': 'htdemucs_ft', 'shifts': 5, 'overlap': 0.25,
+            'deterministic_shifts': True, 'shift_tolerance': 0.002},
+}
+# 为空时沿用界面传入的模型和移位次数
+DEMUCS_PROFILE = os.getenv('DEMUCS_PROFILE', '')
+# 超过该时长（分钟）的音频按窗口流式分离，内存占用与时长无关；0 表示关闭
+DEMUCS_STREAMING_MINUTES = int(os.getenv('DEMUCS_STREAMING_MINUTES', 20))
+# 流式分离时每次从 ffmpeg 读取的音频长度（秒）
+DEMUCS_STREAMING_BLOCK_SECONDS = int(os.getenv('DEMUCS_STREAMING_BLOCK_SECONDS', 30))
+# 分离前先做语音活动扫描，跳过肯定没有人声的片段（人声为静音，伴奏为原混音）；1 为开启
+DEMUCS_SKIP_NON_SPEECH = int(os.getenv('DEMUCS_SKIP_NON_SPEECH', 0))
+# 跳过区域与分离区域之间的交叉淡化长度（秒），位于区间余量之内
+SPEECH_SPAN_FADE_SECONDS = 0.05
+# CPU 上的多进程分离：大于 1 时启动该数量的工作进程共享同一份模型权重，每个进程使用 核数/进程数 个线程；
+# 0 或 1 表示使用单进程的常驻服务
+DEMUCS_WORKERS = int(os.getenv('DEMUCS_WORKERS', 0))
+# 推理后端：fp32 为默认的 PyTorch 推理；int8 对 Transformer 的线性层和 LSTM 做动态量化，只能在 CPU 上运行
+DEMUCS_BACKEND = os.getenv('DEMUCS_BACKEND', 'fp32')
 
 # =================================================================
-# 1. 兼容性空壳函数 (接口对齐层，骗过 do_everything.py 防止报错)
+# 1. 常驻分离服务 (模型只加载一次，任务通过进程内队列提交)
 # =================================================================
 
-def init_demucs(*args, **kwargs):
-    print("💡 [Demucs 优化版] 采用 CLI 模式，跳过预初始化...")
+def get_device(device='auto', backend='fp32'):
+    if backend == 'int8':
+        return 'cpu'
+    if device != 'auto':
+        return device
+    if torch.cuda.is_available():
+        return 'cuda'
+    if torch.backends.mps.is_available():
+        return 'mps'
+    return 'cpu'
+
+
+def resolve_profile(profile=None, model_name='htdemucs_ft', shifts=5):
+    """返回 (模型名称, 分离参数)；profile 为空时使用传入的模型和移位次数"""
+    if not profile:
+        return model_name, {'shifts': shifts}
+    if profile not in SEPARATION_PROFILES:
+        raise ValueError(f'未知的分离档位: {profile}，可选 {list(SEPARATION_PROFILES)}')
+    options = dict(SEPARATION_PROFILES[profile])
+    return options.pop('model_name'), options
+
+
+class SeparationJob:
+    def __init__(self, audio, options, callback=None, outputs=None):
+        # 文件路径，或已按模型采样率加载的 [C, T] 波形
+        self.audio = audio
+        self.options = options
+        self.callback = callback
+        # 流式任务直接写入 (人声路径, 伴奏路径)，不与其他任务合并
+        self.outputs = outputs
+        self.future = Future()
+
+
+class StemWriter:
+    """逐块写入 16 位 wav；流式分离拿不到全局峰值，超出范围的采样直接截断"""
+
+    def __init__(self, path, samplerate, channels):
+        self.path = path
+        self.part_path = path + '.part'
+        self.file = wave.open(self.part_path, 'wb')
+        self.file.setnchannels(channels)
+        self.file.setsampwidth(2)
+        self.file.setframerate(samplerate)
+
+    def write(self, wav):
+        pcm = (wav.detach().cpu().clamp(-1, 1) * 32767).to(torch.int16)
+        self.file.writeframes(pcm.t().contiguous().numpy().tobytes())
+
+    def close(self, success=True):
+        self.file.close()
+        if success:
+            os.replace(self.part_path, self.path)
+        elif os.path.exists(self.part_path):
+            os.remove(self.part_path)
+
+
+def no_vocals_stem(stems):
+    no_vocals = stems.get('no_vocals')
+    if no_vocals is None:
+        no_vocals = sum(source for name, source in stems.items() if name != 'vocals')
+    return no_vocals
+
+
+def audio_duration(audio_path):
+    """用 ffprobe 读取音频时长（秒），失败时返回 None"""
+    from demucs.audio import AudioFile
+
+    try:
+        return AudioFile(audio_path).duration
+    except Exception as e:
+        logger.warning(f'[Demucs] 无法读取音频时长: {e}')
+        return None
+
+
+def notify(callback, fraction):
+    """调用调用方的进度回调；回调出错只记录日志，不影响分离任务和服务线程"""
+    if callback is None:
+        return
+    try:
+        callback(fraction)
+    except Exception as e:
+        logger.warning(f'[Demucs] 进度回调出错: {e!r}')
+
+
+def separation_fraction(info, shifts):
+    """根据 Separator 的回调信息估算分离进度（0~1）"""
+    segment = min(1.0, info['segment_offset'] / max(1, info['audio_length']))
+    return (info['model_idx_in_bag'] + (info['shift_idx'] + segment) / max(1, shifts)) / info['models']
+
+
+class DemucsService:
+    """
+    常驻的 Demucs 人声分离服务
+
+    基于 demucs.api.Separator，模型（如 htdemucs_ft 的 4 个子模型）只在创建时加载一次；
+    任务放入进程内队列，由后台线程分离，结果以张量形式通过 Future 返回。
+    队列中积压的多个任务会合并为一次批量分离，片段跨视频堆叠进同一次前向计算。
+    """
+
+    def __init__(self, model_name='htdemucs_ft', device='auto', shifts=5, progress=False,
+                 batch_size=DEMUCS_BATCH_SIZE, max_tracks=DEMUCS_MAX_TRACKS, backend=DEMUCS_BACKEND):
+        from demucs.api import Separator
+
+        self.model_name = model_name
+        self.backend = backend
+        self.device = get_device(device, backend)
+        self.shifts = shifts
+        self.max_tracks = max(1, max_tracks)
+        logger.info(f'💡 [Demucs] 加载模型 {model_name} (设备: {self.device}, 后端: {backend})...')
+        t_start = time.time()
+        self.separator = Separator(model=model_name, device=self.device, shifts=shifts, progress=progress,
+                                   batch_size=batch_size, backend=backend)
+        logger.info(f'✅ [Demucs] 模型加载完成，耗时 {time.time() - t_start:.2f}s')
+
+        self.jobs = queue.Queue()
+        self.worker = threading.Thread(target=self._run, name='demucs-service', daemon=True)
+        self.worker.start()
+
+    @property
+    def samplerate(self):
+        return self.separator.samplerate
+
+    @property
+    def sources(self):
+        return self.separator.model.sources
+
+    def load_audio(self, audio):
+        """按模型的采样率和声道数读取音频；传入张量时返回副本（分离会原地归一化）"""
+        if torch.is_tensor(audio):
+            return audio.clone()
+        return self.separator._load_audio(audio)
+
+    def submit(self, audio, shifts=None, callback=None, overlap=0.25,
+               deterministic_shifts=False, shift_tolerance=0., two_stems='vocals'):
+        """
+        提交一个分离任务
+
+        参数:
+            audio: 待分离的音频 / 视频文件，或按模型采样率加载的 [C, T] 波形
+            shifts: 本次任务的移位次数，None 表示使用服务的默认值
+            callback: 进度回调 callback(fraction)，fraction 取值 0~1
+            overlap, deterministic_shifts, shift_tolerance: 见 SEPARATION_PROFILES
+            two_stems: 只估计该音轨，另一轨为混音减去该音轨；None 表示输出全部音轨
+
+        返回:
+            Future，结果为 (原始波形, {音轨名: 波形}) 张量；two_stems='vocals' 时为 vocals / no_vocals
+        """
+        options = {
+            'shifts': self.shifts if shifts is None else shifts,
+            'overlap': overlap,
+            'deterministic_shifts': deterministic_shifts,
+            'shift_tolerance': shift_tolerance,
+            'two_stems': two_stems,
+        }
+        job = SeparationJob(audio, options, callback)
+        self.jobs.put(job)
+        return job.future
+
+    def submit_streaming(self, audio_path, vocals_path, instruments_path, shifts=None, callback=None,
+                         overlap=0.25, deterministic_shifts=False, shift_tolerance=0.):
+        """
+        提交一个流式分离任务：按窗口分离并边算边写入人声 / 伴奏文件，适合很长的音频
+
+        结果与 submit 的分片模式一致（shift_tolerance 不生效），但无法按全局峰值缩放，
+        超出 [-1, 1] 的采样会被截断。Future 的结果为 (人声路径, 伴奏路径)。
+        """
+        options = {
+            'shifts': self.shifts if shifts is None else shifts,
+            'overlap': overlap,
+            'deterministic_shifts': deterministic_shifts,
+            'two_stems': 'vocals',
+        }
+        job = SeparationJob(audio_path, options, callback, outputs=(vocals_path, instruments_path))
+        self.jobs.put(job)
+        return job.future
+
+    def separate(self, audio, shifts=None, callback=None, **options):
+        return self.submit(audio, shifts, callback, **options).result()
+
+    def _progress_hook(self, jobs, shifts):
+        last = [-1] * len(jobs)
+
+        def hook(info):
+            if info['state'] != 'end':
+                return
+            track_idx = info.get('track_idx', 0)
+            job = jobs[track_idx]
+            if job.callback is None:
+                return
+            fraction = separation_fraction(info, shifts)
+            # Separator 每个片段都会回调，按 1% 节流
+            if int(fraction * 100) > last[track_idx]:
+                last[track_idx] = int(fraction * 100)
+                notify(job.callback, min(fraction, 1.0))
+        return hook
+
+    def _next_jobs(self):
+        """取出一个任务，并顺带取出队列中分离参数相同的积压任务一起处理"""
+        job = self.jobs.get()
+        if job is None:
+            return None
+        jobs, pending = [job], []
+        while job.outputs is None and len(jobs) < self.max_tracks:
+            try:
+                other = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if other is not None and other.outputs is None and other.options == job.options:
+                jobs.append(other)
+            else:
+                pending.append(other)
+        for other in pending:
+            self.jobs.put(other)
+        return [job for job in jobs if job.future.set_running_or_notify_cancel()]
+
+    def _separate(self, jobs):
+        options = jobs[0].options
+        self.separator.update_parameter(
+            callback=self._progress_hook(jobs, options['shifts']) if any(job.callback for job in jobs) else None,
+            **options)
+        t_start = time.time()
+        if len(jobs) == 1:
+            results = [self.separator.separate_tensor(self.load_audio(jobs[0].audio), self.samplerate)]
+        else:
+            results = self.separator.separate_tensors([self.load_audio(job.audio) for job in jobs], self.samplerate)
+        logger.info(f'[Demucs] 分离完成 {len(jobs)} 个文件，耗时 {time.time() - t_start:.2f}s')
+        # 结果全部算完后再逐个交付；回退逐个重试时已经交付的任务不会被再次设置
+        for job, result in zip(jobs, results):
+            notify(job.callback, 1.0)
+            if not job.future.done():
+                job.future.set_result(result)
+
+    def _separate_streaming(self, job):
+        self.separator.update_parameter(callback=None, **job.options)
+        duration = audio_duration(job.audio)
+        total = duration * self.samplerate if duration else None
+        writers = [StemWriter(path, self.samplerate, self.separator.audio_channels) for path in job.outputs]
+        t_start, done, last = time.time(), 0, -1
+        try:
+            for wav, stems in self.separator.separate_audio_file_streaming(job.audio,
+                                                                           DEMUCS_STREAMING_BLOCK_SECONDS):
+                writers[0].write(stems['vocals'])
+                writers[1].write(no_vocals_stem(stems))
+                done += wav.shape[-1]
+                if job.callback and total and int(done / total * 100) > last:
+                    last = int(done / total * 100)
+                    notify(job.callback, min(done / total, 1.0))
+        except BaseException:
+            for writer in writers:
+                writer.close(success=False)
+            raise
+        # 伴奏先发布，人声（流水线据此判断分离是否完成）最后发布
+        for writer in reversed(writers):
+            writer.close()
+        logger.info(f'[Demucs] 流式分离完成 {done / self.samplerate:.0f}s 音频，耗时 {time.time() - t_start:.2f}s')
+        notify(job.callback, 1.0)
+        job.future.set_result(job.outputs)
+
+    def _run(self):
+        while True:
+            jobs = self._next_jobs()
+            if jobs is None:
+                break
+            try:
+                if jobs and jobs[0].outputs is not None:
+                    self._separate_streaming(jobs[0])
+                elif jobs:
+                    self._separate(jobs)
+                continue
+            except BaseException as e:
+                if len(jobs) == 1:
+                    if not jobs[0].future.done():
+                        jobs[0].future.set_exception(e)
+                    continue
+                logger.warning(f'[Demucs] 批量分离失败，改为逐个分离: {e}')
+            # 批量分离失败时逐个重试已交付之外的任务，只让出错的任务失败
+            for job in jobs:
+                if job.future.done():
+                    continue
+                try:
+                    self._separate([job])
+                except BaseException as e:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+
+    def close(self):
+        self.jobs.put(None)
+        self.worker.join()
+        del self.separator
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service(model_name='htdemucs_ft', device='auto', shifts=5, progress=False, backend=DEMUCS_BACKEND):
+    """返回常驻服务；模型、设备或推理后端变化时才重新加载"""
+    global _service
+    with _service_lock:
+        if _service is not None and (_service.model_name != model_name or _service.backend != backend
+                                     or _service.device != get_device(device, backend)):
+            logger.info(f'[Demucs] 切换模型 {_service.model_name} ({_service.backend}) -> {model_name} ({backend})')
+            _release_service()
+        if _service is None:
+            _service = DemucsService(model_name, device, shifts, progress, backend=backend)
+        return _service
+
+
+def _release_service():
+    global _service
+    if _service is not None:
+        _service.close()
+        _service = None
+        clear_memory()
+
+
+# -----------------------------------------------------------------
+# 多进程分离调度器 (CPU 多核主机)
+# -----------------------------------------------------------------
+
+def _pool_worker(separator, conn, threads):
+    """工作进程：Separator 由 torch.multiprocessing 传入，模型权重仍是父进程共享内存中的同一份，只读使用"""
+    torch.set_num_threads(threads)
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        job_id, audio_path, options, outputs = task
+        try:
+            last = [-1]
+
+            def hook(info):
+                if info['state'] != 'end':
+                    return
+                fraction = min(separation_fraction(info, options['shifts']), 1.0)
+                if int(fraction * 100) > last[0]:
+                    last[0] = int(fraction * 100)
+                    conn.send((job_id, 'progress', fraction))
+
+            separator.update_parameter(callback=hook, **options)
+            _, stems = separator.separate_audio_file(audio_path)
+            save_stems(separator, stems, *outputs)
+            conn.send((job_id, 'done', outputs))
+        except BaseException as e:
+            conn.send((job_id, 'error', f'{type(e).__name__}: {e}'))
+
+
+class _PoolWorker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        # 正在处理的任务编号，空闲时为 None
+        self.job_id = None
+
+
+class DemucsProcessPool:
+    """
+    多进程 Demucs 分离调度器
+
+    单个进程内，Python 开销和串行的重叠相加循环让多核 CPU 跑不满。这里在父进程加载一次模型，
+    把权重移到共享内存后用 spawn 启动 workers 个工作进程（权重以共享内存句柄传递，不复制），
+    每个进程设置 核数/workers 个 intra-op 线程；任务在父进程排队，逐个派发给空闲的进程完整分离，直接写出人声 / 伴奏文件。
+    不用 fork：父进程里同时有下载、模型初始化等线程和 ASR / TTS 的 OpenMP 推理，fork 出的子进程可能因继承的锁而死锁。
+    只在 CPU 上使用。
+    """
+
+    def __init__(self, model_name='htdemucs_ft', workers=DEMUCS_WORKERS, shifts=5, backend=DEMUCS_BACKEND):
+        from demucs.api import Separator
+
+        self.model_name = model_name
+        self.backend = backend
+        self.device = 'cpu'
+        self.shifts = shifts
+        self.threads = max(1, (os.cpu_count() or 1) // max(1, workers))
+        logger.info(f'💡 [Demucs] 加载模型 {model_name} (多进程: {max(1, workers)} 个进程 x {self.threads} 线程, '
+                    f'后端: {backend})...')
+        self.separator = Separator(model=model_name, device='cpu', shifts=shifts, backend=backend)
+        self.separator.model.share_memory()
+
+        self.context = torch.multiprocessing.get_context('spawn')
+        self.lock = threading.Lock()
+        self.workers = [self._start_worker() for _ in range(max(1, workers))]
+        # 等待派发的任务 [(任务编号, 任务)]，以及所有未完成任务的 {任务编号: (Future, 回调)}
+        self.backlog = collections.deque()
+        self.pending = {}
+        self.next_id = 0
+        self.closed = False
+        self.collector = threading.Thread(target=self._collect, name='demucs-pool', daemon=True)
+        self.collector.start()
+
+    @property
+    def samplerate(self):
+        return self.separator.samplerate
+
+    def _start_worker(self):
+        conn, child_conn = self.context.Pipe()
+        process = self.context.Process(target=_pool_worker, daemon=True,
+                                       args=(self.separator, child_conn, self.threads))
+        process.start()
+        child_conn.close()
+        return _PoolWorker(process, conn)
+
+    def submit(self, audio_path, vocals_path, instruments_path, shifts=None, callback=None, overlap=0.25,
+               deterministic_shifts=False, shift_tolerance=0.):
+        """提交一个分离任务，Future 的结果为 (人声路径, 伴奏路径)"""
+        options = {
+            'shifts': self.shifts if shifts is None else shifts,
+            'overlap': overlap,
+            'deterministic_shifts': deterministic_shifts,
+            'shift_tolerance': shift_tolerance,
+            'two_stems': 'vocals',
+        }
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self.lock:
+            job_id = self.next_id
+            self.next_id += 1
+            future.job_id = job_id
+            self.pending[job_id] = (future, callback)
+            self.backlog.append((job_id, (job_id, audio_path, options, (vocals_path, instruments_path))))
+            self._dispatch()
+        return future
+
+    def set_callback(self, future, callback):
+        """为已提交的任务更换进度回调（提前提交的任务在流水线真正等待它时才有回调）"""
+        with self.lock:
+            if future.job_id in self.pending:
+                self.pending[future.job_id] = (future, callback)
+
+    def _dispatch(self):
+        """把排队的任务派发给空闲的工作进程，调用时需持有 self.lock"""
+        for worker in self.workers:
+            if not self.backlog:
+                break
+            if worker.job_id is None:
+                worker.job_id, task = self.backlog.popleft()
+                worker.conn.send(task)
+
+    def _finish(self, job_id, result=None, error=None):
+        with self.lock:
+            future, callback = self.pending.pop(job_id, (None, None))
+        if future is None:
+            return
+        if error is None:
+            notify(callback, 1.0)
+            future.set_result(result)
+        else:
+            future.set_exception(RuntimeError(error))
+
+    def _restart(self, worker):
+        """工作进程意外退出（例如内存不足被杀）时，让它手上的任务失败并补充一个新进程"""
+        logger.warning(f'[Demucs] 工作进程 {worker.process.pid} 异常退出 '
+                       f'(exitcode={worker.process.exitcode})，重新启动')
+        if worker.job_id is not None:
+            self._finish(worker.job_id, error=f'工作进程异常退出 (exitcode={worker.process.exitcode})')
+        with self.lock:
+            self.workers.remove(worker)
+        worker.conn.close()
+        # 在锁外启动新进程，启动期间 submit 和派发不会被阻塞
+        replacement = self._start_worker()
+        with self.lock:
+            self.workers.append(replacement)
+            self._dispatch()
+
+    def _collect(self):
+        while not self.closed:
+            with self.lock:
+                workers = list(self.workers)
+            ready = multiprocessing.connection.wait([worker.conn for worker in workers], timeout=1)
+            for worker in workers:
+                if worker.conn not in ready:
+                    if not worker.process.is_alive() and not self.closed:
+                        self._restart(worker)
+                    continue
+                try:
+                    job_id, kind, value = worker.conn.recv()
+                except (EOFError, OSError):
+                    if not self.closed:
+                        worker.process.join()
+                        self._restart(worker)
+                    continue
+                if kind == 'progress':
+                    _, callback = self.pending.get(job_id, (None, None))
+                    notify(callback, value)
+                    continue
+                with self.lock:
+                    worker.job_id = None
+                    self._dispatch()
+                if kind == 'done':
+                    self._finish(job_id, result=value)
+                else:
+                    self._finish(job_id, error=value)
+
+    def close(self):
+        self.closed = True
+        self.collector.join()
+        for worker in self.workers:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in self.workers:
+            worker.process.join(timeout=10)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.conn.close()
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.backlog.clear()
+        for future, _ in pending.values():
+            future.set_exception(RuntimeError('分离进程池已关闭'))
+        del self.separator
+
+
+_pool = None
+# 已提前提交到进程池、尚未被 separate_audio 取走的任务 {文件夹: Future}
+_prefetched = {}
+
+
+def use_process_pool(device='auto', backend=DEMUCS_BACKEND):
+    return DEMUCS_WORKERS > 1 and get_device(device, backend) == 'cpu'
+
+
+def get_pool(model_name='htdemucs_ft', shifts=5, backend=DEMUCS_BACKEND):
+    """返回多进程分离调度器；模型或推理后端变化时才重新创建"""
+    global _pool
+    with _service_lock:
+        if _pool is not None and (_pool.model_name != model_name or _pool.backend != backend):
+            logger.info(f'[Demucs] 切换模型 {_pool.model_name} ({_pool.backend}) -> {model_name} ({backend})')
+            _release_pool()
+        if _pool is None:
+            _pool = DemucsProcessPool(model_name, DEMUCS_WORKERS, shifts, backend)
+        return _pool
+
+
+def _release_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+        _prefetched.clear()
+        clear_memory()
+
+
+def init_demucs(model_name='htdemucs_ft', device='auto', profile=DEMUCS_PROFILE):
+    model_name, _ = resolve_profile(profile, model_name)
+    load_model(model_name, device)
     return True
 
-def load_model(*args, **kwargs):
-    print("💡 [Demucs 优化版] 采用子进程按需加载，跳过预占用显存...")
+def load_model(model_name='htdemucs_ft', device='auto', shifts=5):
+    if use_process_pool(device):
+        get_pool(model_name, shifts)
+    else:
+        get_service(model_name, device, shifts)
     return True
 
 def release_model(*args, **kwargs):
-    print("💡 [Demucs 优化版] 子进程结束 Mac 显存已自动安全释放...")
+    with _service_lock:
+        _release_service()
+        _release_pool()
     return True
 
 # =================================================================
-# 2. 核心业务处理层 (基于 subprocess)
+# 2. 核心业务处理层
 # =================================================================
 
-def separate_audio(folder, model_name="htdemucs_ft", device="auto", progress=None, shifts=5):
+def find_audio_file(folder):
+    for name in ['download.mp4', 'download.wav']:
+        path = os.path.join(folder, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+def save_stems(service, stems, vocals_path, instruments_path):
     """
-    单文件分离逻辑。使用系统子进程直接调用 demucs 命令行。
+    将人声与伴奏写到流水线使用的位置
+
+    先写临时文件再改名，中途崩溃不会留下截断的结果；伴奏先发布，人声（流水线据此判断分离是否完成）最后发布。
+    """
+    from demucs.api import save_audio
+
+    for stem, path in ((no_vocals_stem(stems), instruments_path), (stems['vocals'], vocals_path)):
+        # save_audio 按扩展名选择格式，临时文件保留原扩展名
+        root, ext = os.path.splitext(path)
+        part_path = f'{root}.part{ext}'
+        try:
+            save_audio(stem.cpu(), part_path, samplerate=service.samplerate)
+            os.replace(part_path, path)
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+    return vocals_path, instruments_path
+
+def span_fade(length, samples, fade_in=True, fade_out=True):
+    """分离区间的权重：两端在 samples 个采样内线性过渡，与跳过区域衔接时不产生突变"""
+    weight = torch.ones(length)
+    samples = min(samples, length // 2)
+    if samples > 0:
+        ramp = torch.linspace(0, 1, samples + 2)[1:-1]
+        if fade_in:
+            weight[:samples] = ramp
+        if fade_out:
+            weight[length - samples:] = ramp.flip(0)
+    return weight
+
+
+def separate_speech_spans(service, folder, audio_path, callback=None, **options):
+    """
+    先扫描语音活动，只分离可能含有人声的区间；其余部分人声为静音、伴奏为原混音。
+    各区间作为独立任务提交，由服务合并成批量分离。
+
+    返回:
+        {'vocals': 波形, 'no_vocals': 波形}，并在 folder 下写入 speech_scan.json
     """
-    print(f"▶️ 准备分离音频: 文件夹={folder}")
-    
-    # 动态寻找需要分离的文件
-    audio_path = os.path.join(folder, "download.mp4")
-    if not os.path.exists(audio_path):
-        audio_path = os.path.join(folder, "download.wav")
-        
-    if not os.path.exists(audio_path):
-        print(f"⚠️ 在 {folder} 找不到 download.mp4 或 download.wav")
+    wav = service.load_audio(audio_path)
+    length = wav.shape[-1]
+    t_start = time.time()
+    spans = find_speech_spans(wav, service.samplerate)
+    skipped = skipped_fraction(spans, length)
+    logger.info(f'[Demucs] 语音活动扫描耗时 {time.time() - t_start:.2f}s，'
+                f'{len(spans)} 个区间需要分离，跳过 {skipped:.1%} 的音频')
+    with open(os.path.join(folder, 'speech_scan.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'duration': length / service.samplerate,
+            'skipped_fraction': skipped,
+            'spans': [[start / service.samplerate, end / service.samplerate] for start, end in spans],
+        }, f, indent=2)
+
+    vocals = torch.zeros_like(wav)
+    instruments = wav.clone()
+    covered = max(1, sum(end - start for start, end in spans))
+    done = [0.] * len(spans)
+
+    def span_callback(i):
+        if callback is None:
+            return None
+
+        def hook(fraction):
+            done[i] = fraction * (spans[i][1] - spans[i][0])
+            notify(callback, min(sum(done) / covered, 1.0))
+        return hook
+
+    futures = [service.submit(wav[:, start:end], callback=span_callback(i), two_stems='vocals', **options)
+               for i, (start, end) in enumerate(spans)]
+    fade = int(SPEECH_SPAN_FADE_SECONDS * service.samplerate)
+    for (start, end), future in zip(spans, futures):
+        _, stems = future.result()
+        weight = span_fade(end - start, fade, fade_in=start > 0, fade_out=end < length)
+        mix = wav[:, start:end]
+        vocals[:, start:end] = stems['vocals'].cpu() * weight
+        instruments[:, start:end] = no_vocals_stem(stems).cpu() * weight + mix * (1 - weight)
+    notify(callback, 1.0)
+    return {'vocals': vocals, 'no_vocals': instruments}
+
+
+def _separation_mode(audio_path, streaming=None, skip_non_speech=None):
+    """返回 (是否流式分离, 是否跳过无人声片段)，None 时按环境变量和音频时长决定"""
+    if streaming is None:
+        duration = audio_duration(audio_path) if DEMUCS_STREAMING_MINUTES else None
+        streaming = bool(duration and duration > DEMUCS_STREAMING_MINUTES * 60)
+    if skip_non_speech is None:
+        skip_non_speech = bool(DEMUCS_SKIP_NON_SPEECH)
+    return streaming, skip_non_speech
+
+
+def prefetch_separation(folder, model_name="htdemucs_ft", device="auto", shifts=5, profile=DEMUCS_PROFILE):
+    """
+    视频下载完成后立即把分离任务提交给多进程调度器，多个视频在各个工作进程中并行分离；
+    流水线之后调用 separate_audio 时直接等待该任务。不使用进程池（或需要流式 / 跳过无人声片段）时不提交。
+
+    返回:
+        Future（结果为 (人声路径, 伴奏路径)），未提交时返回 None
+    """
+    if not use_process_pool(device) or folder in _prefetched:
+        return None
+    vocals_path = os.path.join(folder, 'audio_vocals.wav')
+    instruments_path = os.path.join(folder, 'audio_instruments.wav')
+    audio_path = find_audio_file(folder)
+    if audio_path is None or (os.path.exists(vocals_path) and os.path.exists(instruments_path)):
+        return None
+    if any(_separation_mode(audio_path)):
+        return None
+    model_name, options = resolve_profile(profile, model_name, shifts)
+    pool = get_pool(model_name, shifts)
+    future = pool.submit(audio_path, vocals_path, instruments_path, **options)
+    _prefetched[folder] = (pool, future)
+    logger.info(f"[Demucs] 已提交分离任务: {audio_path}")
+    return future
+
+
+def separate_audio(folder, model_name="htdemucs_ft", device="auto", progress=None, shifts=5, callback=None,
+                   profile=DEMUCS_PROFILE, streaming=None, skip_non_speech=None):
+    """
+    单文件分离逻辑。任务提交给常驻的分离服务（DEMUCS_WORKERS > 1 时为多进程调度器），模型只在第一次调用时加载。
+    只估计人声，伴奏为混音减去人声，直接写入 audio_vocals.wav / audio_instruments.wav。
+
+    callback: 可选的进度回调 callback(fraction)，fraction 取值 0~1
+    profile: 分离质量档位 fast / balanced / max，设置后覆盖 model_name 和 shifts
+    streaming: 是否流式分离；None 表示音频超过 DEMUCS_STREAMING_MINUTES 分钟时自动开启
+    skip_non_speech: 是否先扫描语音活动并跳过没有人声的片段，None 表示使用 DEMUCS_SKIP_NON_SPEECH；
+                     流式分离时不生效
+    """
+    model_name, options = resolve_profile(profile, model_name, shifts)
+    logger.info(f"▶️ 准备分离音频: 文件夹={folder}")
+
+    audio_path = find_audio_file(folder)
+    if audio_path is None:
+        logger.warning(f"⚠️ 在 {folder} 找不到 download.mp4 或 download.wav")
         return None, None
 
-    # Mac MPS 加速
-    device_cmd = "mps" if torch.backends.mps.is_available() else "cpu"
-    
-    print(f"▶️ 调用 Demucs 命令行 (设备: {device_cmd})...")
-    cmd = [
-        "demucs",
-        "-n", model_name,
-        "--shifts", str(shifts),
-        "--two-stems", "vocals", 
-        "-d", device_cmd,
-        "-o", folder,
-        audio_path
-    ]
-    
+    vocals_path = os.path.join(folder, 'audio_vocals.wav')
+    instruments_path = os.path.join(folder, 'audio_instruments.wav')
+    prefetched = _prefetched.pop(folder, None)
+    if prefetched is None:
+        # 结果文件先写临时文件再改名、人声最后发布，两个文件都在就说明之前已经分离完成；
+        # 提前提交的任务可能还在写，必须等待它而不能只看文件是否存在
+        if os.path.exists(vocals_path) and os.path.exists(instruments_path):
+            logger.info(f"⏭️ 已检测到分离结果 {vocals_path}，跳过 Demucs 音频分离。")
+            return vocals_path, instruments_path
+        streaming, skip_non_speech = _separation_mode(audio_path, streaming, skip_non_speech)
+
     try:
-        subprocess.run(cmd, check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Demucs 执行失败: {e}")
+        if prefetched is not None:
+            logger.info(f"[Demucs] 等待提前提交的分离任务: {audio_path}")
+            pool, future = prefetched
+            pool.set_callback(future, callback)
+            future.result()
+        elif streaming:
+            logger.info(f"[Demucs] 使用流式分离: {audio_path}")
+            options.pop('shift_tolerance', None)
+            service = get_service(model_name, device, shifts, bool(progress))
+            service.submit_streaming(audio_path, vocals_path, instruments_path, callback=callback, **options).result()
+        elif skip_non_speech:
+            service = get_service(model_name, device, shifts, bool(progress))
+            stems = separate_speech_spans(service, folder, audio_path, callback=callback, **options)
+            save_stems(service, stems, vocals_path, instruments_path)
+        elif use_process_pool(device):
+            pool = get_pool(model_name, shifts)
+            pool.submit(audio_path, vocals_path, instruments_path, callback=callback, **options).result()
+        else:
+            service = get_service(model_name, device, shifts, bool(progress))
+            _, stems = service.separate(audio_path, callback=callback, two_stems='vocals', **options)
+            save_stems(service, stems, vocals_path, instruments_path)
+    except Exception as e:
+        logger.error(f"❌ Demucs 执行失败: {e}")
         return None, None
 
-    # 找到 Demucs 默认的输出位置 (不要去移动它们！)
-    track_name = os.path.splitext(os.path.basename(audio_path))[0]
-    demucs_out_dir = os.path.join(folder, model_name, track_name)
-    
-    gen_vocals = os.path.join(demucs_out_dir, "vocals.wav")
-    gen_no_vocals = os.path.join(demucs_out_dir, "no_vocals.wav")
-    
-    if os.path.exists(gen_vocals) and os.path.exists(gen_no_vocals):
-        print(f"✅ 人声分离成功！文件保留在原位: {demucs_out_dir}")
-        # 核心修复：直接返回它们在 htdemucs_ft 里的原始绝对路径！
-        return gen_vocals, gen_no_vocals
-    else:
-        print(f"❌ 找不到 Demucs 生成的文件于 {demucs_out_dir}")
-        return None, None
+    logger.info(f"✅ 人声分离成功！人声: {vocals_path}，伴奏: {instruments_path}")
+    return vocals_path, instruments_path
 
-def separate_all_audio_under_folder(folder, model_name="htdemucs_ft", device="auto", progress=None, shifts=5):
+def separate_all_audio_under_folder(folder, model_name="htdemucs_ft", device="auto", progress=None, shifts=5, callback=None,
+                                    profile=DEMUCS_PROFILE, skip_non_speech=None):
     """
     兼容主程序的批量处理接口。
     这里的关键是：必须返回 3 个值 (状态码, 人声路径, 背景音路径)，以满足 do_everything 的解包要求。
     """
-    vocal_path, instr_path = separate_audio(folder, model_name, device, progress, shifts)
-    
+    vocal_path, instr_path = separate_audio(folder, model_name, device, progress, shifts, callback, profile,
+                                           skip_non_speech=skip_non_speech)
+
     if vocal_path and instr_path:
         # 返回 True 和两个路径，完美对接主程序的 status, vocals_path, _ = ...
         return True, vocal_path, instr_path
     else:
         # 返回 False 和 None，防止抛出 unpack error
-        return False, None, None
\ No newline at end of file
+        return False, None, None
@@ -1,21 +1,35 @@
 # -*- coding: utf-8 -*-
+import hashlib
 import json
 import os
+import random
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 import time
 from loguru import logger
 from tools.step031_translation_openai import openai_response
 from tools.step032_translation_llm import llm_response
-from tools.step033_translation_translator import translator_response
+from tools.step033_translation_translator import translator_response, translator_batch_response
 from tools.step034_translation_ernie import ernie_response
 from tools.step035_translation_qwen import qwen_response
 from tools.step036_translation_ollama import ollama_response
+from tools.prompt_budget import PromptBuilder, TokenUsage, truncate_to_tokens, count_tokens
 
 load_dotenv()
 import traceback
 
+# 长视频分层总结：每个片段的 token 数与并行度
+SUMMARY_CHUNK_TOKENS = int(os.getenv('SUMMARY_CHUNK_TOKENS', 4000))
+SUMMARY_MAP_WORKERS = int(os.getenv('SUMMARY_MAP_WORKERS', 4))
+# 逐行翻译的重试预算：主流程中每行的尝试次数，以及末尾集中重试时的尝试次数
+TRANSLATE_LINE_ATTEMPTS = int(os.getenv('TRANSLATE_LINE_ATTEMPTS', 3))
+TRANSLATE_DEFERRED_ATTEMPTS = int(os.getenv('TRANSLATE_DEFERRED_ATTEMPTS', 3))
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', 0.5))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', 8))
+
 def get_necessary_info(info: dict):
     return {
         'title': info['title'],
@@ -32,6 +46,42 @@ def ensure_transcript_length(transcript, max_length=4000):
     length = max_length//2
     return before[:length] + after[-length:]
 
+def chat_response(method, messages, usage=None, stage='translate'):
+    if method == 'LLM':
+        response = qwen_response(messages)  # 改为调用Qwen API
+    elif method == 'OpenAI':
+        response = openai_response(messages)
+    elif method == 'Ernie':
+        system_content = messages[0]['content']
+        user_messages = messages[1:]
+        response = ernie_response(user_messages, system=system_content)
+    elif method == '阿里云-通义千问':
+        response = qwen_response(messages)
+    elif method == 'Ollama':  # 添加对Ollama的支持
+        response = ollama_response(messages)
+    else:
+        raise Exception('Invalid method')
+    if usage is not None:
+        usage.record(stage, messages, response)
+    return response
+
+class RetryPolicy:
+    """
+    有限次数的重试策略：接口报错时按指数退避并加随机抖动，避免多个请求同时重试
+    """
+    def __init__(self, attempts, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        # full jitter: 在 [0, min(上限, 基数 * 2^attempt)] 内均匀取值
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def backoff(self, attempt):
+        if attempt + 1 < self.attempts:
+            time.sleep(self.delay(attempt))
+
 def split_text_into_sentences(para):
     para = re.sub('([。！？\?])([^，。！？\?”’》])', r"\1\n\2", para)  # 单字符断句符
     para = re.sub('(\.{6})([^，。！？\?”’》])', r"\1\n\2", para)  # 英文省略号
@@ -144,12 +194,125 @@ def split_sentences(translation, use_char_based_end=True):
 
     return output_data
 
-def summarize(info, transcript, target_language='简体中文', method = 'LLM'):
-    transcript = ' '.join(line['text'] for line in transcript)
-    transcript = ensure_transcript_length(transcript, max_length=2000)
+class ChunkSummaryCache:
+    """
+    按内容哈希缓存片段总结，重跑同一视频时直接复用 map 阶段的结果
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.data = json.load(f)
+            except Exception as e:
+                logger.warning(f'读取片段总结缓存失败: {e}')
+
+    @staticmethod
+    def key(model_name, text):
+        return hashlib.sha256(f'{model_name}\n{text}'.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            return self.data.get(key)
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, indent=2, ensure_ascii=False)
+
+def split_transcript_chunks(texts, max_tokens):
+    """按 token 预算将转写文本切分为连续的片段"""
+    chunks, current, used = [], [], 0
+    for text in texts:
+        text = truncate_to_tokens(text, max_tokens, keep='head')
+        cost = count_tokens(text) + 1
+        if current and used + cost > max_tokens:
+            chunks.append(' '.join(current))
+            current, used = [], 0
+        current.append(text)
+        used += cost
+    if current:
+        chunks.append(' '.join(current))
+    return chunks
+
+def summarize_chunk(method, info_message, chunk, index, total, model_name, cache, usage=None):
+    key = cache.key(model_name, chunk)
+    cached = cache.get(key)
+    if cached:
+        return cached
+    messages = [
+        {'role': 'system', 'content': 'You are a expert in the field of this video. Summarize the given part of the video transcript concisely in plain text. Keep the key facts, names and terms.'},
+        {'role': 'user', 'content': f'{info_message}\nThe following is part {index + 1}/{total} of the video transcript:\n{chunk}\nSummarize this part of the video in plain text.'},
+    ]
+    policy = RetryPolicy(3)
+    for attempt in range(policy.attempts):
+        try:
+            response = chat_response(method, messages, usage, stage='summarize_map').strip()
+            if not response:
+                raise Exception('Empty summary')
+            cache.set(key, response)
+            return response
+        except Exception as e:
+            logger.warning(f'片段总结失败 {index + 1}/{total}\n{e}')
+            policy.backoff(attempt)
+    raise Exception(f'片段总结失败 {index + 1}/{total}')
+
+def map_summaries(method, info_message, texts, chunk_tokens, reduce_tokens, model_name, cache, usage=None, max_levels=4):
+    """
+    map 阶段：并行总结每个片段，直到所有片段总结能放进 reduce 的预算
+    """
+    for level in range(max_levels):
+        chunks = split_transcript_chunks(texts, chunk_tokens)
+        logger.info(f'分层总结: 第 {level + 1} 层, {len(chunks)} 个片段')
+        with ThreadPoolExecutor(max_workers=SUMMARY_MAP_WORKERS) as executor:
+            futures = [executor.submit(summarize_chunk, method, info_message, chunk, i, len(chunks), model_name, cache, usage)
+                       for i, chunk in enumerate(chunks)]
+            texts = [future.result() for future in futures]
+        cache.save()
+        if sum(count_tokens(text) + 8 for text in texts) <= reduce_tokens:
+            break
+    return texts
+
+def parse_summary(response, target_language=None):
+    summary = response.replace('\n', '')
+    if '视频标题' in summary:
+        raise Exception("包含“视频标题”")
+    logger.info(summary)
+    summary = re.findall(r'\{.*?\}', summary)[0]
+    summary = json.loads(summary)
+    summary = {
+        'title': summary['title'].replace('title:', '').strip(),
+        'summary': summary['summary'].replace('summary:', '').strip()
+    }
+    if summary['title'] == '' or summary['summary'] == '':
+        raise Exception('Invalid summary')
+    
+    if 'title' in summary['title']:
+        raise Exception('Invalid summary')
+    if target_language and (target_language in summary['title'] or target_language in summary['summary']):
+        raise Exception('Invalid summary')
+    return summary
+
+def clean_title(title):
+    title = title.strip()
+    if (title.startswith('"') and title.endswith('"')) or (title.startswith('“') and title.endswith('”')) or (title.startswith('‘') and title.endswith('’')) or (title.startswith("'") and title.endswith("'")) or (title.startswith('《') and title.endswith('》')):
+        title = title[1:-1]
+    return title
+
+def summarize(info, transcript, target_language='简体中文', method = 'LLM', usage=None, cache_path=None):
+    texts = [line['text'] for line in transcript]
     info_message = f'Title: "{info["title"]}" Author: "{info["uploader"]}". ' 
     
     if method in ['Google Translate', 'Bing Translate']:
+        transcript = ensure_transcript_length(' '.join(texts), max_length=2000)
         full_description = f'{info_message}\n{transcript}\n{info_message}\n'
         translation = translator_response(full_description, target_language)
         return {
@@ -159,90 +322,95 @@ def summarize(info, transcript, target_language='简体中文', method = 'LLM'):
                 'language': target_language
             }
 
-    full_description = f'The following is the full content of the video:\n{info_message}\n{transcript}\n{info_message}\nAccording to the above content, detailedly Summarize the video in JSON format:\n```json\n{{"title": "", "summary": ""}}\n```'
+    # 转写文本放得进预算时直接总结，否则先分片并行总结（map），再汇总为最终结果（reduce）
+    builder = PromptBuilder(method, purpose='summarize')
+    reduce_tokens = builder.budget - 2 * count_tokens(info_message) - 200
+    transcript = ' '.join(texts)
+    if count_tokens(transcript) <= reduce_tokens:
+        content = f'The following is the full content of the video:\n{info_message}\n{transcript}\n{info_message}'
+    else:
+        cache = ChunkSummaryCache(cache_path)
+        chunk_tokens = min(SUMMARY_CHUNK_TOKENS, reduce_tokens)
+        parts = map_summaries(method, info_message, texts, chunk_tokens, reduce_tokens, builder.model_name, cache, usage)
+        parts = truncate_to_tokens('\n'.join(f'[{i + 1}] {part}' for i, part in enumerate(parts)), reduce_tokens)
+        content = f'The following are the summaries of consecutive parts of the video:\n{info_message}\n{parts}\n{info_message}'
+    full_description = f'{content}\nAccording to the above content, detailedly Summarize the video in JSON format:\n```json\n{{"title": "", "summary": ""}}\n```'
     
-    messages = [
-        {'role': 'system',
-            'content': f'You are a expert in the field of this video. Please detailedly summarize the video in JSON format.\n```json\n{{"title": "the title of the video", "summary", "the summary of the video"}}\n```'},
-        {'role': 'user', 'content': full_description},
-    ]
-    retry_message=''
-    success = False
-    for retry in range(9):
+    retry_message = ''
+    summary = None
+    policy = RetryPolicy(9)
+    for attempt in range(policy.attempts):
         try:
             messages = [
                 {'role': 'system', 'content': f'You are a expert in the field of this video. Please summarize the video in JSON format.\n```json\n{{"title": "the title of the video", "summary", "the summary of the video"}}\n```'},
                 {'role': 'user', 'content': full_description+retry_message},
             ]
-            if method == 'LLM':
-                response = qwen_response(messages)  # 改为调用Qwen API
-            elif method == 'OpenAI':
-                response = openai_response(messages)
-            elif method == 'Ernie':
-                system_content = messages[0]['content']
-                user_messages = messages[1:]
-                response = ernie_response(user_messages, system=system_content)
-            elif method == '阿里云-通义千问':
-                response = qwen_response(messages)
-            elif method == 'Ollama':  # 添加对Ollama的支持
-                response = ollama_response(messages)
-            else:
-                raise Exception('Invalid method')
-            summary = response.replace('\n', '')
-            if '视频标题' in summary:
-                raise Exception("包含“视频标题”")
-            logger.info(summary)
-            summary = re.findall(r'\{.*?\}', summary)[0]
-            summary = json.loads(summary)
-            summary = {
-                'title': summary['title'].replace('title:', '').strip(),
-                'summary': summary['summary'].replace('summary:', '').strip()
-            }
-            if summary['title'] == '' or summary['summary'] == '':
-                raise Exception('Invalid summary')
-            
-            if 'title' in summary['title']:
-                raise Exception('Invalid summary')
-            success = True
+            response = chat_response(method, messages, usage, stage='summarize')
+            summary = parse_summary(response, target_language)
             break
         except Exception as e:
             traceback.print_exc()
-            retry_message += '\nSummarize the video in JSON format:\n```json\n{"title": "", "summary": ""}\n```'
+            retry_message = '\nSummarize the video in JSON format:\n```json\n{"title": "", "summary": ""}\n```'
             logger.warning(f'总结失败\n{e}')
-            time.sleep(1)
-            
-    if not success:
+            policy.backoff(attempt)
+
+    if summary is None:
         raise Exception(f'总结失败')
-            
-    messages = [
-        {'role': 'system',
-            'content': f'You are a native speaker of {target_language}. Please translate the title and summary into {target_language} in JSON format. ```json\n{{"title": "the {target_language} title of the video", "summary", "the {target_language} summary of the video", "tags": [list of tags in {target_language}]}}\n```.'},
-        {'role': 'user',
-            'content': f'The title of the video is "{summary["title"]}". The summary of the video is "{summary["summary"]}". Tags: {info["tags"]}.\nPlease translate the above title and summary and tags into {target_language} in JSON format. ```json\n{{"title": "", "summary", ""， "tags": []}}\n```. Remember to tranlate the title and the summary and tags into {target_language} in JSON.'},
-    ]
-    while True:
-        try: 
-            logger.info(summary)
-            if target_language in summary['title'] or target_language in summary['summary']:
-                raise Exception('Invalid translation')
-            title = summary['title'].strip()
-            if (title.startswith('"') and title.endswith('"')) or (title.startswith('“') and title.endswith('”')) or (title.startswith('‘') and title.endswith('’')) or (title.startswith("'") and title.endswith("'")) or (title.startswith('《') and title.endswith('》')):
-                title = title[1:-1]
-            result = {
-                'title': title,
-                'author': info['uploader'],
-                'summary': summary['summary'],
-                'tags': info['tags'],
-                'language': target_language
-            }
-            return result
+
+    logger.info(summary)
+    return {
+        'title': clean_title(summary['title']),
+        'author': info['uploader'],
+        'summary': summary['summary'],
+        'tags': info['tags'],
+        'language': target_language
+    }
+
+def translate_line(method, builder, fixed_message, history, text, policy, usage=None, feedback=None):
+    """
+    在重试预算内翻译一行
+
+    接口报错时指数退避后重试；译文未通过 valid_translation 时，把校验给出的提示附在下一次请求中。
+
+    返回:
+        (success, translation, feedback)：失败时 translation 为最后一次收到的译文（可能为空），
+        feedback 为最后一次校验提示，供之后集中重试时继续使用
+    """
+    translation = ''
+    for attempt in range(policy.attempts):
+        content = f'Translate:"{text}"'
+        if feedback:
+            content += f'\nOnly translate the quoted sentence and give me the final translation. {feedback}'
+        messages = builder.build(fixed_message, history, {'role': 'user', 'content': content})
+        try:
+            response = chat_response(method, messages, usage, stage='translate')
         except Exception as e:
-            logger.warning(f'总结翻译失败\n{e}')
-            time.sleep(1)
+            logger.error(e)
+            logger.warning(f'翻译请求失败 ({attempt + 1}/{policy.attempts})')
+            policy.backoff(attempt)
+            continue
+        translation = response.replace('\n', '')
+        logger.info(f'原文：{text}')
+        logger.info(f'译文：{translation}')
+        success, result = valid_translation(text, translation)
+        if success:
+            return True, result, None
+        logger.warning(f'译文校验失败 ({attempt + 1}/{policy.attempts}): {result}')
+        feedback = result
+    return False, translation_postprocess(translation.strip()), feedback
+
+def _translate(summary, transcript, target_language='简体中文', method='LLM', usage=None, glossary=None):
+    if method in ['Google Translate', 'Bing Translate']:
+        # 机器翻译用于快速出稿：多行合并为一次请求，批次之间并发
+        translator_server = 'google' if method == 'Google Translate' else 'bing'
+        return translator_batch_response([line['text'] for line in transcript],
+                                         to_language=target_language, translator_server=translator_server)
 
-def _translate(summary, transcript, target_language='简体中文', method='LLM'):
+    builder = PromptBuilder(method, purpose='translate')
+    summary_text = builder.fit_summary(summary['summary'])
+    glossary_message = builder.format_glossary(glossary)
 
-    info = f'This is a video called "{summary["title"]}". {summary["summary"]}.'
+    info = f'This is a video called "{summary["title"]}". {summary_text}.'
     full_translation = []
     if target_language == '简体中文':
         fixed_message = [
@@ -255,61 +423,59 @@ def _translate(summary, transcript, target_language='简体中文', method='LLM'
     else:
         # For other languages, we keep the template general
         fixed_message = [
-            {'role': 'system', 'content': f'You are a language expert specializing in translating content from various fields. The current task involves translating the transcript of a video titled "{summary["title"]}". The summary of the video is: {summary["summary"]}. Your goal is to translate the following sentences into {target_language}. Please ensure that the translations are accurate, maintain the original meaning and tone, and are expressed in a clear and fluent manner.'},
+            {'role': 'system', 'content': f'You are a language expert specializing in translating content from various fields. The current task involves translating the transcript of a video titled "{summary["title"]}". The summary of the video is: {summary_text}. Your goal is to translate the following sentences into {target_language}. Please ensure that the translations are accurate, maintain the original meaning and tone, and are expressed in a clear and fluent manner.'},
             {'role': 'user', 'content': 'Please translate the following text: "Original Text"'},
             {'role': 'assistant', 'content': 'Translated text: "Translated Text"'},
             {'role': 'user', 'content': 'Translate the following text: "Another Original Text"'},
             {'role': 'assistant', 'content': 'Translated text: "Another Translated Text"'},
         ]
+    if glossary_message:
+        fixed_message[0] = {'role': 'system', 'content': fixed_message[0]['content'] + '\n' + glossary_message}
 
-    history = []
-    
-    for line in transcript:
-        text = line['text']
-
-        retry_message = 'Only translate the quoted sentence and give me the final translation.'
-        if method == 'Google Translate':
-            translation = translator_response(text, to_language = target_language, translator_server='google')
-        elif method == 'Bing Translate':
-            translation = translator_response(text, to_language = target_language, translator_server='bing')
-        else:
-            for retry in range(10):
-                messages = fixed_message + \
-                    history[-30:] + [{'role': 'user',
-                                    'content': f'Translate:"{text}"'}]
-                # print(messages)
-                try:
-                    if method == 'LLM':
-                        response = qwen_response(messages)  # 改为调用Qwen API
-                    elif method == 'OpenAI':
-                        response = openai_response(messages)
-                    elif method == 'Ernie':
-                        system_content = messages[0]['content']
-                        user_messages = messages[1:]
-                        response = ernie_response(user_messages, system=system_content)
-                    elif method == '阿里云-通义千问':
-                        response = qwen_response(messages)
-                    elif method == 'Ollama':  # 添加对Ollama的支持
-                        response = ollama_response(messages)
-                    else:
-                        raise Exception('Invalid method')
-                    translation = response.replace('\n', '')
-                    logger.info(f'原文：{text}')
-                    logger.info(f'译文：{translation}')
-                    success, translation = valid_translation(text, translation)
-                    if not success:
-                        retry_message += translation
-                        raise Exception('Invalid translation')
-                    break
-                except Exception as e:
-                    logger.error(e)
-                    logger.warning('翻译失败')
-                    time.sleep(1)
+    # 每行成功翻译后对应的一对历史对话；失败的行先跳过，主流程结束后再集中重试
+    pairs = [None] * len(transcript)
+    deferred = {}
+
+    def history_before(index):
+        return [message for pair in pairs[:index] if pair for message in pair]
+
+    policy = RetryPolicy(TRANSLATE_LINE_ATTEMPTS)
+    for i, line in enumerate(transcript):
+        success, translation, feedback = translate_line(method, builder, fixed_message, history_before(i),
+                                                        line['text'], policy, usage)
         full_translation.append(translation)
-        history.append({'role': 'user', 'content': f'Translate:"{text}"'})
-        history.append({'role': 'assistant', 'content': f'翻译：“{translation}”'})
-        time.sleep(0.1)
-        
+        if success:
+            pairs[i] = [{'role': 'user', 'content': f'Translate:"{line["text"]}"'},
+                        {'role': 'assistant', 'content': f'翻译：“{translation}”'}]
+        else:
+            logger.warning(f'第 {i + 1} 行翻译失败，稍后重试')
+            deferred[i] = feedback
+
+    exhausted = []
+    if deferred:
+        logger.info(f'集中重试 {len(deferred)} 行翻译失败的句子')
+        policy = RetryPolicy(TRANSLATE_DEFERRED_ATTEMPTS)
+        for i, feedback in deferred.items():
+            text = transcript[i]['text']
+            success, translation, _ = translate_line(method, builder, fixed_message, history_before(i),
+                                                     text, policy, usage, feedback=feedback)
+            if success:
+                full_translation[i] = translation
+                pairs[i] = [{'role': 'user', 'content': f'Translate:"{text}"'},
+                            {'role': 'assistant', 'content': f'翻译：“{translation}”'}]
+            else:
+                # 保留最后一次收到的译文，避免整段视频因为个别句子失败
+                full_translation[i] = translation or full_translation[i]
+                exhausted.append(i)
+    if exhausted:
+        logger.error(f'{len(exhausted)} 行翻译用尽重试次数: {[i + 1 for i in exhausted]}')
+    if usage is not None:
+        usage.set_metric('translate_retries', {
+            'lines': len(transcript),
+            'deferred': len(deferred),
+            'exhausted': len(exhausted),
+            'exhausted_indices': exhausted,
+        })
     return full_translation
 
 def translate(method, folder, target_language='简体中文'):
@@ -335,11 +501,20 @@ def translate(method, folder, target_language='简体中文'):
     with open(transcript_path, 'r', encoding='utf-8') as f:
         transcript = json.load(f)
     
+    # 可选的术语表：{"原文术语": "译文术语"}
+    glossary = None
+    glossary_path = os.path.join(folder, 'glossary.json')
+    if os.path.exists(glossary_path):
+        with open(glossary_path, 'r', encoding='utf-8') as f:
+            glossary = json.load(f)
+
+    usage = TokenUsage()
     summary_path = os.path.join(folder, 'summary.json')
     if os.path.exists(summary_path):
         summary = json.load(open(summary_path, 'r', encoding='utf-8'))
     else:
-        summary = summarize(info, transcript, target_language, method)
+        summary = summarize(info, transcript, target_language, method, usage=usage,
+                            cache_path=os.path.join(folder, 'summary_chunks.json'))
         if summary is None:
             logger.error(f'Failed to summarize {folder}')
             return False
@@ -347,7 +522,8 @@ def translate(method, folder, target_language='简体中文'):
             json.dump(summary, f, indent=2, ensure_ascii=False)
 
     translation_path = os.path.join(folder, 'translation.json')
-    translation = _translate(summary, transcript, target_language, method)
+    translation = _translate(summary, transcript, target_language, method, usage=usage, glossary=glossary)
+    usage.save(folder)
     for i, line in enumerate(transcript):
         line['translation'] = translation[i]
     transcript = split_sentences(transcript)
@@ -1,16 +1,32 @@
 # -*- coding: utf-8 -*-
 import json
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 import translators as ts
 from dotenv import load_dotenv
 from loguru import logger
 load_dotenv()
 
-def translator_response(messages, to_language = 'zh-CN', translator_server = 'bing'):
+# 批量翻译时用于拼接多行文本的分隔符，翻译服务会原样保留
+BULK_DELIMITER = '\n###\n'
+BULK_SPLIT_PATTERN = re.compile(r'\s*#\s*#\s*#\s*')
+# 各翻译服务单次请求的字符上限
+SERVICE_CHAR_LIMITS = {
+    'google': 5000,
+    'bing': 1000,
+}
+BULK_MAX_WORKERS = int(os.getenv('TRANSLATOR_BULK_WORKERS', 4))
+
+def normalize_language(to_language):
     if '中文' in to_language:
         to_language = 'zh-CN'
     elif 'English' in to_language:
         to_language = 'en'
+    return to_language
+
+def translator_response(messages, to_language = 'zh-CN', translator_server = 'bing'):
+    to_language = normalize_language(to_language)
     translation = ''
     for retry in range(3):
         try:
@@ -21,8 +37,63 @@ def translator_response(messages, to_language = 'zh-CN', translator_server = 'bi
             print('tranlate failed!')
     return translation
 
+def split_into_batches(texts, max_chars):
+    """按服务字符上限将多行文本分组，返回每组的行号列表"""
+    batches, current, used = [], [], 0
+    for i, text in enumerate(texts):
+        cost = len(text) + len(BULK_DELIMITER)
+        if current and used + cost > max_chars:
+            batches.append(current)
+            current, used = [], 0
+        current.append(i)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def _translate_batch(texts, to_language, translator_server):
+    if len(texts) == 1:
+        return [translator_response(texts[0], to_language, translator_server)]
+    translation = translator_response(BULK_DELIMITER.join(texts), to_language, translator_server)
+    parts = [part.strip() for part in BULK_SPLIT_PATTERN.split(translation.strip())]
+    if len(parts) == len(texts) and all(parts):
+        return parts
+    # 分隔符被翻译服务破坏，退回逐行翻译
+    logger.warning(f'批量翻译分隔符校验失败 ({len(parts)}/{len(texts)})，改为逐行翻译')
+    return [translator_response(text, to_language, translator_server) for text in texts]
+
+def translator_batch_response(texts, to_language = 'zh-CN', translator_server = 'bing', max_workers = BULK_MAX_WORKERS):
+    """
+    批量翻译多行文本
+
+    将多行文本用分隔符拼接到服务的字符上限以内，一次请求翻译后再拆分回各行；
+    不同批次在小线程池中并发请求。
+
+    参数:
+        texts: 待翻译的文本列表
+        to_language: 目标语言
+        translator_server: 'google' 或 'bing'
+        max_workers: 并发请求数
+
+    返回:
+        与 texts 一一对应的译文列表
+    """
+    max_chars = SERVICE_CHAR_LIMITS.get(translator_server, 1000)
+    batches = split_into_batches(texts, max_chars)
+    logger.info(f'批量翻译: {len(texts)} 行, {len(batches)} 个请求 ({translator_server})')
+    translations = [''] * len(texts)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_translate_batch, [texts[i] for i in batch], to_language, translator_server): batch
+                   for batch in batches}
+        for future, batch in futures.items():
+            for i, translation in zip(batch, future.result()):
+                translations[i] = translation
+    return translations
+
 if __name__ == '__main__':
     response = translator_response('Hello, how are you?', '中文', 'bing')
     print(response)
     response = translator_response('你好，最近怎么样？ ', 'en', 'google')
-    print(response)
\ No newline at end of file
+    print(response)
+    response = translator_batch_response(['Hello, how are you?', 'Knowledge is power.'], '中文', 'google')
+    print(response)
@@ -7,27 +7,32 @@ from loguru import logger
 import numpy as np
 
 from .utils import save_wav, save_wav_norm
-# --- 重点修改区域开始 ---
-# 将下面这些原有的冗余 TTS 引擎全部注释掉，防止它们触发底层的 ImportError
-# from .step041_tts_bytedance import tts as bytedance_tts  # 需要bytedance依赖
-# from .step042_tts_xtts import tts as xtts_tts  # 需要Coqui TTS库
-# from .step043_tts_cosyvoice import tts as cosyvoice_tts  # 需要CosyVoice依赖
-from .step044_tts_edge_tts import tts as edge_tts  # Edge-TTS通常可用
-from .step045_tts_cinecast import generate_tts_with_emotion_clone  # 我们的核心Cinecast TTS模块
-# --- 重点修改区域结束 ---
-from .cn_tx import TextNorm
+# 各 TTS 引擎在 tts_engines 中注册，依赖在第一次合成时才导入，防止未安装的引擎触发 ImportError
+from .tts_engines import TIMELINE_SAMPLE_RATE, get_engine, synthesize_lines
+from .duration_plan import SpeechRateModel, plan_speed
+from .cn_tx import CompiledTextNorm
 from audiostretchy.stretch import stretch_audio
-normalizer = TextNorm()
+normalizer = CompiledTextNorm()
+# 合成结果与目标时长的偏差（比例）在该范围内时不再做事后变速
+STRETCH_TOLERANCE = float(os.getenv('STRETCH_TOLERANCE', 0.05))
+_UPPER_PATTERN = re.compile(r'(?<!^)([A-Z])')
+_ALNUM_BOUNDARY_PATTERN = re.compile(r'(?<=[a-zA-Z])(?=\d)|(?<=\d)(?=[a-zA-Z])')
+
 def preprocess_text(text):
     text = text.replace('AI', '人工智能')
-    text = re.sub(r'(?<!^)([A-Z])', r' \1', text)
+    text = _UPPER_PATTERN.sub(r' \1', text)
     text = normalizer(text)
     # 使用正则表达式在字母和数字之间插入空格
-    text = re.sub(r'(?<=[a-zA-Z])(?=\d)|(?<=\d)(?=[a-zA-Z])', ' ', text)
+    text = _ALNUM_BOUNDARY_PATTERN.sub(' ', text)
     return text
+
+def preprocess_texts(texts):
+    """批量预处理整篇译文，重复的行只做一次规范化"""
+    cache = {}
+    return [cache[text] if text in cache else cache.setdefault(text, preprocess_text(text)) for text in texts]
     
     
-def adjust_audio_length(wav_path, desired_length, sample_rate = 24000, min_speed_factor = 0.6, max_speed_factor = 1.1):
+def adjust_audio_length(wav_path, desired_length, sample_rate = 24000, min_speed_factor = 0.6, max_speed_factor = 1.1, tolerance = STRETCH_TOLERANCE):
     try:
         wav, sample_rate = librosa.load(wav_path, sr=sample_rate)
     except Exception as e:
@@ -37,6 +42,9 @@ def adjust_audio_length(wav_path, desired_length, sample_rate = 24000, min_speed
     current_length = len(wav)/sample_rate
     speed_factor = max(
         min(desired_length / current_length, max_speed_factor), min_speed_factor)
+    if abs(speed_factor - 1) <= tolerance:
+        # 合成时已按规划的语速生成，时长足够接近，不再变速
+        return wav, current_length
     logger.info(f"Speed Factor {speed_factor}")
     desired_length = current_length * speed_factor
     if wav_path.endswith('.wav'):
@@ -47,34 +55,114 @@ def adjust_audio_length(wav_path, desired_length, sample_rate = 24000, min_speed
     wav, sample_rate = librosa.load(target_path, sr=sample_rate)
     return wav[:int(desired_length*sample_rate)], desired_length
 
-tts_support_languages = {
-    # XTTS-v2 supports 17 languages: English (en), Spanish (es), French (fr), German (de), Italian (it), Portuguese (pt), Polish (pl), Turkish (tr), Russian (ru), Dutch (nl), Czech (cs), Arabic (ar), Chinese (zh-cn), Japanese (ja), Hungarian (hu), Korean (ko) Hindi (hi).
-    'xtts': ['中文', 'English', 'Japanese', 'Korean', 'French', 'Polish', 'Spanish'],
-    'bytedance': [],
-    'GPTSoVits': [],
-    'EdgeTTS': ['中文', 'English', 'Japanese', 'Korean', 'French', 'Polish', 'Spanish'],
-    # zero_shot usage, <|zh|><|en|><|jp|><|yue|><|ko|> for Chinese/English/Japanese/Cantonese/Korean
-    'cosyvoice': ['中文', '粤语', 'English', 'Japanese', 'Korean', 'French'], 
-}
-
-def generate_wavs(method, folder, target_language='中文', voice = 'zh-CN-XiaoxiaoNeural'):
-    # 强制将无关的 TTS 方法劫持或报错
-    if method == 'Cinecast':
-        # 调用Cinecast情绪配音功能
-        from .step045_tts_cinecast import generate_tts_with_emotion_clone
-        # 这里需要实现与原有逻辑兼容的调用
-        logger.info("✅ 使用Cinecast进行情绪配音")
-        # TODO: 实现与generate_wavs接口兼容的Cinecast调用
-        pass
-    elif method == 'EdgeTTS':
-        # 如果您还想保留微软免费TTS作为备用，可以留着它
-        logger.info("ℹ️  使用EdgeTTS作为备用")
-        pass
-    else:
-        # 直接抛出错误，防止它去加载卸载了的 XTTS 等模型
-        raise ValueError(f"❌ 系统已升级纯净版，不支持 {method}！请在界面选择 Cinecast。")
-    
-    assert method in ['Cinecast', 'EdgeTTS']
+class TimelineBuffer:
+    """
+    配音时间线缓冲区
+
+    容量按倍增预先分配，音频（整句或流式合成的块）直接写到指定偏移，避免每句都整段 np.concatenate；
+    on_write 在每次写入后收到 (当前时间线, 起始采样, 结束采样)，界面可据此边合成边预览。
+    """
+
+    def __init__(self, sample_rate=TIMELINE_SAMPLE_RATE, on_write=None):
+        self.sample_rate = sample_rate
+        self.on_write = on_write
+        self.data = np.zeros(sample_rate * 60, dtype=np.float32)
+        self.length = 0
+
+    @property
+    def duration(self):
+        return self.length / self.sample_rate
+
+    def _reserve(self, size):
+        if size > len(self.data):
+            data = np.zeros(max(size, 2 * len(self.data)), dtype=np.float32)
+            data[:self.length] = self.data[:self.length]
+            self.data = data
+
+    def write(self, offset, wav):
+        """把 wav 写到 offset 处（中间的空隙保持静音），返回写入结束的位置"""
+        end = offset + len(wav)
+        self._reserve(end)
+        self.data[offset:end] = wav
+        self.length = max(self.length, end)
+        if self.on_write is not None:
+            self.on_write(self.data[:self.length], offset, end)
+        return end
+
+    def truncate(self, length):
+        """丢弃 length 之后的内容（例如流式合成中途失败的半句）"""
+        if length < self.length:
+            self.data[length:self.length] = 0
+            self.length = length
+
+    def numpy(self):
+        return self.data[:self.length]
+
+
+def stream_line(engine, buffer, offset, line, target_language):
+    """
+    流式合成一句话，并把每一块直接写入时间线的 offset 处
+
+    语速 line['speed'] 已在合成前按时长规划确定，由引擎在生成每一块时变速
+    （XTTS 作用于解码前的 GPT 隐变量），不再经过中间文件和 audiostretchy。
+    返回 (写入时长, 自然时长)，失败时返回 None。
+    """
+    text = line['text']
+    speed = line.get('speed', 1.0)
+    length_before = buffer.length
+    for retry in range(engine.retries):
+        position = offset
+        try:
+            for chunk in engine.synthesize_stream(line, target_language, speed=speed):
+                position = buffer.write(position, chunk)
+            length = (position - offset) / buffer.sample_rate
+            logger.info(f'TTS {text}')
+            return length, length * speed
+        except Exception as e:
+            logger.warning(f'TTS {text} 失败')
+            logger.warning(e)
+            buffer.truncate(length_before)
+    return None
+
+
+def plan_line_speed(engine, rate_model, line, desired_length):
+    """按语速模型估计自然时长，返回让它落进 desired_length 的语速；不支持变速的引擎为 1"""
+    if not engine.speed_control:
+        return 1.0
+    natural = rate_model.estimate(engine.name, engine.voice_key(line), line['text'])
+    speed = plan_speed(natural, desired_length)
+    logger.debug(f'时长规划: 自然 {natural:.2f}s, 目标 {desired_length:.2f}s, 语速 {speed:.2f}')
+    return speed
+
+
+def synthesize_missing(engine, lines, target_language, rate_model=None):
+    """
+    一次性把还没有输出文件的句子交给引擎调度（按引擎参数切批、并发），结果保存为 24kHz wav
+
+    每句的实际时长 x 语速 作为自然时长，用于更新语速模型
+    """
+    pending = [line for line in lines if not os.path.exists(line['output_path'])]
+    if not pending:
+        return
+    wavs = synthesize_lines(engine, pending, target_language)
+    for line, wav in zip(pending, wavs):
+        if wav is None:
+            continue
+        if rate_model is not None:
+            rate_model.observe(engine.name, engine.voice_key(line), line['text'],
+                               len(wav) / TIMELINE_SAMPLE_RATE * line.get('speed', 1.0))
+        # 有的引擎（Cinecast、火山）已经自己写好了输出文件
+        if not os.path.exists(line['output_path']):
+            save_wav(wav, line['output_path'], sample_rate=TIMELINE_SAMPLE_RATE)
+
+
+def generate_wavs(method, folder, target_language='中文', voice = 'zh-CN-XiaoxiaoNeural', preview=None):
+    engine = get_engine(method)
+    if not engine.supports(target_language):
+        # 不阻止合成，只提示可能效果不佳
+        logger.warning(f'{method} 未声明支持 {target_language}')
+    logger.info(f"使用 {method}{'（流式）' if engine.streaming else ''} 合成配音")
+
     transcript_path = os.path.join(folder, 'translation.json')
     output_folder = os.path.join(folder, 'wavs')
     if not os.path.exists(output_folder):
@@ -88,57 +176,61 @@ def generate_wavs(method, folder, target_language='中文', voice = 'zh-CN-Xiaox
     num_speakers = len(speakers)
     logger.info(f'Found {num_speakers} speakers')
 
-    # 注释掉语言支持检查，允许所有语言通过
-    # if target_language not in tts_support_languages.get(method, []):
-    #     logger.error(f'{method} does not support {target_language}')
-    #     return f'{method} does not support {target_language}'
-        
-    full_wav = np.zeros((0, ))
+    texts = preprocess_texts([line['translation'] for line in transcript])
+    lines = [{
+        'text': texts[i],
+        'output_path': os.path.join(output_folder, f'{str(i).zfill(4)}.wav'),
+        'speaker_wav': os.path.join(folder, 'SPEAKER', f'{line["speaker"]}.wav'),
+        'start': line['start'],
+        'end': line['end'],
+        'vocal_path': os.path.join(folder, 'audio_vocals.wav'),
+        'voice': voice,
+    } for i, line in enumerate(transcript)]
+    rate_model = SpeechRateModel()
+    if not engine.streaming:
+        # 按字幕中的时长规划语速，让合成结果本身就接近目标时长，事后变速只做兜底
+        for line in lines:
+            line['speed'] = plan_line_speed(engine, rate_model, line, line['end'] - line['start'])
+        synthesize_missing(engine, lines, target_language, rate_model)
+
+    buffer = TimelineBuffer(on_write=preview)
     for i, line in enumerate(transcript):
-        speaker = line['speaker']
-        text = preprocess_text(line['translation'])
-        output_path = os.path.join(output_folder, f'{str(i).zfill(4)}.wav')
-        speaker_wav = os.path.join(folder, 'SPEAKER', f'{speaker}.wav')
-        
-        # 在调用 generate_tts_cinecast 或 edge_tts 之前加上：
-        if os.path.exists(output_path):  # output_path 是当前这一句将要保存的 mp3 路径
-            logger.info(f"⏭️ 配音已存在，跳过: {output_path}")
-            success = True  # 标记为成功，继续处理
-        else:
-            if method == 'Cinecast':
-                # 调用Cinecast API进行情绪配音
-                success = generate_tts_with_emotion_clone(
-                    text=text,
-                    start_time=line['start'],
-                    end_time=line['end'],
-                    vocal_audio_path=os.path.join(folder, 'audio_vocals.wav'),
-                    output_audio_path=output_path,
-                    emotion_voice="aiden"  # 默认音色
-                )
-                if not success:
-                    logger.error(f"❌ Cinecast配音失败: {text}")
-                    continue
-            elif method == 'EdgeTTS':
-                edge_tts(text, output_path, target_language = target_language, voice = voice)
-                success = True
+        text = texts[i]
+        output_path = lines[i]['output_path']
+        streaming = engine.streaming and not os.path.exists(output_path)
+        if not streaming and not os.path.exists(output_path) and not os.path.exists(output_path.replace('.wav', '.mp3')):
+            logger.error(f"❌ {method}配音失败: {text}")
+            continue
         
         start = line['start']
         end = line['end']
         length = end-start
-        last_end = len(full_wav)/24000
+        last_end = buffer.duration
+        offset = buffer.length
         if start > last_end:
-            full_wav = np.concatenate((full_wav, np.zeros((int((start - last_end) * 24000), ))))
-        start = len(full_wav)/24000
-        line['start'] = start
+            offset += int((start - last_end) * 24000)
+        start = offset/24000
         if i < len(transcript) - 1:
             next_line = transcript[i+1]
             next_end = next_line['end']
             end = min(start + length, next_end)
-        wav, length = adjust_audio_length(output_path, end-start)
-
-        full_wav = np.concatenate((full_wav, wav))
+        if streaming:
+            # 流式合成时前面各句的实际长度已知，按时间线上的实际空位规划
+            lines[i]['speed'] = plan_line_speed(engine, rate_model, lines[i], end-start)
+            result = stream_line(engine, buffer, offset, lines[i], target_language)
+            if result is None:
+                logger.error(f"❌ {method}配音失败: {text}")
+                continue
+            length, natural_length = result
+            rate_model.observe(engine.name, engine.voice_key(lines[i]), text, natural_length)
+        else:
+            wav, length = adjust_audio_length(output_path, end-start)
+            buffer.write(offset, wav)
+        line['start'] = start
         line['end'] = start + length
         
+    rate_model.save()
+    full_wav = buffer.numpy()
     vocal_wav, sr = librosa.load(os.path.join(folder, 'audio_vocals.wav'), sr=24000)
     
     # 【添加这里的保护代码】
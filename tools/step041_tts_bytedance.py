@@ -7,6 +7,7 @@ pip install requests
 import base64
 import json
 import os
+import threading
 import time
 import uuid
 import librosa
@@ -14,8 +15,6 @@ import numpy as np
 import requests
 from loguru import logger
 from dotenv import load_dotenv
-from pyannote.audio import Model, Inference
-from scipy.spatial.distance import cosine
 
 load_dotenv()
 # 填写平台申请的appid, access_token以及cluster
@@ -54,15 +53,105 @@ request_json = {
     }
 }
 
-embedding_model = Model.from_pretrained(
-    "pyannote/embedding", use_auth_token=os.getenv('HF_TOKEN'))
-embedding_inference = Inference(
-    embedding_model, window="whole")
+# 音色库目录：每个音色一个 <voice_type>.wav 试听音频和 <voice_type>.npy 声纹向量
+VOICE_TYPE_FOLDER = 'voice_type'
+# 预先归一化的声纹矩阵及其音色名，由 VoiceIndex 生成
+VOICE_INDEX_MATRIX = 'index.npy'
+VOICE_INDEX_META = 'index.json'
+
+# pyannote 声纹模型在第一次提取声纹时才加载，导入本模块不加载神经网络
+_embedding_inference = None
+_embedding_lock = threading.Lock()
+
+
+def get_embedding_inference():
+    global _embedding_inference
+    with _embedding_lock:
+        if _embedding_inference is None:
+            from pyannote.audio import Model, Inference
+            t_start = time.time()
+            embedding_model = Model.from_pretrained(
+                "pyannote/embedding", use_auth_token=os.getenv('HF_TOKEN'))
+            _embedding_inference = Inference(
+                embedding_model, window="whole")
+            logger.info(f'声纹模型加载完成，耗时 {time.time() - t_start:.2f}s')
+    return _embedding_inference
+
 
 def generate_embedding(wav_path):
-    embedding = embedding_inference(wav_path)
+    embedding = get_embedding_inference()(wav_path)
     return embedding
 
+
+class VoiceIndex:
+    """
+    音色库声纹索引
+
+    所有音色的声纹向量 L2 归一化后堆叠成一个矩阵，保存为 index.npy 并以内存映射方式打开；
+    index.json 记录音色名和各 .npy 的大小、修改时间，音色库变化后自动重建。
+    匹配只是一次矩阵向量乘法加 argpartition 取前 k 个。
+    """
+
+    def __init__(self, folder=VOICE_TYPE_FOLDER):
+        self.folder = folder
+        matrix_path = os.path.join(folder, VOICE_INDEX_MATRIX)
+        meta_path = os.path.join(folder, VOICE_INDEX_META)
+        sources = self.sources()
+        meta = None
+        if os.path.exists(matrix_path) and os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        if meta is None or meta.get('sources') != sources:
+            self.build(sources, matrix_path, meta_path)
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        self.names = meta['names']
+        self.matrix = np.load(matrix_path, mmap_mode='r')
+
+    def sources(self):
+        """音色库中的声纹文件及其 (大小, 修改时间)，用于判断索引是否过期"""
+        sources = {}
+        for file in sorted(os.listdir(self.folder)):
+            if file.endswith('.npy') and file != VOICE_INDEX_MATRIX:
+                stat = os.stat(os.path.join(self.folder, file))
+                sources[file] = [stat.st_size, stat.st_mtime_ns]
+        return sources
+
+    def build(self, sources, matrix_path, meta_path):
+        names = [file[:-len('.npy')] for file in sources]
+        if not names:
+            raise ValueError(f'音色库 {self.folder} 中没有声纹文件')
+        matrix = np.stack([np.load(os.path.join(self.folder, file)).astype(np.float32).reshape(-1)
+                           for file in sources])
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        np.save(matrix_path, matrix)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'names': names, 'sources': sources}, f, indent=2, ensure_ascii=False)
+        logger.info(f'音色库索引已重建: {len(names)} 个音色')
+
+    def match(self, embedding, k=1):
+        """返回余弦相似度最高的 k 个音色 [(音色, 相似度)]，按相似度从高到低排序"""
+        query = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        query = query / max(np.linalg.norm(query), 1e-12)
+        scores = self.matrix @ query
+        k = min(k, len(self.names))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.names[i], float(scores[i])) for i in top]
+
+
+_voice_index = None
+
+
+def get_voice_index():
+    """音色库索引在进程内只加载一次"""
+    global _voice_index
+    if _voice_index is None:
+        if not os.path.exists(VOICE_TYPE_FOLDER):
+            get_available_speakers()
+        _voice_index = VoiceIndex(VOICE_TYPE_FOLDER)
+    return _voice_index
+
 def generate_speaker_to_voice_type(folder):
     speaker_to_voice_type_path = os.path.join(folder, 'speaker_to_voice_type.json')
     if os.path.exists(speaker_to_voice_type_path):
@@ -72,12 +161,7 @@ def generate_speaker_to_voice_type(folder):
     
     speaker_to_voice_type = {}
     speaker_folder = os.path.join(folder, 'SPEAKER')
-    voice_types = {}
-    if not os.path.exists('voice_type'):
-        get_available_speakers()
-    for file in os.listdir('voice_type'):
-        voice_type = file.replace('.wav', '')
-        voice_types[voice_type] = np.load(f'voice_type/{file.replace(".wav", ".npy")}')
+    voice_index = get_voice_index()
         
     for file in os.listdir(speaker_folder):
         if not file.endswith('.wav'):
@@ -87,7 +171,7 @@ def generate_speaker_to_voice_type(folder):
         embedding = generate_embedding(wav_path)
         # find the 
         np.save(wav_path.replace('.wav', '.npy'), embedding)
-        speaker_to_voice_type[speaker] = sorted(voice_types.keys(), key=lambda x: 1 - cosine(voice_types[x], embedding))[0]
+        speaker_to_voice_type[speaker] = voice_index.match(embedding)[0][0]
     for k, v in speaker_to_voice_type.items():
         new_v = v.replace('.npy', '')
         speaker_to_voice_type[k] = new_v
@@ -141,7 +225,7 @@ def get_available_speakers():
         while retry > 0:
             try:
                 tts('YouDub 是一个创新的开源工具，专注于将 YouTube 等平台的优质视频翻译和配音为中文版本。此工具融合了先进的 AI 技术，包括语音识别、大型语言模型翻译以及 AI 声音克隆技术，为中文用户提供具有原始 YouTuber 音色的中文配音视频。', output_path, None, voice_type=voice_type)
-                embedding = embedding_inference(output_path)
+                embedding = generate_embedding(output_path)
                 np.save(output_path.replace('.wav', '.npy'), embedding)
                 break
             except Exception as e:
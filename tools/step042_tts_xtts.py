@@ -1,4 +1,8 @@
+import glob
+import hashlib
 import os
+import threading
+import TTS as coqui_tts
 from TTS.api import TTS
 from loguru import logger
 import numpy as np
@@ -6,6 +10,18 @@ import torch
 import time
 from .utils import save_wav
 model = None
+# 模型版本标识，参与说话人条件向量缓存的键，换模型后旧缓存自动失效
+model_version = None
+
+# 说话人条件向量 (gpt_cond_latent, speaker_embedding) 只取决于参考音频，
+# 第一次计算后保存在 SPEAKER/<id>.wav 旁边，并在进程内缓存
+LATENT_CACHE_SUFFIX = '.xtts_latents'
+_latent_cache = {}
+_latent_lock = threading.Lock()
+# 批量合成时每次一起生成的句子数
+XTTS_BATCH_SIZE = int(os.getenv('XTTS_BATCH_SIZE', 8))
+# 流式合成时每生成多少个 GPT 编码解码一次波形（越小首块越快，解码次数越多）
+XTTS_STREAM_CHUNK_SIZE = int(os.getenv('XTTS_STREAM_CHUNK_SIZE', 20))
 
 '''
 Supported languages: Arabic: ar, Brazilian Portuguese: pt , Mandarin Chinese: zh-cn, Czech: cs, Dutch: nl, English: en, French: fr, German: de, Italian: it, Polish: pl, Russian: ru, Spanish: es, Turkish: tr, Japanese: ja, Korean: ko, Hungarian: hu, Hindi: hi
@@ -21,6 +37,7 @@ def load_model(model_path="models/TTS/XTTS-v2", device='auto'):
     if device=='auto':
         device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
           
+    global model_version
     logger.info(f'Loading TTS model from {model_path}')
     t_start = time.time()
     if os.path.isdir(model_path):
@@ -29,8 +46,12 @@ def load_model(model_path="models/TTS/XTTS-v2", device='auto'):
             model_path = model_path,
             config_path = os.path.join(model_path, 'config.json'),
         ).to(device)
+        checkpoint = os.path.join(model_path, 'model.pth')
+        stat = os.stat(checkpoint) if os.path.exists(checkpoint) else None
+        model_version = f'{coqui_tts.__version__}|{os.path.abspath(model_path)}|{stat.st_size if stat else 0}|{stat.st_mtime_ns if stat else 0}'
     else:
         model = TTS("tts_models/multilingual/multi-dataset/xtts_v2").to(device)
+        model_version = f'{coqui_tts.__version__}|tts_models/multilingual/multi-dataset/xtts_v2'
     t_end = time.time()
     logger.info(f'TTS model loaded in {t_end - t_start:.2f}s')
 
@@ -55,6 +76,180 @@ language_map = {
     'Hindi': 'hi',
     'Korean': 'ko',
 }
+def _file_hash(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def latent_cache_path(speaker_wav, xtts):
+    """缓存文件名由参考音频内容、模型版本和条件参数共同决定"""
+    config = xtts.config
+    settings = f'{model_version}|{config.gpt_cond_len}|{config.gpt_cond_chunk_len}|{config.max_ref_len}|{config.sound_norm_refs}'
+    key = hashlib.sha1(f'{_file_hash(speaker_wav)}|{settings}'.encode('utf-8')).hexdigest()[:16]
+    return f'{os.path.splitext(speaker_wav)[0]}{LATENT_CACHE_SUFFIX}.{key}.pt'
+
+
+def get_speaker_latents(speaker_wav):
+    """
+    返回参考音频的 (gpt_cond_latent, speaker_embedding)
+
+    依次查找进程内缓存、参考音频旁边的 .pt 缓存文件，都没有时才计算（读取音频、重采样、
+    计算梅尔谱、运行感知器风格编码器和说话人编码器），并写入缓存文件。
+    """
+    stat = os.stat(speaker_wav)
+    memory_key = (os.path.abspath(speaker_wav), stat.st_size, stat.st_mtime_ns, model_version)
+    with _latent_lock:
+        if memory_key in _latent_cache:
+            return _latent_cache[memory_key]
+
+        xtts = model.synthesizer.tts_model
+        cache_path = latent_cache_path(speaker_wav, xtts)
+        latents = None
+        if os.path.exists(cache_path):
+            try:
+                data = torch.load(cache_path, map_location='cpu')
+                latents = (data['gpt_cond_latent'], data['speaker_embedding'])
+            except Exception as e:
+                logger.warning(f'说话人条件向量缓存读取失败，重新计算: {cache_path} {e}')
+        if latents is None:
+            t_start = time.time()
+            config = xtts.config
+            gpt_cond_latent, speaker_embedding = xtts.get_conditioning_latents(
+                audio_path=speaker_wav,
+                gpt_cond_len=config.gpt_cond_len,
+                gpt_cond_chunk_len=config.gpt_cond_chunk_len,
+                max_ref_length=config.max_ref_len,
+                sound_norm_refs=config.sound_norm_refs,
+            )
+            latents = (gpt_cond_latent.cpu(), speaker_embedding.cpu())
+            # 参考音频变化后，旧的缓存文件不再有用
+            for stale in glob.glob(f'{glob.escape(os.path.splitext(speaker_wav)[0])}{LATENT_CACHE_SUFFIX}.*.pt'):
+                os.remove(stale)
+            torch.save({'gpt_cond_latent': latents[0], 'speaker_embedding': latents[1]}, cache_path + '.tmp')
+            os.replace(cache_path + '.tmp', cache_path)
+            logger.info(f'计算说话人条件向量 {speaker_wav}，耗时 {time.time() - t_start:.2f}s')
+        _latent_cache[memory_key] = latents
+        return latents
+
+
+def synthesize(text, speaker_wav, language, speed=1.0):
+    """使用缓存的说话人条件向量，直接调用 Xtts.inference 合成一句话；speed > 1 表示加快语速"""
+    xtts = model.synthesizer.tts_model
+    config = xtts.config
+    gpt_cond_latent, speaker_embedding = get_speaker_latents(speaker_wav)
+    out = xtts.inference(
+        text, language, gpt_cond_latent, speaker_embedding,
+        temperature=config.temperature,
+        length_penalty=config.length_penalty,
+        repetition_penalty=config.repetition_penalty,
+        top_k=config.top_k,
+        top_p=config.top_p,
+        speed=speed,
+        enable_text_splitting=True,
+    )
+    return np.array(out['wav'])
+
+
+def tts_stream(text, speaker_wav, model_name="models/TTS/XTTS-v2", device='auto', target_language='中文', speed=1.0):
+    """
+    流式合成一句话，逐块返回 24kHz 波形（numpy），不写中间文件
+
+    speed 在解码每一块之前作用于 GPT 隐变量（>1 变快），因此变速也是逐块完成的。
+    """
+    language = language_map[target_language]
+    if model is None:
+        load_model(model_name, device)
+    xtts = model.synthesizer.tts_model
+    config = xtts.config
+    gpt_cond_latent, speaker_embedding = get_speaker_latents(speaker_wav)
+    for chunk in xtts.inference_stream(
+        text, language, gpt_cond_latent, speaker_embedding,
+        stream_chunk_size=XTTS_STREAM_CHUNK_SIZE,
+        temperature=config.temperature,
+        length_penalty=config.length_penalty,
+        repetition_penalty=config.repetition_penalty,
+        top_k=config.top_k,
+        top_p=config.top_p,
+        speed=speed,
+        enable_text_splitting=True,
+    ):
+        yield chunk.cpu().numpy()
+
+
+def synthesize_batch(texts, speaker_wav, language, speeds=None):
+    """
+    同一说话人的多句话一起合成（文本左填充后批量生成 GPT 编码，再批量解码），返回与 texts 对应的波形
+
+    speeds 为每句的语速（> 1 加快），None 表示都不变速
+    """
+    xtts = model.synthesizer.tts_model
+    config = xtts.config
+    gpt_cond_latent, speaker_embedding = get_speaker_latents(speaker_wav)
+    results = xtts.inference_batch(
+        texts, language, gpt_cond_latent, speaker_embedding,
+        temperature=config.temperature,
+        length_penalty=config.length_penalty,
+        repetition_penalty=config.repetition_penalty,
+        top_k=config.top_k,
+        top_p=config.top_p,
+        speed=speeds or 1.0,
+        batch_size=XTTS_BATCH_SIZE,
+    )
+    return [np.array(result['wav']) for result in results]
+
+
+def synthesize_lines(lines, model_name="models/TTS/XTTS-v2", device='auto', target_language='中文', speeds=None):
+    """
+    批量合成多句话，返回与 lines 对应的波形，失败的句子为 None
+
+    参数:
+        lines: [(文本, 参考音频)]
+        speeds: 每句的语速（> 1 加快），None 表示都不变速
+    不同说话人分成不同的批次；超过单句长度上限的文本（需要分句）和批量失败的批次退回逐句合成。
+    """
+    language = language_map[target_language]
+    if model is None:
+        load_model(model_name, device)
+    char_limit = model.synthesizer.tts_model.tokenizer.char_limits.get(language.split('-')[0], 250)
+
+    speeds = speeds or [1.0] * len(lines)
+    wavs = [None] * len(lines)
+    groups, single = {}, []
+    for i, (text, speaker_wav) in enumerate(lines):
+        if len(text) > char_limit:
+            single.append(i)
+        else:
+            groups.setdefault(speaker_wav, []).append(i)
+
+    for speaker_wav, indices in groups.items():
+        t_start = time.time()
+        try:
+            batch = synthesize_batch([lines[i][0] for i in indices], speaker_wav, language,
+                                     [speeds[i] for i in indices])
+        except Exception as e:
+            logger.warning(f'TTS 批量合成失败，改为逐句合成: {e}')
+            single += indices
+            continue
+        for i, wav in zip(indices, batch):
+            wavs[i] = wav
+        logger.info(f'TTS 批量合成 {len(indices)} 句 ({speaker_wav})，耗时 {time.time() - t_start:.2f}s')
+
+    for i in single:
+        text, speaker_wav = lines[i]
+        for retry in range(3):
+            try:
+                wavs[i] = synthesize(text, speaker_wav, language, speeds[i])
+                logger.info(f'TTS {text}')
+                break
+            except Exception as e:
+                logger.warning(f'TTS {text} 失败')
+                logger.warning(e)
+    return wavs
+
+
 def tts(text, output_path, speaker_wav, model_name="models/TTS/XTTS-v2", device='auto', target_language='中文'):
     global model
     language = language_map[target_language]
@@ -68,8 +263,7 @@ def tts(text, output_path, speaker_wav, model_name="models/TTS/XTTS-v2", device=
     
     for retry in range(3):
         try:
-            wav = model.tts(text, speaker_wav=speaker_wav, language=language)
-            wav = np.array(wav)
+            wav = synthesize(text, speaker_wav, language)
             save_wav(wav, output_path)
             logger.info(f'TTS {text}')
             break
@@ -1,4 +1,5 @@
 import os
+import threading
 from loguru import logger
 import numpy as np
 import torch
@@ -12,6 +13,10 @@ from cosyvoice.utils.file_utils import load_wav
 import torchaudio
 from modelscope import snapshot_download
 model = None
+session = None
+# CosyVoice-300M 输出采样率；流水线时间线的采样率
+COSYVOICE_SAMPLE_RATE = 22050
+TIMELINE_SAMPLE_RATE = 24000
 
 def download_cosyvoice():
     snapshot_download('iic/CosyVoice-300M', local_dir='models/TTS/CosyVoice-300M')
@@ -43,6 +48,63 @@ language_map = {
     'Korean': 'ko'
 }
 
+class CosyVoiceSession:
+    """
+    常驻的 CosyVoice 合成会话
+
+    每个参考音频的提示特征（语音 token、说话人向量、梅尔特征）只提取一次并缓存，之后每句只做
+    文本编码和模型前向；输出在内存中重采样到时间线采样率，直接返回 numpy 数组。
+    """
+
+    def __init__(self, cosyvoice, sample_rate=TIMELINE_SAMPLE_RATE):
+        self.cosyvoice = cosyvoice
+        self.sample_rate = sample_rate
+        self.resample = torchaudio.transforms.Resample(COSYVOICE_SAMPLE_RATE, sample_rate)
+        self.prompts = {}
+        self.lock = threading.Lock()
+
+    def prompt_features(self, speaker_wav):
+        """跨语种模式下与文本无关的模型输入，按参考音频路径、大小和修改时间缓存"""
+        stat = os.stat(speaker_wav)
+        key = (os.path.abspath(speaker_wav), stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            if key not in self.prompts:
+                t_start = time.time()
+                prompt_speech_16k = load_wav(speaker_wav, 16000)
+                features = self.cosyvoice.frontend.frontend_cross_lingual('', prompt_speech_16k)
+                del features['text'], features['text_len']
+                self.prompts[key] = features
+                logger.info(f'提取 CosyVoice 提示特征 {speaker_wav}，耗时 {time.time() - t_start:.2f}s')
+            return self.prompts[key]
+
+    def synthesize(self, text, speaker_wav, target_language='中文'):
+        """合成一句话，返回时间线采样率的单声道波形"""
+        frontend = self.cosyvoice.frontend
+        prompt = self.prompt_features(speaker_wav)
+        speeches = []
+        with torch.inference_mode():
+            for segment in frontend.text_normalize(f'<|{language_map[target_language]}|>{text}', split=True):
+                text_token, text_token_len = frontend._extract_text_token(segment)
+                output = self.cosyvoice.model.inference(text=text_token, text_len=text_token_len, **prompt)
+                speeches.append(output['tts_speech'].cpu())
+            speech = self.resample(torch.concat(speeches, dim=1))
+        return speech[0].numpy()
+
+
+def get_session(model_name="models/TTS/CosyVoice-300M", device='auto'):
+    global session
+    if session is None:
+        if model is None:
+            load_model(model_name, device)
+        session = CosyVoiceSession(model)
+    return session
+
+
+def synthesize(text, speaker_wav, model_name="models/TTS/CosyVoice-300M", device='auto', target_language='中文'):
+    """不写文件，直接返回 24kHz 波形（numpy）"""
+    return get_session(model_name, device).synthesize(text, speaker_wav, target_language)
+
+
 def tts(text, output_path, speaker_wav, model_name="models/TTS/CosyVoice-300M", device='auto', target_language='中文'):
     global model
     
@@ -50,14 +112,10 @@ def tts(text, output_path, speaker_wav, model_name="models/TTS/CosyVoice-300M",
         logger.info(f'TTS {text} 已存在')
         return
     
-    if model is None:
-        load_model(model_name, device)
-    
     for retry in range(3):
         try:
-            prompt_speech_16k = load_wav(speaker_wav, 16000)
-            output = model.inference_cross_lingual(f'<|{language_map[target_language]}|>{text}', prompt_speech_16k)
-            torchaudio.save(output_path, output['tts_speech'], 22050)
+            wav = synthesize(text, speaker_wav, model_name, device, target_language)
+            save_wav(wav, output_path)
 
             logger.info(f'TTS {text}')
             break
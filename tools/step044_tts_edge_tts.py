@@ -1,3 +1,4 @@
+import asyncio
 import os
 from loguru import logger
 import numpy as np
@@ -9,6 +10,8 @@ import sys
 import torchaudio
 model = None
 
+# 同时进行的 Edge-TTS 请求数
+EDGE_TTS_CONCURRENCY = int(os.getenv('EDGE_TTS_CONCURRENCY', 8))
 
 
 #  <|zh|><|en|><|jp|><|yue|><|ko|> for Chinese/English/Japanese/Cantonese/Korean
@@ -20,18 +23,93 @@ language_map = {
     'Korean': 'ko-KR-SunHiNeural'
 }
 
+
+def mp3_path(output_path):
+    """Edge-TTS 输出 MP3，写在 output_path 同名的 .mp3 文件中"""
+    return output_path.replace('.wav', '.mp3')
+
+
+class EdgeTTSClient:
+    """
+    进程内的异步 Edge-TTS 客户端
+
+    所有句子在同一个事件循环中合成，最多 concurrency 个请求同时进行；音频在内存中收齐后一次性写入 MP3，
+    每句失败会按指数退避重试，最终的异常逐句返回给调用方。
+    wss_url 用于指向本地的模拟服务（见 scripts/mock_edge_tts_server.py），会替换 edge_tts 的全局服务地址。
+    """
+
+    def __init__(self, concurrency=EDGE_TTS_CONCURRENCY, retries=3, retry_delay=0.5, wss_url=None):
+        import edge_tts
+        self.edge_tts = edge_tts
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        if wss_url:
+            edge_tts.communicate.WSS_URL = wss_url
+
+    async def synthesize(self, text, voice, rate='+0%'):
+        """返回一句话的 MP3 字节；rate 为语速调整，例如 '+20%'"""
+        communicate = self.edge_tts.Communicate(text, voice, rate=rate)
+        audio = bytearray()
+        async for chunk in communicate.stream():
+            if chunk['type'] == 'audio':
+                audio += chunk['data']
+        if not audio:
+            raise RuntimeError('Edge-TTS 没有返回音频')
+        return bytes(audio)
+
+    async def _save(self, semaphore, text, output_path, voice, rate='+0%'):
+        error = None
+        for retry in range(self.retries):
+            try:
+                async with semaphore:
+                    audio = await self.synthesize(text, voice, rate)
+                with open(output_path + '.tmp', 'wb') as f:
+                    f.write(audio)
+                os.replace(output_path + '.tmp', output_path)
+                logger.info(f'TTS {text}')
+                return None
+            except Exception as e:
+                error = e
+                logger.warning(f'TTS {text} 失败 ({retry + 1}/{self.retries}): {e!r}')
+                if retry < self.retries - 1:
+                    await asyncio.sleep(self.retry_delay * 2 ** retry)
+        return error
+
+    async def save_all(self, jobs):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*[self._save(semaphore, *job) for job in jobs])
+
+    def run(self, jobs):
+        """
+        合成一批句子
+
+        参数:
+            jobs: [(文本, MP3 输出路径, 音色)] 或 [(文本, MP3 输出路径, 音色, 语速)]
+        返回:
+            与 jobs 对应的列表，成功为 None，失败为最后一次的异常
+        """
+        if not jobs:
+            return []
+        t_start = time.time()
+        errors = asyncio.run(self.save_all(jobs))
+        failed = sum(error is not None for error in errors)
+        logger.info(f'Edge-TTS 合成 {len(jobs)} 句（失败 {failed} 句），耗时 {time.time() - t_start:.2f}s')
+        return errors
+
+
+def speed_to_rate(speed):
+    """语速倍数转换为 Edge-TTS 的 rate 参数，例如 1.2 -> '+20%'"""
+    return f'{round((speed - 1) * 100):+d}%'
+
+
 def tts(text, output_path, target_language='中文', voice = 'zh-CN-XiaoxiaoNeural'):
-    if os.path.exists(output_path):
+    """合成一句话，返回是否成功"""
+    if os.path.exists(output_path) or os.path.exists(mp3_path(output_path)):
         logger.info(f'TTS {text} 已存在')
-        return
-    for retry in range(3):
-        try:
-            os.system(f'edge-tts --text "{text}" --write-media "{output_path.replace(".wav", ".mp3")}" --voice {voice}')
-            logger.info(f'TTS {text}')
-            break
-        except Exception as e:
-            logger.warning(f'TTS {text} 失败')
-            logger.warning(e)
+        return True
+    error = EdgeTTSClient(concurrency=1).run([(text, mp3_path(output_path), voice)])[0]
+    return error is None
 
 
 if __name__ == '__main__':
@@ -39,4 +117,3 @@ if __name__ == '__main__':
     while True:
         text = input('请输入：')
         tts(text, f'playground/{text}.wav', target_language='中文')
-        
@@ -1,16 +1,37 @@
+import hashlib
+import io
+import json
 import os
+import struct
+import numpy as np
 import requests
 from loguru import logger
 from pydub import AudioSegment
 
 # 您的 cinecast 本地 API 地址
-CINECAST_API_URL = "http://localhost:8888"
+CINECAST_API_URL = os.getenv('CINECAST_API_URL', "http://localhost:8888")
+# 批量接口每个任务提交的句子数
+CINECAST_BATCH_SIZE = int(os.getenv('CINECAST_BATCH_SIZE', 32))
+
+# 批量接口返回的每一帧：帧头（句子序号, 采样率, 状态 0 为成功, 负载字节数）+ 负载
+# 成功时负载为单声道 16 位小端 PCM，失败时为 UTF-8 错误信息
+FRAME_HEADER = struct.Struct('<IIiI')
+# 错误帧状态：引用的参考音频句柄服务端不认识（服务端缓存被清理或重启）
+STATUS_UNKNOWN_REFERENCE = 3
+# 合并相邻参考窗口后的最大时长（秒），太长的参考音频会冲淡单句的情绪
+CINECAST_REFERENCE_MAX_SECONDS = float(os.getenv('CINECAST_REFERENCE_MAX_SECONDS', 10))
 
 def get_padded_reference_audio(audio_segment, start_sec, end_sec, min_duration=4.0):
     """
     智能切片：提取带有情绪的参考音频。
     如果片段太短（<4秒），则向前后扩展上下文，以保证 Qwen3-TTS 提取到稳定的情绪特征。
     """
+    start_ms, end_ms = padded_window_ms(start_sec, end_sec, len(audio_segment), min_duration)
+    return audio_segment[start_ms:end_ms]
+
+
+def padded_window_ms(start_sec, end_sec, total_ms, min_duration=4.0):
+    """参考窗口的 (起始毫秒, 结束毫秒)：短于 min_duration 时向前后平均扩展"""
     start_ms = int(start_sec * 1000)
     end_ms = int(end_sec * 1000)
     duration_ms = end_ms - start_ms
@@ -20,9 +41,35 @@ def get_padded_reference_audio(audio_segment, start_sec, end_sec, min_duration=4
         # 计算需要补充的毫秒数，平均分摊到前后
         pad_ms = (min_duration_ms - duration_ms) // 2
         start_ms = max(0, start_ms - pad_ms)
-        end_ms = min(len(audio_segment), end_ms + pad_ms)
-        
-    return audio_segment[start_ms:end_ms]
+        end_ms = min(total_ms, end_ms + pad_ms)
+    return start_ms, end_ms
+
+
+def plan_reference_windows(lines, total_ms, min_duration=4.0, max_duration=CINECAST_REFERENCE_MAX_SECONDS):
+    """
+    规划参考窗口：同一说话人重叠或相接的补齐窗口合并为一个（合并后不超过 max_duration 秒）
+
+    参数:
+        lines: [{'start', 'end', 'speaker'(可选)}]
+    返回:
+        (windows, assignment)：windows 为 [(起始毫秒, 结束毫秒)]，assignment[i] 为第 i 句使用的窗口下标
+    """
+    max_ms = int(max_duration * 1000)
+    padded = [padded_window_ms(line['start'], line['end'], total_ms, min_duration) for line in lines]
+    order = sorted(range(len(lines)), key=lambda i: (str(lines[i].get('speaker')), padded[i]))
+    windows, assignment = [], [None] * len(lines)
+    current_speaker = None
+    for i in order:
+        start_ms, end_ms = padded[i]
+        speaker = lines[i].get('speaker')
+        if windows and speaker == current_speaker and start_ms <= windows[-1][1] \
+                and max(end_ms, windows[-1][1]) - windows[-1][0] <= max_ms:
+            windows[-1] = (windows[-1][0], max(end_ms, windows[-1][1]))
+        else:
+            windows.append((start_ms, end_ms))
+            current_speaker = speaker
+        assignment[i] = len(windows) - 1
+    return windows, assignment
 
 def generate_tts_with_emotion_clone(text, start_time, end_time, vocal_audio_path, output_audio_path, emotion_voice="aiden"):
     """
@@ -121,4 +168,193 @@ def generate_tts_cinecast(text, output_path, voice_id="aiden"):
         return True
     except Exception as e:
         logger.error(f"[Cinecast TTS] API 调用失败: {e}")
-        return False
\ No newline at end of file
+        return False
+
+
+class CinecastBatchError(RuntimeError):
+    """批量任务中单句合成失败，status 为错误帧的状态"""
+
+    def __init__(self, message, status=1):
+        super().__init__(message)
+        self.status = status
+
+
+def iter_frames(chunks):
+    """从响应字节流中逐帧解析出 (句子序号, 采样率, 状态, 负载)"""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= FRAME_HEADER.size:
+            index, sample_rate, status, size = FRAME_HEADER.unpack_from(buffer)
+            if len(buffer) < FRAME_HEADER.size + size:
+                break
+            payload = bytes(buffer[FRAME_HEADER.size:FRAME_HEADER.size + size])
+            del buffer[:FRAME_HEADER.size + size]
+            yield index, sample_rate, status, payload
+    if buffer:
+        raise ConnectionError(f'Cinecast 批量响应在帧中间断开（剩余 {len(buffer)} 字节）')
+
+
+class CinecastBatchClient:
+    """
+    Cinecast 批量合成客户端
+
+    一个任务（POST /v1/audio/speech/batch，multipart）包含多句 (文本, 音色, 参考音频)：
+    - job 字段为 JSON: {"model", "response_format": "pcm_s16le", "lines": [{"id", "input", "voice", ...}]}
+      每句用 "reference_id" 引用服务端已缓存的参考音频，或用 "reference" 引用本任务上传的文件字段
+    - 参考音频先按说话人合并重叠窗口（plan_reference_windows），相同内容只出现一次；服务端支持时按
+      内容哈希注册（GET /v1/audio/references/<sha256> 查询，POST /v1/audio/references 上传），
+      服务端只提取一次特征，之后的任务只传句柄
+    服务端按完成顺序流式返回每句一帧（见 FRAME_HEADER），客户端在内存中解码为 float32 波形，
+    不再经过 MP3 编码、临时文件和 pydub 转码。
+    """
+
+    def __init__(self, base_url=CINECAST_API_URL, batch_size=CINECAST_BATCH_SIZE, timeout=600):
+        self.base_url = base_url
+        self.url = f"{base_url}/v1/audio/speech/batch"
+        self.batch_size = max(1, batch_size)
+        self.timeout = timeout
+        self.session = requests.Session()
+        # 参考音频内容哈希 -> 服务端句柄
+        self.handles = {}
+        # 服务端不支持参考音频缓存时，改为在每个任务中内联上传（仍然去重）
+        self.reference_cache_supported = True
+
+    def reference_windows(self, lines, vocal_audio_path):
+        """
+        从人声音轨中截取合并后的参考窗口，人声音轨只读取一次
+
+        返回 (去重后的 WAV 字节列表, 每句对应的下标)
+        """
+        full_vocal = AudioSegment.from_wav(vocal_audio_path)
+        windows, assignment = plan_reference_windows(lines, len(full_vocal))
+        blobs = []
+        for start_ms, end_ms in windows:
+            buffer = io.BytesIO()
+            full_vocal[start_ms:end_ms].export(buffer, format='wav')
+            blobs.append(buffer.getvalue())
+        # 不同窗口也可能截出完全相同的内容（例如都被裁到音轨边界）
+        unique, index, windows_unique = [], {}, []
+        for blob in blobs:
+            digest = hashlib.sha256(blob).hexdigest()
+            if digest not in index:
+                index[digest] = len(unique)
+                unique.append(blob)
+            windows_unique.append(index[digest])
+        logger.info(f"[情绪配音] 参考窗口: {len(lines)} 句 -> {len(unique)} 个")
+        return unique, [windows_unique[window] for window in assignment]
+
+    def register_references(self, blobs):
+        """
+        按内容哈希在服务端注册参考音频，返回与 blobs 对应的句柄；服务端不支持时返回 None
+        """
+        if not self.reference_cache_supported:
+            return None
+        handles, uploaded = [], 0
+        for blob in blobs:
+            digest = hashlib.sha256(blob).hexdigest()
+            if digest not in self.handles:
+                url = f"{self.base_url}/v1/audio/references"
+                response = self.session.get(f"{url}/{digest}", timeout=self.timeout)
+                if response.status_code == 404:
+                    response = self.session.post(url, data={'sha256': digest},
+                                                 files={'audio': ('ref.wav', blob, 'audio/wav')}, timeout=self.timeout)
+                    uploaded += len(blob)
+                if response.status_code in (404, 405):
+                    logger.warning('Cinecast 服务端不支持参考音频缓存，改为随任务上传')
+                    self.reference_cache_supported = False
+                    return None
+                response.raise_for_status()
+                self.handles[digest] = response.json()['id']
+            handles.append(self.handles[digest])
+        if uploaded:
+            logger.info(f"[情绪配音] 新注册参考音频 {uploaded / 1024:.0f} KB")
+        return handles
+
+    def forget_references(self, blobs):
+        """丢弃这些参考音频的缓存句柄，下次使用时重新查询或上传"""
+        for blob in blobs:
+            self.handles.pop(hashlib.sha256(blob).hexdigest(), None)
+
+    def submit(self, lines, references=None, assignment=None):
+        """
+        提交一个任务，按返回顺序逐句产出 (下标, 波形 或 异常, 采样率)
+
+        lines: [{'text', 'voice'}]；references: 去重后的参考 WAV 字节；assignment: 每句使用的参考下标，
+        为 None 时不克隆
+        """
+        handles = self.register_references(references) if references else None
+        job = {'model': 'qwen3-tts', 'response_format': 'pcm_s16le', 'lines': []}
+        files = {}
+        for i, line in enumerate(lines):
+            entry = {'id': i, 'input': str(line['text']), 'voice': str(line.get('voice') or 'aiden')}
+            if assignment is not None:
+                k = assignment[i]
+                if handles is not None:
+                    entry['reference_id'] = handles[k]
+                else:
+                    entry['reference'] = f'ref{k}'
+                    files[f'ref{k}'] = (f'ref{k}.wav', references[k], 'audio/wav')
+            job['lines'].append(entry)
+        response = self.session.post(self.url, data={'job': json.dumps(job, ensure_ascii=False)},
+                                     files=files or {'dummy': ('', '')}, stream=True, timeout=self.timeout)
+        with response:
+            if response.status_code != 200:
+                logger.error(f"❌ 详细的API拒绝原因: {response.text}")
+            response.raise_for_status()
+            received = set()
+            for index, sample_rate, status, payload in iter_frames(response.iter_content(chunk_size=1 << 16)):
+                received.add(index)
+                if status == 0:
+                    wav = np.frombuffer(payload, dtype='<i2').astype(np.float32) / 32768
+                    yield index, wav, sample_rate
+                else:
+                    yield index, CinecastBatchError(payload.decode('utf-8', errors='replace'), status), sample_rate
+        for index in range(len(lines)):
+            if index not in received:
+                yield index, CinecastBatchError('服务端没有返回这一句'), 0
+
+    def submit_batch(self, lines, references=None, assignment=None):
+        """提交一个任务并收齐结果，返回与 lines 对应的 [(波形, 采样率) 或 异常]"""
+        results = [None] * len(lines)
+        try:
+            for index, wav, sample_rate in self.submit(lines, references, assignment):
+                results[index] = wav if isinstance(wav, Exception) else (wav, sample_rate)
+        except Exception as e:
+            logger.error(f"❌ [情绪配音] 批量任务失败: {e}")
+            results = [e if result is None else result for result in results]
+        return results
+
+    def synthesize(self, lines, vocal_audio_path=None):
+        """
+        批量合成多句话
+
+        lines: [{'text', 'start', 'end', 'voice', 'speaker'(可选)}]，vocal_audio_path 为空时不做情绪克隆
+        返回与 lines 对应的 [(波形, 采样率) 或 异常]
+        """
+        references, assignment = self.reference_windows(lines, vocal_audio_path) if vocal_audio_path else (None, None)
+        results = [None] * len(lines)
+        for start in range(0, len(lines), self.batch_size):
+            batch = lines[start:start + self.batch_size]
+            batch_references, batch_assignment = None, None
+            if assignment is not None:
+                # 只带上这一批用到的参考音频
+                used = sorted(set(assignment[start:start + len(batch)]))
+                batch_references = [references[k] for k in used]
+                batch_assignment = [used.index(k) for k in assignment[start:start + len(batch)]]
+            batch_results = self.submit_batch(batch, batch_references, batch_assignment)
+            stale = [i for i, result in enumerate(batch_results)
+                     if isinstance(result, CinecastBatchError) and result.status == STATUS_UNKNOWN_REFERENCE]
+            if stale and batch_references:
+                # 服务端缓存已失效：丢掉旧句柄重新注册，受影响的句子只重试一次
+                logger.warning(f"[情绪配音] {len(stale)} 句的参考音频句柄已失效，重新注册后重试")
+                used = sorted(set(batch_assignment[i] for i in stale))
+                self.forget_references([batch_references[k] for k in used])
+                retried = self.submit_batch([batch[i] for i in stale], [batch_references[k] for k in used],
+                                            [used.index(batch_assignment[i]) for i in stale])
+                for i, result in zip(stale, retried):
+                    batch_results[i] = result
+            results[start:start + len(batch)] = batch_results
+        failed = sum(isinstance(result, Exception) for result in results)
+        logger.info(f"✅ [情绪配音] 批量合成 {len(lines)} 句，失败 {failed} 句")
+        return results
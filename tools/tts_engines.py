@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+TTS 引擎接口与注册表
+
+每个引擎声明原生采样率、每批句子数、同时进行的批数和支持的语言，并实现
+synthesize_batch(lines, target_language) -> [波形]（以及可选的异步版本和流式合成）。
+synthesize_lines 按这些参数切批、并发调度，并把结果统一重采样到时间线采样率；
+新增引擎只需继承 TTSEngine 并用 @register_engine 注册，就能直接用于 step040。
+
+一句话（line）是一个 dict：text, output_path, speaker_wav, start, end, vocal_path, voice，
+以及可选的 speed（语速，> 1 加快，只对 speed_control 的引擎生效）。
+各引擎的依赖在第一次合成时才导入，未安装的引擎不影响其他引擎。
+"""
+import asyncio
+import os
+
+import librosa
+from loguru import logger
+
+# 配音时间线的采样率
+TIMELINE_SAMPLE_RATE = 24000
+
+TTS_ENGINES = {}
+_instances = {}
+
+
+def register_engine(cls):
+    TTS_ENGINES[cls.name] = cls
+    return cls
+
+
+def get_engine(name):
+    """返回（进程内共享的）引擎实例"""
+    if name not in TTS_ENGINES:
+        raise ValueError(f'不支持的 TTS 方法 {name}，可选: {list(TTS_ENGINES)}')
+    if name not in _instances:
+        _instances[name] = TTS_ENGINES[name]()
+    return _instances[name]
+
+
+class TTSEngine:
+    """
+    TTS 引擎基类
+
+    子类至少实现 synthesize（单句）或 synthesize_batch（多句），返回原生采样率的单声道 numpy 波形。
+    """
+    name = None
+    # 原生采样率
+    sample_rate = TIMELINE_SAMPLE_RATE
+    # 每次 synthesize_batch 的最大句子数，以及最多同时进行的批数
+    max_batch_size = 1
+    max_concurrency = 1
+    # 支持的目标语言，空列表表示不限制
+    languages = []
+    # 是否支持 synthesize_stream（边生成边写入时间线）
+    streaming = False
+    # 是否能在合成时直接按 line['speed'] 变速
+    speed_control = False
+    # 逐句合成时的重试次数
+    retries = 3
+
+    def supports(self, language):
+        return not self.languages or language in self.languages
+
+    def batch_key(self, line):
+        """只有 batch_key 相同的句子才会放进同一批，例如同一说话人"""
+        return None
+
+    def voice_key(self, line):
+        """语速模型按音色统计，同一音色的句子语速相近"""
+        return line.get('voice') or ''
+
+    def synthesize(self, line, target_language):
+        raise NotImplementedError
+
+    def synthesize_batch(self, lines, target_language):
+        """默认逐句合成，单句失败（重试后）记为 None，不影响同批的其他句子"""
+        wavs = []
+        for line in lines:
+            wav = None
+            for retry in range(self.retries):
+                try:
+                    wav = self.synthesize(line, target_language)
+                    logger.info(f'TTS {line["text"]}')
+                    break
+                except Exception as e:
+                    logger.warning(f'TTS {line["text"]} 失败 ({retry + 1}/{self.retries}): {e}')
+            wavs.append(wav)
+        return wavs
+
+    async def synthesize_batch_async(self, lines, target_language):
+        """默认在线程池中运行同步版本，网络引擎可以覆盖为原生协程"""
+        return await asyncio.to_thread(self.synthesize_batch, lines, target_language)
+
+    def synthesize_stream(self, line, target_language, speed=1.0):
+        """逐块返回原生采样率的波形；speed > 1 表示加快语速"""
+        raise NotImplementedError
+
+
+def make_batches(engine, lines):
+    """按 batch_key 分组（组内保持原顺序），再按 max_batch_size 切分，返回 [[下标]]"""
+    groups = {}
+    for i, line in enumerate(lines):
+        groups.setdefault(engine.batch_key(line), []).append(i)
+    size = max(1, engine.max_batch_size)
+    return [indices[i:i + size] for indices in groups.values() for i in range(0, len(indices), size)]
+
+
+def synthesize_lines(engine, lines, target_language):
+    """
+    用 engine 合成多句话
+
+    最多 engine.max_concurrency 批同时进行；返回与 lines 对应的时间线采样率波形，失败的句子为 None。
+    """
+    batches = make_batches(engine, lines)
+
+    async def run():
+        semaphore = asyncio.Semaphore(max(1, engine.max_concurrency))
+
+        async def run_batch(indices):
+            async with semaphore:
+                try:
+                    return await engine.synthesize_batch_async([lines[i] for i in indices], target_language)
+                except Exception as e:
+                    logger.warning(f'{engine.name} 批量合成 {len(indices)} 句失败: {e}')
+                    return [None] * len(indices)
+
+        return await asyncio.gather(*[run_batch(indices) for indices in batches])
+
+    wavs = [None] * len(lines)
+    if not batches:
+        return wavs
+    logger.info(f'{engine.name}: {len(lines)} 句分为 {len(batches)} 批，最多 {engine.max_concurrency} 批并发')
+    for indices, results in zip(batches, asyncio.run(run())):
+        for i, wav in zip(indices, results):
+            wavs[i] = to_timeline_rate(wav, engine.sample_rate)
+    return wavs
+
+
+def to_timeline_rate(wav, sample_rate):
+    if wav is None or sample_rate == TIMELINE_SAMPLE_RATE:
+        return wav
+    return librosa.resample(wav, orig_sr=sample_rate, target_sr=TIMELINE_SAMPLE_RATE)
+
+
+@register_engine
+class XTTSEngine(TTSEngine):
+    name = 'xtts'
+    languages = ['中文', 'English', 'Japanese', 'Korean', 'French', 'Polish', 'Spanish']
+    # 边生成边写入配音时间线，不再生成逐句的中间文件（1 为开启）
+    streaming = bool(int(os.getenv('XTTS_STREAMING', 1)))
+    speed_control = True
+
+    @property
+    def max_batch_size(self):
+        from .step042_tts_xtts import XTTS_BATCH_SIZE
+        return XTTS_BATCH_SIZE
+
+    def batch_key(self, line):
+        return line['speaker_wav']
+
+    def voice_key(self, line):
+        return os.path.abspath(line['speaker_wav'])
+
+    def synthesize_batch(self, lines, target_language):
+        from .step042_tts_xtts import synthesize_lines as xtts_synthesize_lines
+        return xtts_synthesize_lines([(line['text'], line['speaker_wav']) for line in lines],
+                                     target_language=target_language,
+                                     speeds=[line.get('speed', 1.0) for line in lines])
+
+    def synthesize_stream(self, line, target_language, speed=1.0):
+        from .step042_tts_xtts import tts_stream
+        return tts_stream(line['text'], line['speaker_wav'], target_language=target_language, speed=speed)
+
+
+@register_engine
+class CosyVoiceEngine(TTSEngine):
+    name = 'cosyvoice'
+    languages = ['中文', '粤语', 'English', 'Japanese', 'Korean', 'French']
+
+    def voice_key(self, line):
+        return os.path.abspath(line['speaker_wav'])
+
+    def synthesize(self, line, target_language):
+        from .step043_tts_cosyvoice import synthesize
+        return synthesize(line['text'], line['speaker_wav'], target_language=target_language)
+
+
+@register_engine
+class EdgeTTSEngine(TTSEngine):
+    name = 'EdgeTTS'
+    languages = ['中文', 'English', 'Japanese', 'Korean', 'French', 'Polish', 'Spanish']
+    speed_control = True
+
+    def __init__(self):
+        from .step044_tts_edge_tts import EDGE_TTS_CONCURRENCY
+        self.max_concurrency = EDGE_TTS_CONCURRENCY
+        self.client = None
+
+    async def synthesize_batch_async(self, lines, target_language):
+        """在调度器的事件循环中直接发起请求，MP3 写在 output_path 旁边，解码后返回"""
+        from .step044_tts_edge_tts import EdgeTTSClient, mp3_path, speed_to_rate
+        if self.client is None:
+            self.client = EdgeTTSClient(concurrency=self.max_concurrency)
+        jobs = [(line['text'], mp3_path(line['output_path']), line['voice'], speed_to_rate(line.get('speed', 1.0)))
+                for line in lines]
+        missing = [job for job in jobs if not os.path.exists(job[1])]
+        errors = dict(zip([job[1] for job in missing], await self.client.save_all(missing)))
+        wavs = []
+        for _, path, _, _ in jobs:
+            if errors.get(path) is not None:
+                wavs.append(None)
+            else:
+                wav, _ = await asyncio.to_thread(librosa.load, path, sr=self.sample_rate)
+                wavs.append(wav)
+        return wavs
+
+    def synthesize_batch(self, lines, target_language):
+        return asyncio.run(self.synthesize_batch_async(lines, target_language))
+
+
+@register_engine
+class CinecastEngine(TTSEngine):
+    name = 'Cinecast'
+    retries = 1
+
+    def __init__(self):
+        from .step045_tts_cinecast import CINECAST_BATCH_SIZE
+        self.max_batch_size = CINECAST_BATCH_SIZE
+        self.client = None
+        # 服务端没有批量接口时退回逐句请求
+        self.batch_supported = True
+
+    def voice_key(self, line):
+        return 'aiden'
+
+    def batch_key(self, line):
+        return line['vocal_path']
+
+    def synthesize_batch(self, lines, target_language):
+        """优先使用批量接口（PCM 帧流式返回，不经过 MP3 和临时文件），失败的句子为 None"""
+        if not self.batch_supported:
+            return super().synthesize_batch(lines, target_language)
+        import requests
+        from .step045_tts_cinecast import CinecastBatchClient
+        if self.client is None:
+            self.client = CinecastBatchClient()
+        results = self.client.synthesize([{'text': line['text'], 'start': line['start'], 'end': line['end'],
+                                           'speaker': line['speaker_wav'], 'voice': 'aiden'}  # 默认音色
+                                          for line in lines],
+                                         vocal_audio_path=lines[0]['vocal_path'])
+        if all(isinstance(result, requests.HTTPError) and result.response is not None
+               and result.response.status_code in (404, 405) for result in results):
+            logger.warning('Cinecast 服务端不支持批量接口，改为逐句请求')
+            self.batch_supported = False
+            return super().synthesize_batch(lines, target_language)
+        return [None if isinstance(result, Exception) else to_timeline_rate(*result) for result in results]
+
+    def synthesize(self, line, target_language):
+        from .step045_tts_cinecast import generate_tts_with_emotion_clone
+        success = generate_tts_with_emotion_clone(
+            text=line['text'],
+            start_time=line['start'],
+            end_time=line['end'],
+            vocal_audio_path=line['vocal_path'],
+            output_audio_path=line['output_path'],
+            emotion_voice='aiden',  # 默认音色
+        )
+        if not success:
+            raise RuntimeError(f'Cinecast配音失败: {line["text"]}')
+        wav, _ = librosa.load(line['output_path'], sr=self.sample_rate)
+        return wav
+
+
+@register_engine
+class BytedanceEngine(TTSEngine):
+    name = 'bytedance'
+    max_concurrency = 4
+    retries = 1
+
+    def voice_key(self, line):
+        return os.path.abspath(line['speaker_wav'])
+
+    def synthesize(self, line, target_language):
+        from .step041_tts_bytedance import tts as bytedance_tts
+        bytedance_tts(line['text'], line['output_path'], line['speaker_wav'])
+        if not os.path.exists(line['output_path']):
+            raise RuntimeError(f'火山TTS 合成失败: {line["text"]}')
+        wav, _ = librosa.load(line['output_path'], sr=self.sample_rate)
+        return wav
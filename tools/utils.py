@@ -1,7 +1,6 @@
 import re
 import string
 import numpy as np
-from scipy.io import wavfile
 
 def sanitize_filename(filename: str) -> str:
     # Define a set of valid characters
@@ -17,15 +16,18 @@ def sanitize_filename(filename: str) -> str:
 
 
 def save_wav(wav: np.ndarray, output_path: str, sample_rate=24000):
+    from scipy.io import wavfile  # 延迟导入，界面启动时只需要 SUPPORT_VOICE
     # wav_norm = wav * (32767 / max(0.01, np.max(np.abs(wav))))
     wav_norm = wav * 32767
     wavfile.write(output_path, sample_rate, wav_norm.astype(np.int16))
 
 def save_wav_norm(wav: np.ndarray, output_path: str, sample_rate=24000):
+    from scipy.io import wavfile
     wav_norm = wav * (32767 / max(0.01, np.max(np.abs(wav))))
     wavfile.write(output_path, sample_rate, wav_norm.astype(np.int16))
     
 def normalize_wav(wav_path: str) -> None:
+    from scipy.io import wavfile
     sample_rate, wav = wavfile.read(wav_path)
     wav_norm = wav * (32767 / max(0.01, np.max(np.abs(wav))))
     wavfile.write(wav_path, sample_rate, wav_norm.astype(np.int16))
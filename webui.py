@@ -1,13 +1,16 @@
 import gradio as gr
-from tools.step000_video_downloader import download_from_url
-from tools.step010_demucs_vr import separate_all_audio_under_folder
-from tools.step020_asr import transcribe_all_audio_under_folder
-from tools.step030_translation import translate_all_transcript_under_folder
-from tools.step040_tts import generate_all_wavs_under_folder
-from tools.step050_synthesize_video import synthesize_all_video_under_folder
-from tools.do_everything import do_everything
+from tools.lazy import lazy_function
 from tools.utils import SUPPORT_VOICE
 
+# 各步骤的功能模块在第一次调用时才导入，界面启动时不加载 torch、whisperx 等重依赖
+download_from_url = lazy_function('tools.step000_video_downloader', 'download_from_url')
+separate_all_audio_under_folder = lazy_function('tools.step010_demucs_vr', 'separate_all_audio_under_folder')
+transcribe_all_audio_under_folder = lazy_function('tools.step020_asr', 'transcribe_all_audio_under_folder')
+translate_all_transcript_under_folder = lazy_function('tools.step030_translation', 'translate_all_transcript_under_folder')
+generate_all_wavs_under_folder = lazy_function('tools.step040_tts', 'generate_all_wavs_under_folder')
+synthesize_all_video_under_folder = lazy_function('tools.step050_synthesize_video', 'synthesize_all_video_under_folder')
+do_everything = lazy_function('tools.do_everything', 'do_everything')
+
 # 一键自动化界面
 full_auto_interface = gr.Interface(
     fn=do_everything,